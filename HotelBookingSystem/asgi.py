@@ -12,5 +12,14 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'HotelBookingSystem.settings')
+# Persistent connections leak under ASGI (sync ORM calls run on executor threads)
+os.environ.setdefault('DJANGO_CONN_MAX_AGE', '0')
+# Routes the search pages to their async views (settings.ASGI_URLCONF)
+os.environ.setdefault('DJANGO_ASGI', '1')
 
 application = get_asgi_application()
+
+# Sweeps expired booking holds in this process when BOOKING_HOLD_SWEEP_INTERVAL is set
+from hotel import holds  # noqa: E402
+
+holds.start_scheduler()
@@ -0,0 +1,16 @@
+"""
+URL configuration used under ASGI (settings.ASGI_URLCONF).
+
+The same routes as HotelBookingSystem.urls, with the hotel app's
+async_urlpatterns: home, room list and room detail are native async views.
+"""
+from django.urls import include, path
+
+from hotel import urls as hotel_urls
+
+from . import urls
+
+urlpatterns = [
+    path('', include(hotel_urls.async_urlpatterns)) if getattr(pattern, 'urlconf_name', None) is hotel_urls else pattern
+    for pattern in urls.urlpatterns
+]
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -43,7 +44,9 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'hotel.performance.PerformanceMiddleware',  # inactive unless PERFORMANCE_METRICS is True
     'django.middleware.security.SecurityMiddleware',
+    'hotel.routers.ReplicaRoutingMiddleware',  # replica reads for @read_replica views
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -52,19 +55,36 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'HotelBookingSystem.urls'
+# asgi.py sets DJANGO_ASGI=1 and routes through ASGI_URLCONF, where the search
+# pages are native async views; WSGI keeps the sync views of HotelBookingSystem.urls.
+ASGI_URLCONF = 'HotelBookingSystem.asgi_urls'
+ROOT_URLCONF = ASGI_URLCONF if os.environ.get('DJANGO_ASGI') else 'HotelBookingSystem.urls'
+
+# Request timing (hotel/performance.py): SQL / template / total time per URL name,
+# exported at /metrics/ (Prometheus text) and /metrics/?format=log (latest requests).
+# The endpoint is open to staff users and to INTERNAL_IPS (e.g. the Prometheus scraper).
+PERFORMANCE_METRICS = False
+PERFORMANCE_LOG_SIZE = 500
+INTERNAL_IPS = ['127.0.0.1']
 
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compiled templates are kept in memory in every environment (same
+            # loaders as APP_DIRS=True); restart the server after editing templates.
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -75,13 +95,123 @@ WSGI_APPLICATION = 'HotelBookingSystem.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# Applied to every new SQLite connection (OPTIONS['init_command']):
+#   busy_timeout      writers queue for the single write lock (ms) instead of failing;
+#   synchronous       'normal' is crash-safe in WAL mode and skips an fsync per commit;
+#   mmap_size         reads go through a memory map of the file instead of read() calls.
+# SQLITE_JOURNAL_MODE is stored in the database file, so it is not set per connection
+# but once by migration hotel 0014 (`manage.py migrate`): in WAL mode readers keep
+# reading the last committed state while a booking is being written, instead of
+# waiting for the writer's commit. `manage.py benchmark --concurrency` measures
+# readers and a booking writer with these settings against SQLite's defaults
+# (rollback journal).
+SQLITE_PRAGMAS = {
+    'busy_timeout': 5000,
+    'synchronous': 'normal',
+    'mmap_size': 256 * 1024 * 1024,
+    'cache_size': -32000,  # KiB of page cache per connection
+    'temp_store': 'memory',
+}
+SQLITE_JOURNAL_MODE = 'wal'
+
+# Connections are kept for CONN_MAX_AGE seconds and reused by later requests of the
+# same thread; the health check replaces a broken one before the request uses it.
+# ASGI sets DJANGO_CONN_MAX_AGE=0 (see asgi.py): async views hop between threads,
+# so a persistent connection there would never be closed.
+CONN_MAX_AGE = int(os.environ.get('DJANGO_CONN_MAX_AGE', 60))
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
+        'OPTIONS': {
+            'init_command': ';'.join(f'PRAGMA {name}={value}' for name, value in SQLITE_PRAGMAS.items()),
+        },
+        'CONN_MAX_AGE': CONN_MAX_AGE,
+        'CONN_HEALTH_CHECKS': True,
+        # A file-backed test database: the default in-memory one uses SQLite's
+        # shared cache, whose table locks break the multi-threaded booking tests.
+        'TEST': {
+            'NAME': BASE_DIR / 'test_db.sqlite3',
+        },
+    }
+}
+
+# Read replica (hotel/routers.py): with DJANGO_REPLICA_DB set, GET requests of
+# @read_replica views (search, room pages, profile, admin reports) read from that
+# database and everything else uses 'default'. After a user writes, their reads stay
+# on the primary for REPLICA_STICKY_SECONDS, which should exceed the replication lag.
+# Locally, any copy of db.sqlite3 works as a stand-in, refreshed with
+# `manage.py sync_replica`.
+if os.environ.get('DJANGO_REPLICA_DB'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.environ['DJANGO_REPLICA_DB'],
+        'TEST': {'MIRROR': 'default'},
     }
+DATABASE_ROUTERS = ['hotel.routers.PrimaryReplicaRouter']
+REPLICA_STICKY_SECONDS = 30
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# 'search' holds room search result pages (hotel/search_cache.py). Local memory is
+# per process; to share it between workers use a file or database backend, e.g.
+#   'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': BASE_DIR / 'cache' / 'search'
+#   'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'hotel_search_cache'  (run createcachetable)
+# 'template_fragments' holds {% cache %} fragments (room cards, room detail), keyed
+# on Room.cache_version, so an edited room never shows stale markup.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hotel-search',
+        'TIMEOUT': 300,
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+    'template_fragments': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hotel-fragments',
+        'TIMEOUT': 3600,
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    },
+    # Only used by sessions and users with DJANGO_SESSION_CACHE (below), or in a
+    # single process (tests, benchmarks)
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'hotel-sessions',
+        'OPTIONS': {'MAX_ENTRIES': 50000},
+    },
 }
 
+# Sessions and the logged-in user. By default both come from the database: two
+# queries per logged-in request, but a logout, a password change or a deactivation
+# is seen by every worker at once. With a cache shared by all workers (Redis,
+# Memcached, database) set DJANGO_SESSION_CACHE to its backend and
+# DJANGO_SESSION_CACHE_LOCATION to its location, e.g.
+#   DJANGO_SESSION_CACHE=django.core.cache.backends.redis.RedisCache
+#   DJANGO_SESSION_CACHE_LOCATION=redis://127.0.0.1:6379/1
+# Sessions then use cached_db (written through to the database, read from the cache)
+# and the user is cached by hotel.auth_backends.CachedModelBackend for
+# USER_CACHE_TIMEOUT seconds and dropped whenever it is saved. Never enable them on
+# the per-process 'locmem' cache with several workers: a logout in one worker would
+# leave the session and the cached user alive in the others.
+USER_CACHE_TIMEOUT = 60
+if os.environ.get('DJANGO_SESSION_CACHE'):
+    CACHES['sessions'] = {
+        'BACKEND': os.environ['DJANGO_SESSION_CACHE'],
+        'LOCATION': os.environ.get('DJANGO_SESSION_CACHE_LOCATION', ''),
+    }
+    SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+    AUTHENTICATION_BACKENDS = ['hotel.auth_backends.CachedModelBackend']
+else:
+    SESSION_ENGINE = 'django.contrib.sessions.backends.db'
+    AUTHENTICATION_BACKENDS = ['django.contrib.auth.backends.ModelBackend']
+SESSION_CACHE_ALIAS = 'sessions'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -126,6 +256,25 @@ AUTH_USER_MODEL = 'hotel.CustomUser'
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Room photo variants (hotel/photos.py): uploads are resized after commit on a
+# pool of PHOTO_WORKERS threads; with PHOTO_BACKGROUND = False they are
+# processed inline. Backfill existing rooms with `manage.py process_photos`.
+PHOTO_WORKERS = 2
+PHOTO_BACKGROUND = True
+
+# Payments (hotel/payment_queue.py): checkout queues a PaymentJob that
+# `manage.py payment_worker` charges through PAYMENT_PROVIDER, a
+# hotel.payment_providers.PaymentProvider subclass built with
+# PAYMENT_PROVIDER_OPTIONS. The fake provider simulates a slow remote API.
+PAYMENT_PROVIDER = 'hotel.payment_providers.FakeProvider'
+PAYMENT_PROVIDER_OPTIONS = {'latency': 1.0}
+
+# Booking holds (hotel/holds.py): an unpaid booking keeps its nights for
+# BOOKING_HOLD_MINUTES, then `manage.py expire_holds` marks it expired. Set
+# BOOKING_HOLD_SWEEP_INTERVAL (seconds) to also sweep inside every web process.
+BOOKING_HOLD_MINUTES = 30
+BOOKING_HOLD_SWEEP_INTERVAL = None
+
 # Crispy Forms settings
 CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 CRISPY_TEMPLATE_PACK = "bootstrap5"
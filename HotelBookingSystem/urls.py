@@ -15,11 +15,22 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from django.conf import settings
 from django.conf.urls.static import static
+from hotel import photos
 
 urlpatterns = [
     path('', include('hotel.urls')),
     path('admin/', admin.site.urls),
-] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
+]
+
+if settings.DEBUG:
+    # Development only, like static() below: content-hashed photo variants with
+    # their far-future cache headers. In production the web server serves
+    # MEDIA_ROOT with the same headers (README, section 7), off the app workers.
+    urlpatterns.append(re_path(
+        rf'^{settings.MEDIA_URL.strip("/")}/{photos.VARIANT_DIR}/(?P<path>.+)$', photos.serve_variant, name='room_photo_variant',
+    ))
+
+urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'HotelBookingSystem.settings')
 
 application = get_wsgi_application()
+
+# Sweeps expired booking holds in this process when BOOKING_HOLD_SWEEP_INTERVAL is set
+from hotel import holds  # noqa: E402
+
+holds.start_scheduler()
@@ -1,57 +1,251 @@
-from django.contrib import admin
+from calendar import monthrange
+from datetime import date, timedelta
+
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ORDER_VAR
 from django.contrib.auth.admin import UserAdmin
-from .models import CustomUser, Employee, Room, Booking, Payment
+from django.core.exceptions import PermissionDenied
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.template.response import TemplateResponse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from . import bulk_status, fulltext
+from .forms import RatePlanForm
+from .models import CustomUser, Employee, Room, Booking, Payment, PaymentJob, DailyRoomTypeStats, RatePlan
+from .pagination import CappedCountPaginator
+from .query_budget import query_budget
+from .routers import read_replica
+
+class FullTextSearchMixin:
+    """Admin search through an FTS5 index (hotel/fulltext.py), best matches first.
+
+    Falls back to the LIKE search over search_fields when the index cannot
+    answer the term (terms shorter than 3 characters, databases without FTS5).
+    """
+    fulltext_index = None
+
+    def get_search_results(self, request, queryset, search_term):
+        results = fulltext.search(queryset, self.fulltext_index, search_term)
+        if results is None:
+            return super().get_search_results(request, queryset, search_term)
+        if ORDER_VAR not in request.GET:
+            # The changelist orders before searching; best matches first unless a column was clicked
+            results = results.order_by('search_rank', '-pk')
+        return results, False
 
 # Custom User Admin
-class CustomUserAdmin(UserAdmin):
+@query_budget(6)
+class CustomUserAdmin(FullTextSearchMixin, UserAdmin):
     model = CustomUser
     list_display = ['username', 'email', 'first_name', 'last_name', 'phone_number', 'is_staff']
+    search_fields = ['username', 'first_name', 'last_name', 'email', 'phone_number']
+    fulltext_index = fulltext.USERS
     fieldsets = UserAdmin.fieldsets + (
         (('Дополнительная информация'), {'fields': ('phone_number',)}),
     )
 
 # Employee Admin
 @admin.register(Employee)
-class EmployeeAdmin(admin.ModelAdmin):
+@query_budget(6)
+class EmployeeAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['full_name', 'position', 'access_level', 'email', 'phone_number', 'start_date']
     list_filter = ['access_level', 'position']
     search_fields = ['full_name', 'email', 'phone_number']
+    fulltext_index = fulltext.EMPLOYEES
 
 # Room Admin
 @admin.register(Room)
-class RoomAdmin(admin.ModelAdmin):
+@query_budget(6)
+class RoomAdmin(FullTextSearchMixin, admin.ModelAdmin):
     list_display = ['number', 'room_type', 'price_per_night', 'max_guests']
     list_filter = ['room_type', 'max_guests']
-    search_fields = ['number', 'description']
+    search_fields = ['number', 'description', 'amenities']
+    fulltext_index = fulltext.ROOMS
     list_editable = ['price_per_night', 'max_guests']
 
+# Rate Plan Admin
+@admin.register(RatePlan)
+@query_budget(6)
+class RatePlanAdmin(admin.ModelAdmin):
+    form = RatePlanForm
+    list_display = ['name', 'room_type', 'room', 'start_date', 'end_date', 'min_nights', 'price', 'percent', 'priority']
+    list_select_related = ['room']
+    list_filter = ['room_type', 'min_nights']
+    search_fields = ['name', 'room__number']
+    raw_id_fields = ['room']
+
 # Booking Admin
 @admin.register(Booking)
+@query_budget(5)
 class BookingAdmin(admin.ModelAdmin):
     list_display = ['id', 'user', 'room', 'check_in_date', 'check_out_date', 'total_price', 'status', 'processed_by']
-    list_filter = ['status', 'check_in_date', 'check_out_date', 'room__room_type']
+    list_select_related = ['user', 'room', 'processed_by']
+    # Large tables: no full COUNT(*) for the page links or the unfiltered total
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    list_filter = ['status', 'auto_assigned', 'check_in_date', 'check_out_date', 'room__room_type']
     search_fields = ['user__username', 'room__number']
     raw_id_fields = ['user', 'room', 'processed_by']
     actions = ['mark_paid', 'mark_cancelled']
 
+    def get_search_results(self, request, queryset, search_term):
+        # Guests by any fragment of their name, email or phone (the users' FTS index)
+        # or the exact room number; newest bookings first, as without a search
+        guests = fulltext.matches(fulltext.USERS, search_term, column='user', using=queryset.db)
+        if guests is None:
+            return super().get_search_results(request, queryset, search_term)
+        return queryset.filter(guests | Q(room__number=search_term.strip())), False
+
+    def transition(self, request, queryset, status, done_message):
+        # Chunked short transactions: selecting "all" never holds the write lock for the whole run
+        result = bulk_status.transition(queryset, status)
+        self.message_user(
+            request,
+            f'{result.updated} {done_message} ({result.chunks} пакетов за {result.seconds:.1f} с, '
+            f'{result.rate:.0f} броней/с; создано платежей: {result.payments}).',
+        )
+        if result.skipped:
+            self.message_user(
+                request, f'{result.skipped} бронирований пропущено: их ночи уже заняты другими бронями.', messages.WARNING,
+            )
+
     @admin.action(description='Отметить выбранные брони как Оплаченные')
     def mark_paid(self, request, queryset):
-        updated = queryset.update(status='paid')
-        self.message_user(request, f'{updated} бронирований отмечены как оплаченные.')
+        self.transition(request, queryset, 'paid', 'бронирований отмечены как оплаченные')
 
     @admin.action(description='Отметить выбранные брони как Отмененные')
     def mark_cancelled(self, request, queryset):
-        updated = queryset.update(status='cancelled')
-        self.message_user(request, f'{updated} бронирований отмечены как отмененные.')
+        self.transition(request, queryset, 'cancelled', 'бронирований отмечены как отмененные')
 
 # Payment Admin
 @admin.register(Payment)
+@query_budget(5)
 class PaymentAdmin(admin.ModelAdmin):
     list_display = ['id', 'booking', 'amount', 'payment_method', 'status', 'timestamp', 'transaction_id']
+    # Booking.__str__ shows the room number and username
+    list_select_related = ['booking__room', 'booking__user']
+    # Large tables: no full COUNT(*) for the page links or the unfiltered total
+    paginator = CappedCountPaginator
+    show_full_result_count = False
     list_filter = ['status', 'payment_method']
     search_fields = ['transaction_id', 'booking__id']
     raw_id_fields = ['booking']
 
+# Payment Queue Admin
+@admin.register(PaymentJob)
+@query_budget(5)
+class PaymentJobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'booking', 'payment_method', 'amount', 'status', 'attempts', 'available_at', 'locked_by', 'error']
+    list_select_related = ['booking__room', 'booking__user']
+    paginator = CappedCountPaginator
+    show_full_result_count = False
+    list_filter = ['status', 'payment_method']
+    search_fields = ['idempotency_key', 'booking__id']
+    raw_id_fields = ['booking', 'payment']
+    readonly_fields = ['idempotency_key', 'generation', 'attempts', 'locked_by', 'locked_at', 'payment']
+    actions = ['retry_now']
+
+    @admin.action(description='Повторить выбранные задачи сейчас')
+    def retry_now(self, request, queryset):
+        now = timezone.now()
+        updated = queryset.filter(status='queued').update(attempts=0, error='', available_at=now)
+        # A failed job is charged anew: a new generation gets a new provider key
+        updated += queryset.filter(status='failed').update(
+            status='queued', attempts=0, generation=F('generation') + 1, error='', available_at=now,
+        )
+        self.message_user(request, f'{updated} задач поставлены в очередь.')
+
+# Occupancy & Revenue Dashboard (reads only the rollups, see hotel/rollups.py)
+@admin.register(DailyRoomTypeStats)
+@read_replica
+@query_budget(5)
+class OccupancyDashboardAdmin(admin.ModelAdmin):
+    PERIODS = {
+        'day': ('По дням', TruncDay),
+        'week': ('По неделям', TruncWeek),
+        'month': ('По месяцам', TruncMonth),
+    }
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+    def date_range(self, request):
+        """First and last reported day from the query string; the last 12 calendar months by default."""
+        today = date.today()
+        months_back = today.year * 12 + today.month - 1 - 11
+        start = parse_date(request.GET.get('start') or '') or date(months_back // 12, months_back % 12 + 1, 1)
+        end = parse_date(request.GET.get('end') or '') or today.replace(day=monthrange(today.year, today.month)[1])
+        return start, max(end, start)
+
+    def changelist_view(self, request, extra_context=None):
+        if not self.has_view_or_change_permission(request):
+            raise PermissionDenied
+        start, last = self.date_range(request)
+        end = last + timedelta(days=1)
+        period = request.GET.get('period') if request.GET.get('period') in self.PERIODS else 'month'
+        trunc = self.PERIODS[period][1]
+
+        inventory = dict(Room.objects.values_list('room_type').annotate(rooms=Count('pk')).order_by())
+        rows = (
+            DailyRoomTypeStats.objects.filter(day__gte=start, day__lt=end)
+            .annotate(period=trunc('day')).values('period', 'room_type')
+            .annotate(nights=Sum('nights_sold'), revenue=Sum('revenue'), cancellations=Sum('cancellations'))
+            .order_by('period', 'room_type')
+        )
+        labels = dict(Room.ROOM_TYPES)
+        table, totals = [], {}
+        for row in rows:
+            period_start = row['period'].date() if hasattr(row['period'], 'date') else row['period']
+            period_end = min(end, self.period_end(period, period_start))
+            days = (period_end - max(start, period_start)).days
+            capacity = inventory.get(row['room_type'], 0) * days
+            table.append({
+                'period': max(start, period_start),
+                'room_type': labels.get(row['room_type'], row['room_type']),
+                'nights': row['nights'],
+                'occupancy': row['nights'] / capacity * 100 if capacity else None,
+                'revenue': row['revenue'],
+                'cancellations': row['cancellations'],
+            })
+            total = totals.setdefault(row['room_type'], {
+                'room_type': labels.get(row['room_type'], row['room_type']), 'nights': 0, 'revenue': 0, 'cancellations': 0,
+            })
+            total['nights'] += row['nights']
+            total['revenue'] += row['revenue']
+            total['cancellations'] += row['cancellations']
+        for room_type, total in totals.items():
+            capacity = inventory.get(room_type, 0) * (end - start).days
+            total['occupancy'] = total['nights'] / capacity * 100 if capacity else None
+
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'title': 'Загрузка и выручка',
+            'start': start,
+            'end': last,
+            'period': period,
+            'periods': [(key, label) for key, (label, _) in self.PERIODS.items()],
+            'rows': table,
+            'totals': sorted(totals.values(), key=lambda total: total['room_type']),
+            **(extra_context or {}),
+        }
+        return TemplateResponse(request, 'admin/hotel/dailyroomtypestats/dashboard.html', context)
+
+    @staticmethod
+    def period_end(period, period_start):
+        if period == 'day':
+            return period_start + timedelta(days=1)
+        if period == 'week':
+            return period_start + timedelta(days=7)
+        return period_start.replace(day=monthrange(period_start.year, period_start.month)[1]) + timedelta(days=1)
+
 # Register Custom User
 admin.site.register(CustomUser, CustomUserAdmin)
 
@@ -0,0 +1,385 @@
+import copy
+from datetime import timedelta
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Case, F, FilteredRelation, IntegerField, Max, Q, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import availability, reservations, rollups, search_cache
+from .models import Booking, Room, RoomNight
+
+# Room allocation for bookings by room type. When the guest asks for "a
+# double room" instead of room 204, the hotel picks the room, and it picks
+# the one whose free gap around the stay is the tightest (best fit): a stay
+# that exactly fills a hole between two bookings beats one that cuts a
+# two-week stretch in half. Leaving a gap of ORPHAN_NIGHTS or fewer nights
+# costs more than any other fit, since nobody books a lone night between
+# two stays. Gaps of GAP_CAP nights or more count as open calendar.
+#
+# Two representations answer "how long is the gap before/after this stay":
+#
+#   * a request reads, in one query, each candidate room's occupancy bits for
+#     the GAP_CAP nights on either side of the stay (from the RoomOccupancy
+#     index), and the gaps are a bit_length() away;
+#   * a Schedule keeps, for every night, the set of free rooms as one
+#     integer bitset over the rooms. Best fit is then a few hundred integer
+#     operations whatever the number of rooms (see best_fit()), which is what
+#     the offline repacking and the demand simulation in benchmarks.py need.
+#
+# Bookings made by room type are flagged auto_assigned; until check-in the
+# repacking (`manage.py repack_rooms`) may move them to other rooms of the
+# same type to close gaps. Rooms the guest picked are never moved.
+
+GAP_CAP = 14
+ORPHAN_NIGHTS = 1
+ORPHAN_PENALTY = 2 * GAP_CAP + 1  # one orphan gap outweighs any other leftover
+
+
+class CalendarChanged(Exception):
+    """A booking of a repacking plan changed before the plan was applied."""
+
+
+def gap_cost(nights):
+    nights = min(nights, GAP_CAP)
+    return nights + ORPHAN_PENALTY if 0 < nights <= ORPHAN_NIGHTS else nights
+
+
+def fit_cost(left, right):
+    """Cost of placing a stay with `left` free nights before it and `right` after it (0 is a perfect fit)."""
+    return gap_cost(left) + gap_cost(right)
+
+
+def lowest_bit(bits):
+    return (bits & -bits).bit_length() - 1
+
+
+class Schedule:
+    """Free rooms per night over start .. end - 1, as integer bitsets over the rooms.
+
+    `rooms` are (room id, max_guests) pairs; bit i of a bitset stands for
+    rooms[i], so ties go to the first room. Nights before `start` count as
+    taken (they can no longer be sold), nights from `end` on as free.
+    """
+
+    def __init__(self, rooms, start, end):
+        self.room_ids = [pk for pk, _ in rooms]
+        self.capacity = [max_guests for _, max_guests in rooms]
+        self.index = {pk: position for position, pk in enumerate(self.room_ids)}
+        self.everyone = (1 << len(self.room_ids)) - 1
+        self.start, self.end = start, end
+        self.free = [self.everyone] * (end - start).days
+        self._fits = {}
+
+    def copy(self):
+        schedule = copy.copy(self)
+        schedule.free = list(self.free)
+        return schedule
+
+    def fits(self, guests):
+        """Bitset of the rooms that take `guests` guests."""
+        rooms = self._fits.get(guests)
+        if rooms is None:
+            rooms = self._fits[guests] = sum(1 << position for position, capacity in enumerate(self.capacity) if capacity >= guests)
+        return rooms
+
+    def night(self, offset):
+        if offset < 0:
+            return 0
+        if offset >= len(self.free):
+            return self.everyone
+        return self.free[offset]
+
+    def _span(self, check_in, check_out):
+        return (check_in - self.start).days, (check_out - self.start).days
+
+    def add(self, room_id, check_in, check_out):
+        taken = self.everyone ^ (1 << self.index[room_id])
+        first, stop = self._span(check_in, check_out)
+        for offset in range(max(first, 0), min(stop, len(self.free))):
+            self.free[offset] &= taken
+
+    def remove(self, room_id, check_in, check_out):
+        bit = 1 << self.index[room_id]
+        first, stop = self._span(check_in, check_out)
+        for offset in range(max(first, 0), min(stop, len(self.free))):
+            self.free[offset] |= bit
+
+    def free_rooms(self, check_in, check_out, guests=1):
+        """Bitset of the rooms free for the whole stay that take `guests` guests."""
+        first, stop = self._span(check_in, check_out)
+        rooms = self.fits(guests)
+        for offset in range(first, stop):
+            rooms &= self.night(offset)
+            if not rooms:
+                break
+        return rooms
+
+    def _gaps(self, rooms, offset, step):
+        """[rooms whose gap on one side is exactly k nights, for k < GAP_CAP] + [rooms with GAP_CAP or more]."""
+        buckets = []
+        while rooms and len(buckets) < GAP_CAP:
+            still_free = rooms & self.night(offset)
+            buckets.append(rooms ^ still_free)
+            rooms = still_free
+            offset += step
+        buckets.append(rooms)
+        return buckets
+
+    def best_fit(self, check_in, check_out, guests=1, prefer=None):
+        """Id of the free room whose gap fits the stay best (see fit_cost()), or None when none is free.
+
+        Among equally good rooms `prefer` wins if it is one of them, else the first.
+        """
+        rooms = self.free_rooms(check_in, check_out, guests)
+        if not rooms:
+            return None
+        first, stop = self._span(check_in, check_out)
+        before = self._gaps(rooms, first - 1, -1)
+        after = self._gaps(rooms, stop, 1)
+        best, chosen = None, 0
+        for left, left_rooms in enumerate(before):
+            if not left_rooms:
+                continue
+            for right, right_rooms in enumerate(after):
+                both = left_rooms & right_rooms
+                if both:
+                    cost = fit_cost(left, right)
+                    if best is None or cost < best:
+                        best, chosen = cost, both
+                    elif cost == best:
+                        chosen |= both
+        if prefer is not None and chosen >> self.index[prefer] & 1:
+            return prefer
+        return self.room_ids[lowest_bit(chosen)]
+
+    def taken_nights(self):
+        return sum((self.everyone ^ free).bit_count() for free in self.free)
+
+    def orphan_nights(self):
+        """Free room-nights in gaps of at most ORPHAN_NIGHTS nights between taken nights."""
+        orphans = 0
+        for offset in range(len(self.free)):
+            starts = self.free[offset] & ~self.night(offset - 1)
+            for length in range(1, ORPHAN_NIGHTS + 1):
+                if not starts:
+                    break
+                orphans += length * (starts & ~self.night(offset + length)).bit_count()
+                starts &= self.night(offset + length)
+        return orphans
+
+
+def pack(schedule, stays):
+    """Places stays (key, room id, check_in, check_out, guests) by best fit in check-in order, longest first.
+
+    Every stay prefers its current room among equally good ones. Returns
+    {key: room id}, or None when a stay finds no free room (the schedule is
+    then partly filled).
+    """
+    placed = {}
+    for key, room_id, check_in, check_out, guests in sorted(stays, key=lambda stay: (stay[2], -(stay[3] - stay[2]).days, stay[0])):
+        chosen = schedule.best_fit(check_in, check_out, guests, prefer=room_id)
+        if chosen is None:
+            return None
+        schedule.add(chosen, check_in, check_out)
+        placed[key] = chosen
+    return placed
+
+
+# --- Booking by room type ---
+
+def _shifted(expression, shift):
+    return expression.bitleftshift(shift) if shift >= 0 else expression.bitrightshift(-shift)
+
+
+def _month_sum(nights, value):
+    """Sum over the joined occupancy rows of value(month, mask) for the months of `nights` ({month: mask})."""
+    return Coalesce(Sum(Case(
+        *[When(window__month=month, then=value(month, mask)) for month, mask in nights.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )), 0)
+
+
+def _taken(nights):
+    # Non-zero when any night is taken; no shifts, so stays of any length stay exact
+    return _month_sum(nights, lambda month, mask: F('window__mask').bitand(mask))
+
+
+def _window_bits(nights, origin):
+    """Taken bits of `nights`, a GAP_CAP window, with bit 0 = the night `origin`.
+
+    The window lies within GAP_CAP nights of `origin`, so the shifts stay
+    far below 64 bits, where SQLite would drop them to 0.
+    """
+    return _month_sum(nights, lambda month, mask: _shifted(F('window__mask').bitand(mask), (month - origin).days))
+
+
+def candidates(room_type, check_in, check_out, guests=1):
+    """(room id, taken bits of the GAP_CAP nights before, taken bits of the GAP_CAP nights after) of the free rooms."""
+    if not 0 < (check_out - check_in).days <= availability.MAX_STAY_NIGHTS:
+        raise ValueError(f'a stay lasts 1 to {availability.MAX_STAY_NIGHTS} nights')
+    window_start, window_end = check_in - timedelta(days=GAP_CAP), check_out + timedelta(days=GAP_CAP)
+    before = availability.stay_masks(window_start, check_in)
+    stay = availability.stay_masks(check_in, check_out)
+    after = availability.stay_masks(check_out, window_end)
+    return (
+        Room.objects.filter(room_type=room_type, max_guests__gte=guests)
+        .alias(window=FilteredRelation('occupancy', condition=Q(occupancy__month__in=sorted(availability.stay_masks(window_start, window_end)))))
+        .values('pk')
+        .annotate(taken=_taken(stay), before=_window_bits(before, window_start), after=_window_bits(after, check_out))
+        .filter(taken=0)
+        .order_by('pk')
+        .values_list('pk', 'before', 'after')
+    )
+
+
+def choose_room(room_type, check_in, check_out, guests=1, today=None):
+    """Id of the free room of the type that fits the stay best, or None. One query."""
+    today = today or timezone.localdate()
+    # Nights before today are as good as taken: nobody can book them any more
+    past = (1 << min(max((today - check_in).days + GAP_CAP, 0), GAP_CAP)) - 1
+    best = None
+    for pk, before, after in candidates(room_type, check_in, check_out, guests):
+        cost = fit_cost(GAP_CAP - (before | past).bit_length(), lowest_bit(after) if after else GAP_CAP)
+        if best is None or cost < best[0]:
+            best = (cost, pk)
+            if not cost:
+                break
+    return best and best[1]
+
+
+def reserve_by_type(user, room_type, check_in, check_out, guests, **fields):
+    """Books the best-fitting free room of the type as an auto_assigned booking.
+
+    Raises reservations.RoomUnavailable when no room of the type is free.
+    A room taken between the choice and the claim is simply chosen against
+    again: the winner's claim is already in the index.
+    """
+    for _ in range(reservations.MAX_ATTEMPTS):
+        room_id = choose_room(room_type, check_in, check_out, guests)
+        if room_id is None:
+            break
+        try:
+            return reservations.reserve(Room.objects.get(pk=room_id), user, check_in, check_out, guests, auto_assigned=True, **fields)
+        except reservations.RoomUnavailable:
+            continue
+    raise reservations.RoomUnavailable(room_type, check_in, check_out)
+
+
+# --- Repacking ---
+
+class RepackPlan:
+    def __init__(self, room_type, stays=0, moves=None, orphans_before=0, orphans_after=0):
+        self.room_type = room_type
+        self.stays = stays  # movable stays considered
+        self.moves = moves or {}  # {booking id: (rollups.state() before the move, new room id)}
+        self.orphans_before = orphans_before
+        self.orphans_after = orphans_after
+
+
+def movable(bookings, today):
+    """Stays the hotel may still move: booked by room type, active, not checked in yet."""
+    return bookings.active().filter(auto_assigned=True, check_in_date__gt=today)
+
+
+def plan_repack(room_type, today=None):
+    """Re-places the movable stays of one room type by best fit around the stays that stay put.
+
+    The plan keeps every stay where it is unless the new placement leaves
+    fewer orphan nights in the calendar.
+    """
+    today = today or timezone.localdate()
+    last_check_out = movable(Booking.objects.filter(room__room_type=room_type), today).aggregate(last=Max('check_out_date'))['last']
+    if last_check_out is None:
+        return RepackPlan(room_type)
+    end = last_check_out + timedelta(days=GAP_CAP)
+    rooms = Room.objects.filter(room_type=room_type).order_by('pk').values_list('pk', 'max_guests')
+    schedule = Schedule(list(rooms), today, end)
+    stays = {}
+    bookings = Booking.objects.active().filter(room__room_type=room_type).overlapping(today, end).values_list(
+        'pk', 'room_id', 'status', 'check_in_date', 'check_out_date', 'total_price', 'guests', 'auto_assigned',
+    )
+    for pk, room_id, status, check_in, check_out, total_price, guests, auto_assigned in bookings:
+        if auto_assigned and check_in > today:
+            stays[pk] = ((room_id, status, check_in, check_out, total_price), guests)
+        else:
+            schedule.add(room_id, check_in, check_out)
+
+    current = schedule.copy()
+    for (room_id, _, check_in, check_out, _), _ in stays.values():
+        current.add(room_id, check_in, check_out)
+    plan = RepackPlan(room_type, len(stays), orphans_before=current.orphan_nights())
+    plan.orphans_after = plan.orphans_before
+    placed = pack(schedule, [(pk, state[0], state[2], state[3], guests) for pk, (state, guests) in stays.items()])
+    if placed is not None and schedule.orphan_nights() < plan.orphans_before:
+        plan.orphans_after = schedule.orphan_nights()
+        plan.moves = {pk: (stays[pk][0], room_id) for pk, room_id in placed.items() if room_id != stays[pk][0][0]}
+    return plan
+
+
+def _move_bookings(rows):
+    """Sets room and updated_at of many bookings, [(room id, updated_at, booking id)], in one executemany().
+
+    bulk_update() builds a CASE expression over every row of a batch; for 30 000 moves compiling it
+    took most of the 31 s of apply_repack() on 4385 double rooms.
+    """
+    qn = connection.ops.quote_name
+    table = qn(Booking._meta.db_table)
+    room = qn(Booking._meta.get_field('room').column)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'UPDATE {table} SET {room} = %s, {qn("updated_at")} = %s WHERE {qn("id")} = %s',
+            [(room_id, connection.ops.adapt_datetimefield_value(updated_at), pk) for room_id, updated_at, pk in rows],
+        )
+
+
+def apply_repack(plan):
+    """Moves the planned bookings in one transaction; returns how many moved.
+
+    Raises CalendarChanged when a planned booking changed since planning and
+    IntegrityError when another booking took one of the new nights; nothing
+    is moved then.
+    """
+    if not plan.moves:
+        return 0
+    booking_ids = list(plan.moves)
+    now = timezone.now()
+    with transaction.atomic():
+        current = {row[0]: row[1:] for row in Booking.objects.filter(pk__in=booking_ids).values_list(
+            'pk', 'room_id', 'status', 'check_in_date', 'check_out_date', 'total_price',
+        )}
+        if any(current.get(pk) != state for pk, (state, _) in plan.moves.items()):
+            raise CalendarChanged(plan.room_type)
+        # Release every moved stay first, so that two bookings can swap rooms
+        RoomNight.objects.filter(booking_id__in=booking_ids).delete()
+        _move_bookings([(room_id, now, pk) for pk, (_, room_id) in plan.moves.items()])
+        RoomNight.objects.bulk_create([
+            RoomNight(room_id=room_id, night=night, booking_id=pk)
+            for pk, ((_, _, check_in, check_out, _), room_id) in plan.moves.items()
+            for night in reservations.stay_nights(check_in, check_out)
+        ])
+        months = set()
+        rooms = set()
+        for (old_room, _, check_in, check_out, _), room_id in plan.moves.values():
+            months.update(availability.stay_masks(check_in, check_out))
+            rooms.update((old_room, room_id))
+        availability.refresh_rooms(rooms, months)
+        rollups.record_moves(plan.moves.values())
+    stays = [state for state, _ in plan.moves.values()]
+    search_cache.invalidate_stay(plan.room_type, min(state[2] for state in stays), max(state[3] for state in stays))
+    return len(booking_ids)
+
+
+def repack(room_type, today=None, dry_run=False):
+    """Plans and applies the repacking of one room type, re-planning when bookings change meanwhile."""
+    for attempt in range(1, reservations.MAX_ATTEMPTS + 1):
+        plan = plan_repack(room_type, today)
+        if dry_run:
+            return plan
+        try:
+            apply_repack(plan)
+            return plan
+        except (CalendarChanged, IntegrityError):
+            if attempt == reservations.MAX_ATTEMPTS:
+                raise
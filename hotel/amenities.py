@@ -0,0 +1,168 @@
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F
+
+from . import search_cache
+from .models import Amenity, Room
+
+# Amenity index. Staff keep typing amenities into Room.amenities as free text
+# ("Wi-Fi, ТВ, Душ, Балкон"); on save the text is parsed into the Amenity
+# vocabulary, where every distinct amenity owns one bit, and
+# Room.amenity_mask gets the OR of the room's bits. Filtering by amenities is
+# then `amenity_mask & wanted = wanted` on an integer column instead of
+# LIKE scans over text, and the facet counts of a whole result set come from
+# one query that groups the rooms by their mask.
+
+MAX_AMENITIES = 63  # bits of a signed 64-bit BigIntegerField
+
+
+class TooManyAmenities(ValueError):
+    pass
+
+
+def normalize_name(name):
+    return ' '.join(name.split())
+
+
+def key(name):
+    """Case-insensitive identity of an amenity: 'wi-fi ' and 'Wi-Fi' are the same."""
+    return normalize_name(name).casefold()
+
+
+def parse(text):
+    """Amenity names of a comma-separated text, without blanks and duplicates, in order."""
+    names = {}
+    for part in (text or '').split(','):
+        name = normalize_name(part)
+        if name:
+            names.setdefault(name.casefold(), name)
+    return list(names.values())
+
+
+def flag(bit):
+    return 1 << bit
+
+
+def mask_of(bits):
+    mask = 0
+    for bit in bits:
+        mask |= flag(bit)
+    return mask
+
+
+def _vocabulary():
+    return {amenity.key: amenity for amenity in Amenity.objects.all()}
+
+
+def _add(vocabulary, names):
+    """Creates the missing amenities on the first free bits; raises TooManyAmenities when they run out."""
+    free = sorted(set(range(MAX_AMENITIES)) - {amenity.bit for amenity in vocabulary.values()})
+    missing = [name for name in names if key(name) not in vocabulary]
+    if len(missing) > len(free):
+        raise TooManyAmenities(f'Можно завести не больше {MAX_AMENITIES} разных удобств.')
+    for name, bit in zip(missing, free):
+        vocabulary[key(name)] = Amenity.objects.create(name=name, key=key(name), bit=bit)
+
+
+def resolve(names, retries=3):
+    """Returns the mask of the given amenity names, adding new ones to the vocabulary."""
+    for attempt in range(retries):
+        vocabulary = _vocabulary()
+        try:
+            # A concurrent save may take the same new name or bit: reload and try again
+            with transaction.atomic():
+                _add(vocabulary, names)
+            break
+        except IntegrityError:
+            if attempt == retries - 1:
+                raise
+    return mask_of(vocabulary[key(name)].bit for name in names)
+
+
+def mask_for(text):
+    return resolve(parse(text))
+
+
+def check(text):
+    """Raises TooManyAmenities if saving `text` would overflow the vocabulary."""
+    vocabulary = _vocabulary()
+    missing = {key(name) for name in parse(text)} - set(vocabulary)
+    if len(vocabulary) + len(missing) > MAX_AMENITIES:
+        raise TooManyAmenities(f'Можно завести не больше {MAX_AMENITIES} разных удобств.')
+
+
+def selection(values):
+    """Mask of the amenity bits chosen in the query string (?amenity=3&amenity=7); junk is ignored."""
+    bits = {int(value) for value in values if value.isdigit() and int(value) < MAX_AMENITIES}
+    return mask_of(bits)
+
+
+def selected_bits(mask):
+    bits = []
+    while mask:
+        lowest = mask & -mask
+        bits.append(lowest.bit_length() - 1)
+        mask ^= lowest
+    return bits
+
+
+def with_all(rooms, mask):
+    """Rooms of the queryset that have every amenity in `mask`."""
+    if not mask:
+        return rooms
+    return rooms.alias(matched_amenities=F('amenity_mask').bitand(mask)).filter(matched_amenities=mask)
+
+
+def vocabulary():
+    """[(bit, name)] of every amenity by name; cached until a room changes (new amenities come only from room saves)."""
+    cache = search_cache.get_cache()
+    key = search_cache.versioned_key(('amenities',), None, None, None)
+    names = cache.get(key)
+    if names is None:
+        names = list(Amenity.objects.order_by('name').values_list('bit', 'name'))
+        cache.set(key, names)
+    return names
+
+
+def _facets(names, masks):
+    """Folds (amenity_mask, rooms) pairs into [{'bit', 'name', 'count'}] for the vocabulary."""
+    counts = [0] * MAX_AMENITIES
+    for mask, rooms in masks:
+        for bit in selected_bits(mask):
+            counts[bit] += rooms
+    return [{'bit': bit, 'name': name, 'count': counts[bit]} for bit, name in names]
+
+
+def _masks(rooms):
+    # Rooms share a few hundred amenity combinations at most, so grouping by
+    # the mask is one pass and the per-bit sums are cheap in Python
+    return rooms.order_by().values_list('amenity_mask').annotate(rooms=Count('pk'))
+
+
+def facets(rooms):
+    """[{'bit', 'name', 'count'}]: how many rooms of the queryset have each amenity, in a single query."""
+    names = vocabulary()
+    return _facets(names, _masks(rooms)) if names else []
+
+
+async def afacets(rooms):
+    names = await sync_to_async(vocabulary)()
+    return _facets(names, [row async for row in _masks(rooms)]) if names else []
+
+
+def rebuild(batch_size=1000):
+    """Recomputes amenity_mask of every room from its text (after bulk_create or raw imports); returns the count."""
+    vocabulary = _vocabulary()
+    changed = []
+    for pk, text, current in Room.objects.values_list('pk', 'amenities', 'amenity_mask'):
+        names = parse(text)
+        if any(key(name) not in vocabulary for name in names):
+            with transaction.atomic():
+                _add(vocabulary, names)
+        mask = mask_of(vocabulary[key(name)].bit for name in names)
+        if mask != current:
+            changed.append(Room(pk=pk, amenity_mask=mask))
+    Room.objects.bulk_update(changed, ['amenity_mask'], batch_size=batch_size)
+    if changed:
+        search_cache.invalidate_all()
+    return len(changed)
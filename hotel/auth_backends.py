@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import caches
+
+# Authenticated user lookups. AuthenticationMiddleware resolves request.user
+# through the backend's get_user() on every request; CachedModelBackend serves
+# it from the 'sessions' cache for settings.USER_CACHE_TIMEOUT seconds. Saving
+# or deleting a user drops the entry (hotel/signals.py), so password changes,
+# deactivation and profile edits are seen at once in this process and within
+# the TTL in other processes.
+
+
+def get_cache():
+    return caches[getattr(settings, 'USER_CACHE_ALIAS', 'sessions')]
+
+
+def cache_key(user_id):
+    return f'user:{user_id}'
+
+
+def invalidate(user_id):
+    get_cache().delete(cache_key(user_id))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key = cache_key(user_id)
+        user = get_cache().get(key)
+        if user is None:
+            user = super().get_user(user_id)
+            if user is not None:
+                get_cache().set(key, user, settings.USER_CACHE_TIMEOUT)
+            return user
+        return user if self.user_can_authenticate(user) else None
+
+    async def aget_user(self, user_id):
+        key = cache_key(user_id)
+        user = await get_cache().aget(key)
+        if user is None:
+            user = await super().aget_user(user_id)
+            if user is not None:
+                await get_cache().aset(key, user, settings.USER_CACHE_TIMEOUT)
+            return user
+        return user if self.user_can_authenticate(user) else None
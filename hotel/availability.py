@@ -0,0 +1,206 @@
+from datetime import date
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, Value, When
+
+from .models import Booking, RoomOccupancy
+
+# Occupancy index: one RoomOccupancy row per (room, month). Bit N of `mask`
+# is set when the night starting on day N+1 of that month is taken by a
+# pending or paid booking. A search for any stay is a bitwise AND of the
+# stay's own per-month masks against a handful of rows.
+
+# Longest stay a search or booking accepts: every night costs a mask
+# branch in the availability query and a version key in the search cache
+MAX_STAY_NIGHTS = 366
+
+# Searches reach at most this many years ahead (keeps month arithmetic far
+# from date.max and the cached calendars to dates anyone books)
+HORIZON_YEARS = 10
+
+
+def horizon():
+    """Last date a search may cover."""
+    return date(date.today().year + HORIZON_YEARS, 12, 31)
+
+
+def month_start(day):
+    return day.replace(day=1)
+
+
+def next_month(month):
+    if month.month == 12:
+        return date(month.year + 1, 1, 1)
+    return date(month.year, month.month + 1, 1)
+
+
+def stay_masks(check_in, check_out):
+    """Returns {month: mask} for the nights check_in .. check_out - 1."""
+    masks = {}
+    month = month_start(check_in)
+    while month < check_out:
+        first = max(check_in, month)
+        last = min(check_out, next_month(month))  # exclusive
+        if first < last:
+            width = (last - first).days
+            masks[month] = ((1 << width) - 1) << (first.day - 1)
+        month = next_month(month)
+    return masks
+
+
+def build_masks(stays):
+    """Folds (room_id, check_in, check_out) tuples into {(room_id, month): mask}."""
+    index = {}
+    for room_id, check_in, check_out in stays:
+        for month, mask in stay_masks(check_in, check_out).items():
+            key = (room_id, month)
+            index[key] = index.get(key, 0) | mask
+    return index
+
+
+def _active_stays(bookings):
+    return bookings.active().values_list(
+        'room_id', 'check_in_date', 'check_out_date'
+    )
+
+
+def refresh(room_id, months):
+    """Recomputes the index rows of one room for the given months."""
+    months = sorted(set(months))
+    if not months:
+        return
+    period_start, period_end = months[0], next_month(months[-1])
+    stays = _active_stays(Booking.objects.filter(room_id=room_id).overlapping(period_start, period_end))
+    index = build_masks(stays)
+
+    with transaction.atomic(savepoint=False):
+        stale = []
+        for month in months:
+            mask = index.get((room_id, month), 0)
+            if not mask:
+                stale.append(month)
+            elif not RoomOccupancy.objects.filter(room_id=room_id, month=month).update(mask=mask):
+                RoomOccupancy.objects.create(room_id=room_id, month=month, mask=mask)
+        if stale:
+            RoomOccupancy.objects.filter(room_id=room_id, month__in=stale).delete()
+
+
+def refresh_rooms(room_ids, months):
+    """Recomputes the index rows of many rooms for the given months: one read, one delete, one insert."""
+    room_ids, months = set(room_ids), sorted(set(months))
+    if not room_ids or not months:
+        return
+    period_start, period_end = months[0], next_month(months[-1])
+    stays = _active_stays(Booking.objects.filter(room_id__in=room_ids).overlapping(period_start, period_end))
+    index = {key: mask for key, mask in build_masks(stays).items() if key[1] in months}
+    with transaction.atomic(savepoint=False):
+        RoomOccupancy.objects.filter(room_id__in=room_ids, month__in=months).delete()
+        RoomOccupancy.objects.bulk_create(
+            [RoomOccupancy(room_id=room_id, month=month, mask=mask) for (room_id, month), mask in index.items()],
+            batch_size=1000,
+        )
+
+
+def refresh_stay(room_id, check_in, check_out):
+    refresh(room_id, stay_masks(check_in, check_out))
+
+
+def refresh_bookings(bookings):
+    """Refreshes every room-month touched by the given Booking queryset."""
+    touched = {}
+    for room_id, check_in, check_out in bookings.values_list('room_id', 'check_in_date', 'check_out_date'):
+        touched.setdefault(room_id, set()).update(stay_masks(check_in, check_out))
+    for room_id, months in touched.items():
+        refresh(room_id, months)
+
+
+def add_stays(stays):
+    """Marks the nights of newly claimed (room_id, check_in, check_out) stays as taken.
+
+    For any number of rooms: one read, one bulk update (OR-ing the bits in
+    SQL, so concurrent claims of other nights are kept) and one bulk insert.
+    """
+    added = build_masks(stays)
+    if not added:
+        return
+    existing = RoomOccupancy.objects.filter(
+        room_id__in={room_id for room_id, _ in added}, month__in={month for _, month in added},
+    ).only('pk', 'room_id', 'month')
+    changed = []
+    for row in existing:
+        mask = added.pop((row.room_id, row.month), None)
+        if mask is not None:
+            row.mask = F('mask').bitor(mask)
+            changed.append(row)
+    with transaction.atomic(savepoint=False):
+        RoomOccupancy.objects.bulk_update(changed, ['mask'])
+        RoomOccupancy.objects.bulk_create(
+            [RoomOccupancy(room_id=room_id, month=month, mask=mask) for (room_id, month), mask in added.items()]
+        )
+
+
+def occupied_room_ids(check_in, check_out):
+    """Room ids with at least one taken night in [check_in, check_out)."""
+    masks = stay_masks(check_in, check_out)
+    overlap = Case(
+        *[When(month=month, then=F('mask').bitand(mask)) for month, mask in masks.items()],
+        default=Value(0),
+        output_field=IntegerField(),
+    )
+    return (
+        RoomOccupancy.objects.filter(month__in=list(masks))
+        .annotate(overlap=overlap)
+        .filter(overlap__gt=0)
+        .values_list('room_id', flat=True)
+    )
+
+
+def load_masks(months, rooms=None):
+    """Fetches {(room_id, month): mask} for the given months in one query."""
+    rows = RoomOccupancy.objects.filter(month__in=list(months))
+    if rooms is not None:
+        rows = rows.filter(room__in=rooms)
+    return {(room_id, month): mask for room_id, month, mask in rows.values_list('room_id', 'month', 'mask')}
+
+
+def is_free_in(masks, room_id, check_in, check_out):
+    """Answers from masks preloaded by load_masks(), without touching the database."""
+    return all(not masks.get((room_id, month), 0) & mask for month, mask in stay_masks(check_in, check_out).items())
+
+
+def is_room_free(room_id, check_in, check_out):
+    return not occupied_room_ids(check_in, check_out).filter(room_id=room_id).exists()
+
+
+async def ais_room_free(room_id, check_in, check_out):
+    return not await occupied_room_ids(check_in, check_out).filter(room_id=room_id).aexists()
+
+
+def rebuild():
+    """Drops and recreates the whole index from the bookings table."""
+    index = build_masks(_active_stays(Booking.objects.all()).iterator())
+    with transaction.atomic():
+        RoomOccupancy.objects.all().delete()
+        RoomOccupancy.objects.bulk_create(
+            [RoomOccupancy(room_id=room_id, month=month, mask=mask) for (room_id, month), mask in index.items()],
+            batch_size=1000,
+        )
+    return len(index)
+
+
+def verify():
+    """Compares the stored index with the bookings table.
+
+    Returns a list of (room_id, month, stored_mask, expected_mask) for every
+    row that differs; an empty list means the index is consistent.
+    """
+    expected = build_masks(_active_stays(Booking.objects.all()).iterator())
+    stored = {
+        (room_id, month): mask
+        for room_id, month, mask in RoomOccupancy.objects.values_list('room_id', 'month', 'mask').iterator()
+    }
+    mismatches = []
+    for key in sorted(set(expected) | set(stored)):
+        if expected.get(key, 0) != stored.get(key, 0):
+            mismatches.append((key[0], key[1], stored.get(key, 0), expected.get(key, 0)))
+    return mismatches
@@ -0,0 +1,549 @@
+import json
+import multiprocessing
+import random
+import statistics
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import date, timedelta
+from itertools import count
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.mixins import LoginRequiredMixin
+from django.db import OperationalError, connection, reset_queries
+from django.db.models import Count, Max
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import allocation, availability, group_bookings, performance, rates, reservations, search_cache, urls
+from .loadtest import InProcessTarget
+from .models import Amenity, Booking, Payment, Room
+
+# Benchmark suite for the hot views and ORM paths. Each case is measured on
+# the current database for wall time (median of N runs), SQL query count and
+# peak Python memory (one extra traced run), and the results can be saved as
+# a JSON baseline or compared against one.
+
+User = get_user_model()
+
+MIN_WALL_DELTA_MS = 2.0
+OVERHEAD_BUDGET = 0.05  # PerformanceMiddleware may add at most 5% per request
+
+# Connection setups compared by db_concurrency(): SQLite's defaults (rollback
+# journal, fsync on every commit) and the project's pragmas
+SQLITE_PROFILES = {
+    'sqlite_defaults': {'journal_mode': 'delete', 'synchronous': 'full'},
+    'configured': {'journal_mode': getattr(settings, 'SQLITE_JOURNAL_MODE', 'wal'), **getattr(settings, 'SQLITE_PRAGMAS', {})},
+}
+
+# Session and user loading compared by route_queries(): one query each per request
+# (the default) against the cached session backend and user cache that
+# DJANGO_SESSION_CACHE enables; in one process the 'sessions' cache may be local
+CACHED_AUTH = {
+    'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+    'AUTHENTICATION_BACKENDS': ['hotel.auth_backends.CachedModelBackend'],
+}
+AUTH_SETUPS = {
+    'db': {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    },
+    'cached': CACHED_AUTH,
+}
+
+
+class Case:
+    """One benchmark: `prepare()` runs untimed before every iteration and
+    returns the argument of the timed `run(arg)`."""
+
+    def __init__(self, name, run, prepare=None):
+        self.name = name
+        self.run = run
+        self.prepare = prepare or (lambda: None)
+
+
+class Fixture:
+    """Clients and ids the cases need, picked from whatever data is loaded."""
+
+    def __init__(self):
+        host = InProcessTarget.host()
+        self.guest = User.objects.annotate(n=Count('bookings')).order_by('-n', 'pk').first()
+        self.staff = User.objects.filter(is_superuser=True).first() or User.objects.create_superuser(
+            'bench_admin', 'bench_admin@hotel.kz', 'benchpassword'
+        )
+        self.client = Client(SERVER_NAME=host)
+        self.client.force_login(self.guest)
+        self.admin_client = Client(SERVER_NAME=host)
+        self.admin_client.force_login(self.staff)
+        self.room = Room.objects.order_by('pk').first()
+        # Far-future dates that never collide with seeded bookings, each other or an earlier fixture's stays
+        self.slots = count()
+        latest = Booking.objects.aggregate(latest=Max('check_out_date'))['latest']
+        self.future = max(date.today() + timedelta(days=3 * 365), latest or date.min)
+
+    def next_stay(self):
+        check_in = self.future + timedelta(days=3 * next(self.slots))
+        return check_in, check_in + timedelta(days=2)
+
+
+SEARCH_SPANS = {'room_search_1n': 1, 'room_search_7n': 7, 'room_search_30n': 30}
+
+
+def clear_search_cache():
+    # Cold searches: measure the view and its queries, not a cache hit
+    search_cache.get_cache().clear()
+
+
+def build_cases(fixture):
+    def get(name, client=None, query=None, **kwargs):
+        def run(_):
+            response = (client or fixture.client).get(reverse(name, kwargs=kwargs), query or {})
+            assert response.status_code == 200, response.status_code
+        return run
+
+    def booking_create(_):
+        check_in, check_out = fixture.next_stay()
+        response = fixture.client.post(reverse('booking_create', kwargs={'room_id': fixture.room.pk}), {
+            'check_in_date': check_in.isoformat(), 'check_out_date': check_out.isoformat(), 'guests': 1,
+        })
+        assert response.status_code == 302, response.status_code
+
+    group = list(Room.objects.order_by('pk').values_list('pk', flat=True)[:group_bookings.MAX_ROOMS])
+
+    def group_booking(_):
+        check_in, check_out = fixture.next_stay()
+        response = fixture.client.post(reverse('group_booking_api'), json.dumps({
+            'check_in': check_in.isoformat(), 'check_out': check_out.isoformat(), 'rooms': group,
+        }), content_type='application/json')
+        assert response.status_code == 201, response.status_code
+
+    # The most common room type: the most candidates to score
+    room_type = Room.objects.values('room_type').annotate(n=Count('pk')).order_by('-n', 'room_type')[0]['room_type']
+
+    def room_type_booking(_):
+        check_in, check_out = fixture.next_stay()
+        response = fixture.client.post(reverse('room_type_booking'), {
+            'check_in_date': check_in.isoformat(), 'check_out_date': check_out.isoformat(), 'room_type': room_type, 'guests': 1,
+        })
+        assert response.status_code == 302, response.status_code
+
+    def unpaid_booking():
+        check_in, check_out = fixture.next_stay()
+        return reservations.reserve(fixture.room, fixture.guest, check_in, check_out, 1)
+
+    def payment_mock(booking):
+        response = fixture.client.post(reverse('payment_mock', kwargs={'booking_id': booking.pk}), {'payment_method': 'kaspi'})
+        assert response.status_code == 302, response.status_code
+
+    check_in = date.today() + timedelta(days=7)
+    cases = [Case('room_list', get('room_list'), clear_search_cache)]
+    cases += [
+        Case(name, get('room_list', query={
+            'check_in': check_in.isoformat(), 'check_out': (check_in + timedelta(days=nights)).isoformat(),
+        }), clear_search_cache)
+        for name, nights in SEARCH_SPANS.items()
+    ]
+    # Two amenities of the seeded vocabulary, with their facet counts
+    amenity_bits = list(Amenity.objects.order_by('bit').values_list('bit', flat=True)[:2])
+    cases.append(Case('room_search_amenities', get('room_list', query={
+        'check_in': check_in.isoformat(), 'check_out': (check_in + timedelta(days=7)).isoformat(), 'amenity': amenity_bits,
+    }), clear_search_cache))
+    cases += [
+        Case('room_detail', get('room_detail', pk=fixture.room.pk)),
+        Case('profile', get('profile')),
+        Case('booking_create', booking_create),
+        # Up to 50 rooms in one request: a fixed number of queries, not one reservation per room
+        Case('group_booking_50', group_booking),
+        # The hotel picks the room: one query scores every free room of the type
+        Case('room_assign', lambda _: allocation.choose_room(room_type, check_in, check_in + timedelta(days=3))),
+        Case('room_type_booking', room_type_booking),
+        Case('payment_mock', payment_mock, unpaid_booking),
+        Case('admin_booking_changelist', get('admin:hotel_booking_changelist', client=fixture.admin_client)),
+        Case('admin_payment_changelist', get('admin:hotel_payment_changelist', client=fixture.admin_client)),
+        Case('admin_room_changelist', get('admin:hotel_room_changelist', client=fixture.admin_client)),
+        # Nightly rates of every room for a month of the seeded rate card (plans + rooms: two queries)
+        Case('rate_month_grid', lambda _: rates.month_grid(check_in)),
+    ]
+    return cases
+
+
+def measure(case, repeat=10, warmup=2):
+    for _ in range(warmup):
+        case.run(case.prepare())
+
+    timings = []
+    for _ in range(repeat):
+        arg = case.prepare()
+        reset_queries()  # the log is a bounded deque; a full one would count 0
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            case.run(arg)
+            timings.append(time.perf_counter() - started)
+        query_count = len(queries)
+
+    arg = case.prepare()
+    tracemalloc.start()
+    try:
+        case.run(arg)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'wall_ms': round(statistics.median(timings) * 1000, 3),
+        'queries': query_count,
+        'peak_kib': round(peak / 1024, 1),
+    }
+
+
+def compare(results, baseline, threshold=0.2, min_wall_delta_ms=MIN_WALL_DELTA_MS):
+    """Lists regressions of `results` against `baseline` (both {case: metrics}).
+
+    Wall time and peak memory regress when they grow by more than `threshold`
+    (relative; wall time also by more than `min_wall_delta_ms`, so jitter on
+    millisecond views is not reported); the query count regresses on any
+    increase.
+    """
+    regressions = []
+    for name, current in sorted(results.items()):
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        for metric in ('wall_ms', 'peak_kib'):
+            if metric == 'wall_ms' and current[metric] - previous[metric] <= min_wall_delta_ms:
+                continue
+            if previous[metric] and current[metric] > previous[metric] * (1 + threshold):
+                regressions.append((name, metric, previous[metric], current[metric]))
+        if current['queries'] > previous['queries']:
+            regressions.append((name, 'queries', previous['queries'], current['queries']))
+    return regressions
+
+
+def run_suite(repeat=10, warmup=2, only=None):
+    """Measures every case on the current database: {case name: metrics}."""
+    fixture = Fixture()
+    results = {}
+    for case in build_cases(fixture):
+        if only and case.name not in only:
+            continue
+        results[case.name] = measure(case, repeat=repeat, warmup=warmup)
+    return results
+
+
+def middleware_overhead(repeat=200):
+    """Median per-request cost of PerformanceMiddleware on cheap routes, where it weighs most.
+
+    Requests with and without the middleware are interleaved so that drift
+    (CPU frequency, caches) hits both sides equally.
+    """
+    room = Room.objects.order_by('pk').first()
+    paths = {'home': reverse('home'), 'room_list': reverse('room_list')}
+    if room is not None:
+        paths['room_detail'] = reverse('room_detail', kwargs={'pk': room.pk})
+
+    clients = {}
+    for enabled in (False, True):
+        # Middleware is loaded on the first request, so make it inside the override
+        with override_settings(PERFORMANCE_METRICS=enabled):
+            clients[enabled] = Client(SERVER_NAME=InProcessTarget.host())
+            for path in paths.values():
+                clients[enabled].get(path)
+
+    results = {}
+    for name, path in paths.items():
+        timings = {False: [], True: []}
+        for _ in range(repeat):
+            for enabled, client in clients.items():
+                started = time.perf_counter()
+                client.get(path)
+                timings[enabled].append(time.perf_counter() - started)
+        off, on = statistics.median(timings[False]) * 1000, statistics.median(timings[True]) * 1000
+        results[name] = {'off_ms': round(off, 3), 'on_ms': round(on, 3), 'overhead_ms': round(on - off, 3),
+                         'overhead': round((on - off) / off, 4)}
+    performance.registry.reset()
+    return results
+
+
+@contextmanager
+def sqlite_pragmas(pragmas):
+    """Connections opened inside the block run `pragmas` instead of the configured init_command.
+
+    The journal mode is a property of the database file: the previous one is
+    restored afterwards.
+    """
+    options = connection.settings_dict['OPTIONS']
+    previous = options.get('init_command')
+    with connection.cursor() as cursor:
+        cursor.execute('PRAGMA journal_mode')
+        journal_mode = cursor.fetchone()[0]
+    connection.close()
+    options['init_command'] = ';'.join(f'PRAGMA {name}={value}' for name, value in pragmas.items())
+    try:
+        # The first connection switches the journal mode of the file; it must be the only one
+        connection.ensure_connection()
+        yield
+    finally:
+        connection.close()
+        if previous is None:
+            options.pop('init_command', None)
+        else:
+            options['init_command'] = previous
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={journal_mode}')
+
+
+def _percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))] if values else 0.0
+
+
+def _hammer(operation, duration, results):
+    """Runs `operation` for `duration` seconds in a forked process; sends back (timings, lock errors)."""
+    timings, errors = [], 0
+    deadline = time.perf_counter() + duration
+    try:
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                operation()
+            except OperationalError:
+                errors += 1
+            else:
+                timings.append(time.perf_counter() - started)
+    finally:
+        # Always report, or the parent would wait forever
+        connection.close()
+        results.put((operation.__name__, timings, errors))
+
+
+def connect_ms(repeat=50):
+    """Median cost of opening a connection (what every request pays with CONN_MAX_AGE = 0)."""
+    timings = []
+    for _ in range(repeat):
+        connection.close()
+        started = time.perf_counter()
+        connection.ensure_connection()
+        timings.append(time.perf_counter() - started)
+    return statistics.median(timings) * 1000
+
+
+def db_concurrency(readers=4, duration=3.0, profiles=None):
+    """Room searches from `readers` processes while another one keeps booking, per SQLite setup.
+
+    Returns {profile: metrics}: read throughput and latency percentiles (a
+    reader that waits for the booking writer shows up in p99/max), booking
+    throughput, lock errors and the cost of opening a connection.
+    """
+    if connection.vendor != 'sqlite':
+        raise ValueError('db_concurrency() compares SQLite journal settings')
+    guest = User.objects.order_by('pk').first()
+    rooms = list(Room.objects.order_by('pk')[:20])
+    slots = count()
+    search_from = date.today() + timedelta(days=7)
+
+    def search():
+        check_in = search_from + timedelta(days=next(slots) % 60)
+        occupied = availability.occupied_room_ids(check_in, check_in + timedelta(days=3))
+        list(Room.objects.exclude(id__in=occupied).order_by('price_per_night', 'id').values_list('pk', flat=True)[:12])
+
+    def book():
+        # Every setup books after the previous one's stays (the forked writers don't share the counter)
+        slot = next(slots)
+        check_in = future + timedelta(days=2 * (slot // len(rooms)))
+        reservations.reserve(rooms[slot % len(rooms)], guest, check_in, check_in + timedelta(days=2), 1)
+
+    results = {}
+    for name, pragmas in (profiles or SQLITE_PROFILES).items():
+        future = max(
+            Booking.objects.aggregate(last=Max('check_out_date'))['last'] or date.today(),
+            date.today() + timedelta(days=6 * 365),
+        )
+        with sqlite_pragmas(pragmas):
+            # Processes, not threads: the GIL would serialize the readers and hide lock waits
+            connection.close()
+            context = multiprocessing.get_context('fork')
+            queue = context.Queue()
+            workers = [context.Process(target=_hammer, args=(search, duration, queue)) for _ in range(readers)]
+            workers.append(context.Process(target=_hammer, args=(book, duration, queue)))
+            for worker in workers:
+                worker.start()
+            reads, writes, errors = [], [], 0
+            for _ in workers:
+                operation, timings, failed = queue.get()
+                (reads if operation == 'search' else writes).extend(timings)
+                errors += failed
+            for worker in workers:
+                worker.join()
+            results[name] = {
+                'reads_per_s': round(len(reads) / duration, 1),
+                'read_p50_ms': round(_percentile(reads, 0.5) * 1000, 2),
+                'read_p99_ms': round(_percentile(reads, 0.99) * 1000, 2),
+                'read_max_ms': round(max(reads, default=0) * 1000, 2),
+                'writes_per_s': round(len(writes) / duration, 1),
+                'write_p50_ms': round(_percentile(writes, 0.5) * 1000, 2),
+                'lock_errors': errors,
+                'connect_ms': round(connect_ms(), 3),
+            }
+    return results
+
+
+def route_requests(fixture):
+    """url name -> (method, path, data) of one representative request, for every route in hotel/urls.py.
+
+    Values are callables, so bookings a request consumes are made fresh each time.
+    """
+    booking = Booking.objects.filter(user=fixture.guest).order_by('pk').first()
+    payment = Payment.objects.filter(booking__user=fixture.guest).order_by('pk').first()
+    if payment is None:
+        payment = Payment.objects.create(booking=booking, amount=booking.total_price, payment_method='kaspi',
+                                         transaction_id=f'BENCH-{booking.pk}')
+    search_from = date.today() + timedelta(days=7)
+
+    def unpaid_booking():
+        check_in, check_out = fixture.next_stay()
+        return reservations.reserve(fixture.room, fixture.guest, check_in, check_out, 1).pk
+
+    def new_stay():
+        check_in, check_out = fixture.next_stay()
+        return {'check_in_date': check_in.isoformat(), 'check_out_date': check_out.isoformat(), 'guests': 1}
+
+    def group_stay():
+        check_in, check_out = fixture.next_stay()
+        return json.dumps({'check_in': check_in.isoformat(), 'check_out': check_out.isoformat(), 'rooms': [fixture.room.pk]})
+
+    return {
+        'home': lambda: ('get', reverse('home'), None),
+        'about': lambda: ('get', reverse('about'), None),
+        'contact': lambda: ('get', reverse('contact'), None),
+        'register': lambda: ('get', reverse('register'), None),
+        'login': lambda: ('get', reverse('login'), None),
+        'logout': lambda: ('post', reverse('logout'), None),
+        'profile': lambda: ('get', reverse('profile'), None),
+        'room_list': lambda: ('get', reverse('room_list'), {
+            'check_in': search_from.isoformat(), 'check_out': (search_from + timedelta(days=3)).isoformat(),
+        }),
+        'room_detail': lambda: ('get', reverse('room_detail', kwargs={'pk': fixture.room.pk}), None),
+        'room_availability': lambda: ('get', reverse('room_availability'), {
+            'range': f'{search_from.isoformat()}/{(search_from + timedelta(days=2)).isoformat()}',
+        }),
+        'booking_create': lambda: ('post', reverse('booking_create', kwargs={'room_id': fixture.room.pk}), new_stay()),
+        'room_type_booking': lambda: ('get', reverse('room_type_booking'), None),
+        'group_booking': lambda: ('get', reverse('group_booking'), None),
+        'group_booking_api': lambda: ('post', reverse('group_booking_api'), group_stay()),
+        'booking_confirm': lambda: ('get', reverse('booking_confirm', kwargs={'pk': booking.pk}), None),
+        'payment_mock': lambda: ('post', reverse('payment_mock', kwargs={'booking_id': unpaid_booking()}), {'payment_method': 'kaspi'}),
+        'payment_status': lambda: ('get', reverse('payment_status', kwargs={'booking_id': booking.pk}), {'format': 'json'}),
+        'payment_success': lambda: ('get', reverse('payment_success', kwargs={'pk': payment.pk}), None),
+        'metrics': lambda: ('get', reverse('metrics'), None),
+    }
+
+
+def route_queries(setups=None):
+    """Queries per request for every route, anonymous and logged in, per session/user setup.
+
+    Returns {route: {setup: {'anonymous': n or None, 'user': n}}}. The anonymous
+    visitor carries a session cookie, so session loading is counted; pages that
+    require a login are skipped for it. Every request is measured after one
+    page view has filled the session and user caches, with a cold search cache.
+    """
+    fixture = Fixture()
+    requests = route_requests(fixture)
+    results = {}
+    for setup, overrides in (setups or AUTH_SETUPS).items():
+        # Middleware picks the session engine when it is loaded: a new client per setup
+        with override_settings(**overrides):
+            client = Client(SERVER_NAME=InProcessTarget.host())
+            for pattern in urls.urlpatterns:
+                login_required = issubclass(pattern.callback.view_class, LoginRequiredMixin)
+                row = results.setdefault(pattern.name, {})[setup] = {}
+                for visitor in ('anonymous', 'user'):
+                    if visitor == 'anonymous' and login_required:
+                        row[visitor] = None
+                        continue
+                    client.logout()
+                    if visitor == 'user':
+                        client.force_login(fixture.guest)
+                    else:
+                        client.session.save()  # a session cookie without a login
+                    client.get(reverse('about'))
+                    method, path, data = requests[pattern.name]()
+                    clear_search_cache()
+                    reset_queries()
+                    # A string is a JSON body (the JSON APIs)
+                    extra = {'content_type': 'application/json'} if isinstance(data, str) else {}
+                    with CaptureQueriesContext(connection) as queries:
+                        response = getattr(client, method)(path, data or {}, **extra)
+                    assert response.status_code < 400, (pattern.name, response.status_code)
+                    row[visitor] = len(queries)
+    return results
+
+
+# Room allocation policies compared by simulate_allocation() on a synthetic
+# demand stream: rooms picked by guests (a random free room), the first free
+# room, and best fit on the gaps around the stay (allocation.Schedule).
+STAY_LENGTHS = (1, 2, 3, 4, 5, 6, 7)
+STAY_WEIGHTS = (20, 25, 18, 12, 8, 7, 10)
+
+
+def allocation_demand(rooms, nights, load=1.1, seed=42):
+    """Requests (first night offset, nights) for `load` times the room-nights of `rooms` rooms over `nights` nights, in arrival order."""
+    rng = random.Random(seed)
+    demand, total = [], 0
+    while total < load * rooms * nights:
+        length = rng.choices(STAY_LENGTHS, STAY_WEIGHTS)[0]
+        demand.append((rng.randrange(nights - length + 1), length))
+        total += length
+    return demand
+
+
+def _guest_choice(rng):
+    def choose(schedule, check_in, check_out):
+        free = schedule.free_rooms(check_in, check_out)
+        if not free:
+            return None
+        # A uniformly random free room: the next free one from a random position
+        start = rng.randrange(len(schedule.room_ids))
+        higher = free >> start
+        position = start + allocation.lowest_bit(higher) if higher else allocation.lowest_bit(free)
+        return schedule.room_ids[position]
+    return choose
+
+
+def _first_fit(schedule, check_in, check_out):
+    free = schedule.free_rooms(check_in, check_out)
+    return schedule.room_ids[allocation.lowest_bit(free)] if free else None
+
+
+def _best_fit(schedule, check_in, check_out):
+    return schedule.best_fit(check_in, check_out)
+
+
+def simulate_allocation(rooms=2000, nights=60, load=1.1, seed=42):
+    """{policy: occupancy, rejected requests, orphan nights, µs per decision} of one demand stream."""
+    demand = allocation_demand(rooms, nights, load, seed)
+    start = date(2030, 1, 1)
+    policies = {'guest_choice': _guest_choice(random.Random(seed)), 'first_fit': _first_fit, 'best_fit': _best_fit}
+    results = {}
+    for name, choose in policies.items():
+        schedule = allocation.Schedule([(pk, 2) for pk in range(rooms)], start, start + timedelta(days=nights))
+        rejected, elapsed = 0, 0.0
+        for offset, length in demand:
+            check_in = start + timedelta(days=offset)
+            check_out = check_in + timedelta(days=length)
+            began = time.perf_counter()
+            room_id = choose(schedule, check_in, check_out)
+            elapsed += time.perf_counter() - began
+            if room_id is None:
+                rejected += 1
+            else:
+                schedule.add(room_id, check_in, check_out)
+        results[name] = {
+            'requests': len(demand),
+            'rejected': rejected,
+            'occupancy': round(schedule.taken_nights() / (rooms * nights), 4),
+            'orphan_nights': schedule.orphan_nights(),
+            'us_per_decision': round(elapsed / len(demand) * 1e6, 1),
+        }
+    return results
@@ -0,0 +1,126 @@
+import logging
+import time
+import uuid
+
+from django.db import IntegrityError, connection, transaction
+from django.utils import timezone
+
+from . import availability, reservations, rollups, search_cache
+from .models import Booking, Payment
+
+# Bulk booking status transitions (admin actions, `manage.py set_booking_status`).
+# Bookings are walked by primary key in chunks; every chunk is its own short
+# transaction that updates the status, completes or creates the payments and
+# refreshes the derived data (claimed nights, availability index, rollups,
+# search cache) before committing. On SQLite the write lock is released
+# between chunks, so bookings from the site keep going through during a
+# large back-office run.
+
+logger = logging.getLogger(__name__)
+
+STATUSES = ('paid', 'cancelled')
+
+
+def default_chunk_size():
+    # SQLite has a single writer: keep its transactions short
+    return 500 if connection.vendor == 'sqlite' else 2000
+
+
+class BulkResult:
+    def __init__(self, total):
+        self.total = total
+        self.updated = 0
+        self.payments = 0
+        self.skipped = 0
+        self.chunks = 0
+        self.seconds = 0.0
+
+    @property
+    def done(self):
+        return self.updated + self.skipped
+
+    @property
+    def rate(self):
+        return self.done / self.seconds if self.seconds else 0.0
+
+
+def sync_derived(bookings):
+    """Refreshes everything derived from bookings after a queryset.update() that skipped signals."""
+    reservations.sync_bookings(bookings)
+    availability.refresh_bookings(bookings)
+    rollups.refresh_bookings(bookings)
+    search_cache.invalidate_bookings(bookings)
+
+
+def complete_payments(booking_ids, payment_method):
+    """Marks the payments of the bookings completed, creating the missing ones in one bulk insert."""
+    Payment.objects.filter(booking_id__in=booking_ids).exclude(status='completed').update(status='completed')
+    paid = set(Payment.objects.filter(booking_id__in=booking_ids).values_list('booking_id', flat=True))
+    created = Payment.objects.bulk_create([
+        Payment(
+            booking_id=pk,
+            amount=total_price,
+            transaction_id=f'BULK-{payment_method.upper()}-{uuid.uuid4().hex[:12]}',
+            payment_method=payment_method,
+            status='completed',
+        )
+        for pk, total_price in Booking.objects.filter(pk__in=booking_ids).exclude(pk__in=paid).values_list('pk', 'total_price')
+    ])
+    return len(created)
+
+
+def _apply(booking_ids, status, payment_method):
+    bookings = Booking.objects.filter(pk__in=booking_ids)
+    with transaction.atomic():
+        updated = bookings.update(status=status, updated_at=timezone.now())
+        payments = complete_payments(booking_ids, payment_method) if status == 'paid' else 0
+        # Re-activating a cancelled booking whose nights were taken meanwhile raises IntegrityError here
+        sync_derived(bookings)
+    return updated, payments
+
+
+def transition(bookings, status, chunk_size=None, payment_method='mock', progress=None):
+    """Moves the given bookings to `status` in chunks of short transactions.
+
+    progress(result) is called after every chunk. Bookings that cannot be
+    re-activated because another booking holds their nights are left as
+    they are and counted in result.skipped.
+    """
+    if status not in STATUSES:
+        raise ValueError(f'unsupported status: {status}')
+    chunk_size = chunk_size or default_chunk_size()
+    if connection.features.max_query_params:
+        chunk_size = min(chunk_size, connection.features.max_query_params)
+    todo = bookings.exclude(status=status).order_by('pk')
+    result = BulkResult(todo.count())
+    started = time.perf_counter()
+    last_pk = 0
+
+    while True:
+        booking_ids = list(todo.filter(pk__gt=last_pk).values_list('pk', flat=True)[:chunk_size])
+        if not booking_ids:
+            break
+        try:
+            updated, payments = _apply(booking_ids, status, payment_method)
+        except IntegrityError:
+            # Retry the chunk one booking at a time so only the conflicting ones are skipped
+            updated = payments = 0
+            for pk in booking_ids:
+                try:
+                    one_updated, one_payments = _apply([pk], status, payment_method)
+                except IntegrityError:
+                    result.skipped += 1
+                else:
+                    updated += one_updated
+                    payments += one_payments
+        last_pk = booking_ids[-1]
+        result.updated += updated
+        result.payments += payments
+        result.chunks += 1
+        result.seconds = time.perf_counter() - started
+        logger.info('Bookings -> %s: %s/%s (%.0f/s)', status, result.done, result.total, result.rate)
+        if progress:
+            progress(result)
+
+    result.seconds = time.perf_counter() - started
+    return result
@@ -1,8 +1,21 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm
-from .models import CustomUser, Booking
+from .availability import MAX_STAY_NIGHTS, horizon
+from .group_bookings import ALL_OR_NOTHING, BEST_EFFORT, MAX_ROOMS
+from .models import CustomUser, Booking, RatePlan, Room
 from datetime import date, timedelta
 
+def clean_stay(cleaned_data):
+    check_in_date = cleaned_data.get('check_in_date')
+    check_out_date = cleaned_data.get('check_out_date')
+    if check_in_date and check_out_date:
+        if check_in_date >= check_out_date:
+            raise forms.ValidationError("Дата выезда должна быть позже даты заезда.")
+        if (check_out_date - check_in_date).days > MAX_STAY_NIGHTS:
+            raise forms.ValidationError(f"Бронирование не может быть длиннее {MAX_STAY_NIGHTS} ночей.")
+        if check_out_date > horizon():
+            raise forms.ValidationError(f"Бронирование возможно не позже {horizon():%d.%m.%Y}.")
+
 class CustomUserCreationForm(UserCreationForm):
     phone_number = forms.CharField(max_length=15, required=False, label="Номер телефона")
     
@@ -39,11 +52,77 @@ class BookingForm(forms.ModelForm):
 
     def clean(self):
         cleaned_data = super().clean()
-        check_in_date = cleaned_data.get('check_in_date')
-        check_out_date = cleaned_data.get('check_out_date')
-        
-        if check_in_date and check_out_date:
-            if check_in_date >= check_out_date:
-                raise forms.ValidationError("Дата выезда должна быть позже даты заезда.")
-        
+        clean_stay(cleaned_data)
+        return cleaned_data
+
+class RoomTypeBookingForm(forms.Form):
+    check_in_date = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'min': date.today().isoformat()}),
+        label="Дата заезда"
+    )
+    check_out_date = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'min': (date.today() + timedelta(days=1)).isoformat()}),
+        label="Дата выезда"
+    )
+    room_type = forms.ChoiceField(choices=Room.ROOM_TYPES, label="Тип номера")
+    guests = forms.IntegerField(min_value=1, initial=1, label="Количество гостей")
+
+    def clean(self):
+        cleaned_data = super().clean()
+        clean_stay(cleaned_data)
+        return cleaned_data
+
+class GroupBookingForm(forms.Form):
+    check_in_date = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'min': date.today().isoformat()}),
+        label="Дата заезда"
+    )
+    check_out_date = forms.DateField(
+        widget=forms.DateInput(attrs={'type': 'date', 'min': (date.today() + timedelta(days=1)).isoformat()}),
+        label="Дата выезда"
+    )
+    rooms = forms.CharField(
+        label="Номера комнат", help_text=f"Через запятую или пробел, не больше {MAX_ROOMS}.",
+        widget=forms.TextInput(attrs={'placeholder': '101, 102, 201'}),
+    )
+    guests = forms.IntegerField(min_value=1, initial=1, label="Гостей в каждом номере")
+    mode = forms.ChoiceField(
+        choices=[(ALL_OR_NOTHING, 'Все номера или ни одного'), (BEST_EFFORT, 'Свободные из списка')],
+        initial=ALL_OR_NOTHING, widget=forms.RadioSelect, label="Если часть номеров занята",
+    )
+
+    def clean_rooms(self):
+        numbers = list(dict.fromkeys(self.cleaned_data['rooms'].replace(',', ' ').split()))
+        if not numbers:
+            raise forms.ValidationError("Укажите хотя бы один номер.")
+        if len(numbers) > MAX_ROOMS:
+            raise forms.ValidationError(f"Не больше {MAX_ROOMS} номеров за раз.")
+        rooms = {room.number: room for room in Room.objects.filter(number__in=numbers)}
+        unknown = [number for number in numbers if number not in rooms]
+        if unknown:
+            raise forms.ValidationError(f"Нет таких номеров: {', '.join(unknown)}.")
+        return [rooms[number] for number in numbers]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        clean_stay(cleaned_data)
         return cleaned_data
+
+class RatePlanForm(forms.ModelForm):
+    # RatePlan.weekdays is a bitmask; staff tick the days instead
+    weekdays = forms.TypedMultipleChoiceField(
+        choices=RatePlan.WEEKDAYS, coerce=int, widget=forms.CheckboxSelectMultiple, label="Дни недели",
+        initial=[day for day, _ in RatePlan.WEEKDAYS],
+    )
+
+    class Meta:
+        model = RatePlan
+        fields = '__all__'
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.initial['weekdays'] = [day for day, _ in RatePlan.WEEKDAYS if self.instance.weekdays >> day & 1]
+
+    def clean_weekdays(self):
+        return sum(1 << day for day in set(self.cleaned_data['weekdays']))
@@ -0,0 +1,224 @@
+import re
+
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+# Full-text search on SQLite FTS5. Every index is an FTS5 table keyed by the
+# rowid of its source row and kept in sync by SQLite triggers, so saves,
+# bulk_create(), queryset.update() and raw SQL all reach it without signals.
+# Migration 0016 creates the tables and triggers and fills them. A later
+# migration that rebuilds a source table drops its triggers and the index goes
+# stale silently, so every migrate ends with check_triggers() (signals.py),
+# which fails until install() / rebuild_search_index puts them back.
+#
+# Rooms use word tokens with prefix matching ("балкон" finds "Балконом") for
+# the public keyword search. Staff lookups (guests, employees) use the
+# trigram tokenizer: any fragment of 3+ characters matches, like the admin's
+# LIKE '%term%' but from an index. Phone numbers are indexed as digits only,
+# so "+7 (701) 123" and "701123" find the same guest. Results are ranked with
+# bm25(); on other databases, or for terms FTS5 cannot answer, callers fall
+# back to their regular LIKE search.
+
+PHONE_DIGITS = (
+    "replace(replace(replace(replace(replace(replace(coalesce({0}, ''), ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', '')"
+)
+
+
+class Index:
+    def __init__(self, table, source, fields, columns, tokenize, weights):
+        self.table = table
+        self.source = source
+        self.fields = fields  # source columns the index is built from
+        self.columns = columns  # {fts column: SQL expression over the source row}
+        self.tokenize = tokenize
+        self.weights = weights
+
+    @property
+    def triggers(self):
+        return [f'{self.table}_{event}' for event in ('insert', 'update', 'delete')]
+
+    @property
+    def trigram(self):
+        return self.tokenize.startswith('trigram')
+
+    def values(self, row):
+        return ', '.join([f'{row}.id'] + [expression.format(row) for expression in self.columns.values()])
+
+    def create_sql(self):
+        names = ', '.join(self.columns)
+        return [
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS {self.table} USING fts5({names}, tokenize='{self.tokenize}')",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_insert AFTER INSERT ON {self.source} BEGIN "
+            f"INSERT INTO {self.table}(rowid, {names}) VALUES ({self.values('new')}); END",
+            # Only changes of the indexed columns touch the index (not a price edit or a login)
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_update AFTER UPDATE OF {', '.join(self.fields)} ON {self.source} BEGIN "
+            f"DELETE FROM {self.table} WHERE rowid = old.id; "
+            f"INSERT INTO {self.table}(rowid, {names}) VALUES ({self.values('new')}); END",
+            f"CREATE TRIGGER IF NOT EXISTS {self.table}_delete AFTER DELETE ON {self.source} BEGIN "
+            f"DELETE FROM {self.table} WHERE rowid = old.id; END",
+        ]
+
+    def fill_sql(self):
+        return [
+            f'DELETE FROM {self.table}',
+            f'INSERT INTO {self.table}(rowid, {", ".join(self.columns)}) SELECT {self.values(self.source)} FROM {self.source}',
+        ]
+
+    def rank_sql(self):
+        return f'bm25({self.table}, {", ".join(str(weight) for weight in self.weights)})'
+
+
+ROOMS = Index(
+    'hotel_room_fts', 'hotel_room', ['number', 'description', 'amenities'],
+    {'number': '{0}.number', 'description': '{0}.description', 'amenities': '{0}.amenities'},
+    'unicode61 remove_diacritics 2', weights=(10.0, 1.0, 3.0),
+)
+USERS = Index(
+    'hotel_user_fts', 'hotel_customuser', ['username', 'first_name', 'last_name', 'email', 'phone_number'],
+    {
+        'username': '{0}.username',
+        'full_name': "trim({0}.first_name || ' ' || {0}.last_name)",
+        'email': '{0}.email',
+        'phone': PHONE_DIGITS.format('{0}.phone_number'),
+    },
+    'trigram', weights=(5.0, 3.0, 2.0, 2.0),
+)
+EMPLOYEES = Index(
+    'hotel_employee_fts', 'hotel_employee', ['full_name', 'email', 'phone_number'],
+    {'full_name': '{0}.full_name', 'email': '{0}.email', 'phone': PHONE_DIGITS.format('{0}.phone_number')},
+    'trigram', weights=(3.0, 2.0, 2.0),
+)
+INDEXES = (ROOMS, USERS, EMPLOYEES)
+
+PHONE_TERM = re.compile(r'^\+?[\d\s()\-.]*\d[\d\s()\-.]*$')
+WORD = re.compile(r'\w+')
+
+
+def supported(using=DEFAULT_DB_ALIAS):
+    connection = connections[using]
+    # MATERIALIZED common table expressions (see search()) need SQLite 3.35
+    return connection.vendor == 'sqlite' and connection.Database.sqlite_version_info >= (3, 35)
+
+
+class MissingTriggers(Exception):
+    pass
+
+
+def _existing(cursor, kind='table'):
+    cursor.execute('SELECT name FROM sqlite_master WHERE type = %s', [kind])
+    return {name for (name,) in cursor.fetchall()}
+
+
+def missing_triggers(using=DEFAULT_DB_ALIAS):
+    """Sync triggers absent from indexes whose FTS table exists (a rebuilt source table loses them)."""
+    if not supported(using):
+        return []
+    with connections[using].cursor() as cursor:
+        tables, triggers = _existing(cursor), _existing(cursor, 'trigger')
+    return [name for index in INDEXES if index.table in tables for name in index.triggers if name not in triggers]
+
+
+def check_triggers(using=DEFAULT_DB_ALIAS):
+    """Raises MissingTriggers when an index no longer follows its table."""
+    missing = missing_triggers(using)
+    if missing:
+        raise MissingTriggers(
+            f'Search index triggers are missing: {", ".join(missing)}. A migration rebuilt their table; '
+            f'run "manage.py rebuild_search_index" to re-create them and refill the indexes.'
+        )
+
+
+def install(using=DEFAULT_DB_ALIAS):
+    """Creates missing FTS tables and triggers; new tables are filled from their source. Returns the new tables."""
+    if not supported(using):
+        return []
+    created = []
+    with connections[using].cursor() as cursor:
+        existing = _existing(cursor)
+        for index in INDEXES:
+            if index.source not in existing:
+                continue
+            for statement in index.create_sql():
+                cursor.execute(statement)
+            if index.table not in existing:
+                for statement in index.fill_sql():
+                    cursor.execute(statement)
+                created.append(index.table)
+    return created
+
+
+def rebuild(using=DEFAULT_DB_ALIAS):
+    """Refills every index from its source table; returns {table: rows}."""
+    install(using)
+    counts = {}
+    with connections[using].cursor() as cursor:
+        for index in INDEXES:
+            for statement in index.fill_sql():
+                cursor.execute(statement)
+            cursor.execute(f'SELECT count(*) FROM {index.table}')
+            counts[index.table] = cursor.fetchone()[0]
+    return counts
+
+
+def verify(using=DEFAULT_DB_ALIAS):
+    """[(table, indexed rows, source rows)] of the indexes that are out of sync."""
+    mismatches = []
+    with connections[using].cursor() as cursor:
+        for index in INDEXES:
+            cursor.execute(
+                f'SELECT (SELECT count(*) FROM {index.table}), (SELECT count(*) FROM {index.source}), '
+                f'(SELECT count(*) FROM {index.source} WHERE id NOT IN (SELECT rowid FROM {index.table}))'
+            )
+            indexed, total, missing = cursor.fetchone()
+            if indexed != total or missing:
+                mismatches.append((index.table, indexed, total))
+    return mismatches
+
+
+def _quote(term):
+    return '"' + term.replace('"', '""') + '"'
+
+
+def match_expression(index, text):
+    """FTS5 query for free text (every term must match), or None when the index cannot answer it."""
+    text = (text or '').strip()
+    if index.trigram:
+        if PHONE_TERM.match(text):
+            # Digits split by spaces ("701 123 45") are one phone number
+            text = re.sub(r'\D', '', text)
+        terms = []
+        for term in text.split():
+            if PHONE_TERM.match(term):
+                term = re.sub(r'\D', '', term)
+            if len(term) < 3:
+                # Trigrams need 3 characters; shorter terms go to the LIKE search
+                return None
+            terms.append(_quote(term))
+    else:
+        terms = [_quote(word) + '*' for word in WORD.findall(text)]
+    return ' '.join(terms) or None
+
+
+def matches(index, text, column='id', using=DEFAULT_DB_ALIAS):
+    """Q for rows whose `column` is the rowid of a match, or None when FTS cannot be used."""
+    expression = match_expression(index, text)
+    if expression is None or not supported(using):
+        return None
+    return Q(**{f'{column}__in': RawSQL(f'SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s', [expression])})
+
+
+def search(queryset, index, text):
+    """Matching rows of `queryset` annotated with `search_rank` (bm25, lower is better); None if FTS cannot be used."""
+    condition = matches(index, text, using=queryset.db)
+    if condition is None:
+        return None
+    table = queryset.model._meta.db_table
+    # A plain correlated bm25() subquery re-runs the MATCH for every row (1.4 s
+    # for 3800 matches of 9700 rooms); the MATERIALIZED CTE runs it once per
+    # query and the rank is looked up by rowid (13 ms)
+    return queryset.filter(condition).annotate(search_rank=RawSQL(
+        f'WITH ranked AS MATERIALIZED (SELECT rowid AS id, {index.rank_sql()} AS rank FROM {index.table} '
+        f'WHERE {index.table} MATCH %s) SELECT rank FROM ranked WHERE ranked.id = "{table}"."id"',
+        [match_expression(index, text)], output_field=FloatField(),
+    ))
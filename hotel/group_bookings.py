@@ -0,0 +1,117 @@
+import random
+import time
+from decimal import Decimal
+
+from django.db import IntegrityError, OperationalError, transaction
+
+from . import availability, rates, reservations, rollups, search_cache
+from .models import Booking, RoomNight
+
+# Group bookings: many rooms for the same dates in one request, for groups
+# and corporate clients. Instead of one reserve() per room (an availability
+# check, an insert and the signal bookkeeping each), the whole group costs a
+# fixed handful of queries:
+#
+#   one availability check for all rooms (claimed nights, on the unique
+#   (room, night) index), one quote calendar for all prices, one bulk insert
+#   of the bookings and one of their nights, and batched updates of the
+#   availability index and the rollups.
+#
+# The (room, night) unique constraint still arbitrates races: if another
+# booking takes a night between the check and the insert, the transaction
+# rolls back and the group is checked again. In all-or-nothing mode any
+# unavailable room fails the whole group; in best-effort mode the free rooms
+# are booked and the others are reported.
+
+MAX_ROOMS = 50
+ALL_OR_NOTHING = 'all'
+BEST_EFFORT = 'partial'
+MODES = (ALL_OR_NOTHING, BEST_EFFORT)
+
+
+class GroupUnavailable(reservations.RoomUnavailable):
+    """Nothing was booked; `rooms` are the rooms that are taken or too small for the guests."""
+
+    def __init__(self, rooms):
+        super().__init__([room.number for room in rooms])
+        self.rooms = rooms
+
+
+class GroupResult:
+    def __init__(self, bookings, unavailable):
+        self.bookings = bookings
+        self.unavailable = unavailable
+
+    @property
+    def total(self):
+        return sum((booking.total_price for booking in self.bookings), Decimal('0.00'))
+
+
+def taken_room_ids(room_ids, check_in, check_out):
+    """Rooms with at least one claimed night in the stay, in one query."""
+    return set(
+        RoomNight.objects.filter(room_id__in=room_ids, night__gte=check_in, night__lt=check_out)
+        .values_list('room_id', flat=True).distinct()
+    )
+
+
+def _claim(user, rooms, check_in, check_out, guests, calendar, fields):
+    bookings = [
+        Booking(
+            user=user, room=room, check_in_date=check_in, check_out_date=check_out, guests=guests,
+            total_price=calendar.quote(room.pk, check_in, check_out).total, **fields,
+        )
+        for room in rooms
+    ]
+    nights = reservations.stay_nights(check_in, check_out)
+    with transaction.atomic():
+        # bulk_create() skips the Booking signals: claim the nights and update the derived data here
+        Booking.objects.bulk_create(bookings)
+        RoomNight.objects.bulk_create(
+            [RoomNight(room_id=booking.room_id, night=night, booking=booking) for booking in bookings for night in nights]
+        )
+        availability.add_stays([(booking.room_id, check_in, check_out) for booking in bookings])
+        rollups.record_created([rollups.state(booking) for booking in bookings], {room.pk: room.room_type for room in rooms})
+    for room_type in {room.room_type for room in rooms}:
+        search_cache.invalidate_stay(room_type, check_in, check_out)
+    return bookings
+
+
+def reserve_group(user, rooms, check_in, check_out, guests=1, mode=ALL_OR_NOTHING, **fields):
+    """Books every room of `rooms` (Room instances) for the same stay as pending bookings.
+
+    All-or-nothing raises GroupUnavailable and books nothing unless every
+    room is free and takes `guests`; best-effort books the rooms that do
+    and lists the others in result.unavailable. Transient lock errors are
+    retried like in reserve().
+    """
+    if check_out <= check_in:
+        raise ValueError('check_out must be after check_in')
+    if mode not in MODES:
+        raise ValueError(f'unknown mode: {mode}')
+    rooms = list({room.pk: room for room in rooms}.values())
+    if not 0 < len(rooms) <= MAX_ROOMS:
+        raise ValueError(f'a group books 1 to {MAX_ROOMS} rooms')
+
+    calendar = rates.RateCalendar(rates.room_rows(rooms), check_in, check_out)
+    too_small = {room.pk for room in rooms if room.max_guests < guests}
+    delay = reservations.RETRY_DELAY
+    for attempt in range(1, reservations.MAX_ATTEMPTS + 1):
+        refused = too_small | taken_room_ids([room.pk for room in rooms], check_in, check_out)
+        unavailable = [room for room in rooms if room.pk in refused]
+        if unavailable and mode == ALL_OR_NOTHING:
+            raise GroupUnavailable(unavailable)
+        wanted = [room for room in rooms if room.pk not in refused]
+        if not wanted:
+            return GroupResult([], unavailable)
+        try:
+            return GroupResult(_claim(user, wanted, check_in, check_out, guests, calendar, fields), unavailable)
+        except IntegrityError:
+            # A night was taken after the check: the next check sees it
+            if attempt == reservations.MAX_ATTEMPTS:
+                raise GroupUnavailable(wanted)
+        except OperationalError as exc:
+            if attempt == reservations.MAX_ATTEMPTS or not reservations.is_lock_error(exc):
+                raise
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
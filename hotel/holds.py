@@ -0,0 +1,167 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from . import bulk_status, performance
+from .models import Booking
+
+# Expiry of unpaid booking holds. A pending booking claims its nights like a
+# paid one, so an abandoned checkout would keep the room sold out forever.
+# A hold lasts settings.BOOKING_HOLD_MINUTES from the creation of the booking;
+# sweep() then moves it to 'expired' and releases its nights. Bookings whose
+# payment is queued or being charged are left alone until the job finishes.
+#
+# The sweeper walks the candidates along booking_hold_expiry_idx
+# (status, created_at) in chunks of short transactions, like the bulk status
+# changes, so the site keeps booking while it runs. It is started by
+# `manage.py expire_holds` (cron or --loop) or by the in-process scheduler
+# (settings.BOOKING_HOLD_SWEEP_INTERVAL).
+
+logger = logging.getLogger(__name__)
+
+IN_FLIGHT = ('queued', 'processing')
+
+
+def hold_ttl():
+    return timedelta(minutes=getattr(settings, 'BOOKING_HOLD_MINUTES', 30))
+
+
+def expires_at(booking):
+    return booking.created_at + hold_ttl()
+
+
+def expired(now=None):
+    """Pending bookings whose hold has run out and whose payment is not in progress."""
+    cutoff = (now or timezone.now()) - hold_ttl()
+    return Booking.objects.filter(status='pending', created_at__lt=cutoff).exclude(payment_jobs__status__in=IN_FLIGHT)
+
+
+class SweepResult:
+    def __init__(self):
+        self.bookings = 0
+        self.nights = 0
+        self.room_ids = set()
+        self.chunks = 0
+        self.seconds = 0.0
+
+    @property
+    def rooms(self):
+        return len(self.room_ids)
+
+    def add(self, stays):
+        for room_id, check_in, check_out in stays:
+            self.bookings += 1
+            self.nights += (check_out - check_in).days
+            self.room_ids.add(room_id)
+
+
+def _expire(booking_ids, now):
+    """Expires the bookings of one chunk that still qualify; returns their (room, check-in, check-out)."""
+    stamp = timezone.now()
+    with transaction.atomic():
+        # The UPDATE repeats the expiry condition: a booking paid or queued for
+        # payment since the chunk was read is not touched
+        updated = Booking.objects.filter(
+            pk__in=expired(now).filter(pk__in=booking_ids).values('pk'),
+        ).update(status='expired', updated_at=stamp)
+        if not updated:
+            return []
+        stays = list(
+            Booking.objects.filter(pk__in=booking_ids, status='expired', updated_at=stamp)
+            .values_list('room_id', 'check_in_date', 'check_out_date')
+        )
+        bulk_status.sync_derived(Booking.objects.filter(pk__in=booking_ids))
+    return stays
+
+
+def _record_metrics(result):
+    registry = performance.registry
+    registry.count('hotel_hold_sweeps_total', 'Runs of the expired hold sweeper.')
+    registry.count('hotel_hold_expired_bookings_total', 'Pending bookings expired by the sweeper.', result.bookings)
+    registry.count('hotel_hold_released_nights_total', 'Room nights released by expired holds.', result.nights)
+    registry.count('hotel_hold_released_rooms_total', 'Rooms with released nights, summed over runs.', result.rooms)
+    registry.count('hotel_hold_sweep_seconds_total', 'Time spent sweeping expired holds.', result.seconds)
+
+
+def sweep(chunk_size=None, now=None, dry_run=False, progress=None):
+    """Expires the holds that ran out before `now` in chunks; returns a SweepResult.
+
+    With dry_run nothing is changed and the result shows what would be released.
+    progress(result) is called after every chunk.
+    """
+    now = now or timezone.now()
+    chunk_size = chunk_size or bulk_status.default_chunk_size()
+    if connection.features.max_query_params:
+        chunk_size = min(chunk_size, connection.features.max_query_params)
+    candidates = expired(now).order_by('created_at', 'pk')
+    result = SweepResult()
+    started = time.perf_counter()
+
+    if dry_run:
+        result.add(candidates.values_list('room_id', 'check_in_date', 'check_out_date').iterator(chunk_size=chunk_size))
+        result.seconds = time.perf_counter() - started
+        return result
+
+    last = None
+    while True:
+        chunk = candidates
+        if last:
+            chunk = chunk.filter(Q(created_at__gt=last[0]) | Q(created_at=last[0], pk__gt=last[1]))
+        rows = list(chunk.values_list('created_at', 'pk')[:chunk_size])
+        if not rows:
+            break
+        result.add(_expire([pk for _, pk in rows], now))
+        last = rows[-1]
+        result.chunks += 1
+        result.seconds = time.perf_counter() - started
+        if progress:
+            progress(result)
+
+    result.seconds = time.perf_counter() - started
+    _record_metrics(result)
+    if result.bookings:
+        logger.info('Expired %s holds: %s nights in %s rooms released in %.2fs',
+                    result.bookings, result.nights, result.rooms, result.seconds)
+    return result
+
+
+# In-process scheduler
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def _run_scheduler(interval, stop):
+    while not stop.wait(interval):
+        try:
+            sweep()
+        except Exception:
+            logger.exception('Hold sweep failed')
+        finally:
+            # The thread has its own connection; don't keep it open between runs
+            connections.close_all()
+
+
+def start_scheduler(interval=None):
+    """Sweeps every `interval` seconds (settings.BOOKING_HOLD_SWEEP_INTERVAL) on a daemon thread.
+
+    Does nothing when the interval is not set; returns the stop event of the
+    running scheduler otherwise.
+    """
+    global _scheduler
+    interval = interval or getattr(settings, 'BOOKING_HOLD_SWEEP_INTERVAL', None)
+    if not interval:
+        return None
+    with _scheduler_lock:
+        if _scheduler is None or not _scheduler[0].is_alive():
+            stop = threading.Event()
+            thread = threading.Thread(target=_run_scheduler, args=(interval, stop), name='hold-sweeper', daemon=True)
+            thread.start()
+            _scheduler = (thread, stop)
+        return _scheduler[1]
@@ -0,0 +1,229 @@
+import asyncio
+import random
+import statistics
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import date, timedelta
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+
+from .models import Booking, Room
+
+# Load-test harness: builds a request mix over the routes of hotel/urls.py,
+# replays it from several threads either in-process (Django test client, no
+# network) or against a running server, and reports latency percentiles per
+# route. run_async() replays the same plan through the ASGI handler from
+# coroutines on one event loop (with the async search views of ASGI_URLCONF),
+# to compare the WSGI and ASGI code paths.
+
+DEFAULT_ROUTES = ('home', 'room_list', 'room_search', 'room_detail', 'room_availability', 'profile', 'booking_confirm')
+ANONYMOUS_ROUTES = ('home', 'about', 'contact', 'room_list', 'room_search', 'room_detail', 'room_availability')
+
+
+def percentile(sorted_samples, fraction):
+    if not sorted_samples:
+        return 0.0
+    index = min(len(sorted_samples) - 1, max(0, round(fraction * len(sorted_samples)) - 1))
+    return sorted_samples[index]
+
+
+def summarize(samples):
+    """Latency summary in milliseconds for a list of seconds."""
+    ordered = sorted(samples)
+    return {
+        'count': len(ordered),
+        'mean_ms': statistics.fmean(ordered) * 1000 if ordered else 0.0,
+        'p50_ms': percentile(ordered, 0.50) * 1000,
+        'p95_ms': percentile(ordered, 0.95) * 1000,
+        'p99_ms': percentile(ordered, 0.99) * 1000,
+        'max_ms': ordered[-1] * 1000 if ordered else 0.0,
+    }
+
+
+class RequestMix:
+    """Generates (route, path, query) requests with realistic parameters from the current database."""
+
+    def __init__(self, seed=1, sample_size=500):
+        self.rng = random.Random(seed)
+        self.room_ids = list(Room.objects.order_by('?').values_list('pk', flat=True)[:sample_size])
+        self.user = get_user_model().objects.filter(bookings__isnull=False).order_by('pk').first()
+        self.booking_ids = list(Booking.objects.filter(user=self.user).values_list('pk', flat=True)[:sample_size]) if self.user else []
+
+    def search_dates(self):
+        check_in = date.today() + timedelta(days=self.rng.choice([0, 0, 1, 2, 5, 7, 14, 30, 60]))
+        return check_in, check_in + timedelta(days=self.rng.choice([1, 1, 2, 2, 3, 5, 7]))
+
+    def request(self, route):
+        if route == 'room_search':
+            check_in, check_out = self.search_dates()
+            query = {'check_in': check_in.isoformat(), 'check_out': check_out.isoformat()}
+            if self.rng.random() < 0.5:
+                query['room_type'] = self.rng.choice([key for key, _ in Room.ROOM_TYPES])
+            if self.rng.random() < 0.3:
+                query['max_guests'] = str(self.rng.randint(1, 4))
+            return reverse('room_list'), query
+        if route == 'room_detail':
+            return reverse('room_detail', kwargs={'pk': self.rng.choice(self.room_ids)}), {}
+        if route == 'room_availability':
+            month = date.today().replace(day=1) + timedelta(days=32 * self.rng.randint(0, 3))
+            return reverse('room_availability'), {'month': f'{month:%Y-%m}'}
+        if route == 'booking_confirm':
+            return reverse('booking_confirm', kwargs={'pk': self.rng.choice(self.booking_ids)}), {}
+        return reverse(route), {}
+
+    def build(self, routes, requests_per_route):
+        routes = [route for route in routes if self.available(route)]
+        plan = [(route, *self.request(route)) for route in routes for _ in range(requests_per_route)]
+        self.rng.shuffle(plan)
+        return plan
+
+    def available(self, route):
+        if route == 'room_detail' and not self.room_ids:
+            return False
+        if route == 'booking_confirm' and not self.booking_ids:
+            return False
+        if route in ('profile', 'booking_confirm') and not self.user:
+            return False
+        return True
+
+
+class InProcessTarget:
+    """Drives the views through Django's test client, one client per thread."""
+
+    def __init__(self, user=None):
+        self.user = user
+        self.local = threading.local()
+
+    @staticmethod
+    def host():
+        # Any concrete host that passes ALLOWED_HOSTS; with an empty list DEBUG allows localhost
+        hosts = [host for host in settings.ALLOWED_HOSTS if host != '*' and not host.startswith('.')]
+        return hosts[0] if hosts else 'localhost'
+
+    def client(self):
+        if not hasattr(self.local, 'client'):
+            client = Client(SERVER_NAME=self.host())
+            if self.user is not None:
+                client.force_login(self.user)
+            self.local.client = client
+        return self.local.client
+
+    def get(self, path, query):
+        return self.client().get(path, query).status_code
+
+    def close(self):
+        connections.close_all()
+
+
+class AsyncInProcessTarget:
+    """Drives the views through Django's ASGI handler (AsyncClient), one client per coroutine."""
+
+    def __init__(self, user=None):
+        self.user = user
+
+    async def client(self):
+        client = AsyncClient()
+        if self.user is not None:
+            await client.aforce_login(self.user)
+        return client
+
+
+class HttpTarget:
+    """Drives a running server (runserver, gunicorn, uvicorn, ...) over HTTP; anonymous routes only."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def get(self, path, query):
+        url = self.base_url + path
+        if query:
+            url += '?' + urllib.parse.urlencode(query)
+        try:
+            with urllib.request.urlopen(url, timeout=30) as response:
+                response.read()
+                return response.status
+        except urllib.error.HTTPError as exc:
+            return exc.code
+
+    def close(self):
+        pass
+
+
+def run(plan, target, concurrency):
+    """Replays the plan from `concurrency` threads (WSGI path). Returns (per-route results, wall seconds)."""
+    timings, errors = {}, {}
+    lock = threading.Lock()
+    jobs = iter(plan)
+
+    def worker():
+        try:
+            while True:
+                with lock:
+                    job = next(jobs, None)
+                if job is None:
+                    return
+                route, path, query = job
+                started = time.perf_counter()
+                try:
+                    status = target.get(path, query)
+                except Exception:
+                    status = 599  # the request blew up inside the harness/app
+                elapsed = time.perf_counter() - started
+                with lock:
+                    timings.setdefault(route, []).append(elapsed)
+                    if status >= 400:
+                        errors[route] = errors.get(route, 0) + 1
+        finally:
+            target.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return _results(timings, errors), time.perf_counter() - started
+
+
+def run_async(plan, target, concurrency):
+    """ASGI counterpart of run(): `concurrency` coroutines share one event loop."""
+    timings, errors = {}, {}
+    jobs = iter(plan)
+
+    async def worker():
+        client = await target.client()
+        for route, path, query in jobs:
+            started = time.perf_counter()
+            try:
+                status = (await client.get(path, query)).status_code
+            except Exception:
+                status = 599
+            timings.setdefault(route, []).append(time.perf_counter() - started)
+            if status >= 400:
+                errors[route] = errors.get(route, 0) + 1
+
+    async def main():
+        started = time.perf_counter()
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+        return time.perf_counter() - started
+
+    # AsyncClient always sends Host: testserver; the URLs are the ones asgi.py serves
+    with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], ROOT_URLCONF=settings.ASGI_URLCONF):
+        wall = asyncio.run(main())
+    connections.close_all()
+    return _results(timings, errors), wall
+
+
+def _results(timings, errors):
+    results = {}
+    for route, samples in sorted(timings.items()):
+        results[route] = summarize(samples)
+        results[route]['errors'] = errors.get(route, 0)
+    return results
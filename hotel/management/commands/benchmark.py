@@ -0,0 +1,178 @@
+import json
+import platform
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+from hotel import benchmarks
+
+DEFAULT_BASELINE = settings.BASE_DIR / 'benchmarks' / 'baseline.json'
+
+
+class Command(BaseCommand):
+    help = ('Runs the benchmark suite (room search, room detail, booking, payment, profile, admin changelists) '
+            'on freshly seeded test databases of several sizes; records wall time, query count and peak memory, '
+            'and saves them as a baseline or compares them against one.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='50,500',
+                            help='Comma-separated data set sizes, in rooms (default: 50,500).')
+        parser.add_argument('--bookings-per-room', type=int, default=40)
+        parser.add_argument('--users-per-room', type=int, default=5)
+        parser.add_argument('--repeat', type=int, default=10, help='Timed runs per case; the median is reported.')
+        parser.add_argument('--cases', help='Comma-separated case names to run (default: all).')
+        parser.add_argument('--save', nargs='?', const=str(DEFAULT_BASELINE), metavar='PATH',
+                            help=f'Write the results as the new baseline (default path: {DEFAULT_BASELINE}).')
+        parser.add_argument('--compare', nargs='?', const=str(DEFAULT_BASELINE), metavar='PATH',
+                            help='Compare against a baseline and fail on regressions.')
+        parser.add_argument('--threshold', type=float, default=0.2,
+                            help='Allowed relative growth of wall time and peak memory (default: 0.2 = 20%%).')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--overhead', action='store_true',
+                            help='Also measure the per-request cost of PerformanceMiddleware (on the smallest data set).')
+        parser.add_argument('--routes', action='store_true',
+                            help='Also count queries per request of every route with database vs cached sessions and users.')
+        parser.add_argument('--concurrency', action='store_true',
+                            help='Also measure room searches during bookings with SQLite defaults vs the configured pragmas.')
+        parser.add_argument('--readers', type=int, default=4, help='Reader processes for --concurrency.')
+        parser.add_argument('--duration', type=float, default=3.0, help='Seconds per setup for --concurrency.')
+        parser.add_argument('--allocation', action='store_true',
+                            help='Simulate room allocation policies on a synthetic demand stream.')
+        parser.add_argument('--allocation-rooms', type=int, default=2000, help='Rooms in the --allocation simulation.')
+        parser.add_argument('--allocation-nights', type=int, default=60, help='Nights in the --allocation simulation.')
+        parser.add_argument('--overhead-budget', type=float, default=benchmarks.OVERHEAD_BUDGET,
+                            help='Allowed relative overhead of PerformanceMiddleware (default: 0.05 = 5%%).')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',')]
+        except ValueError:
+            raise CommandError('--sizes должен быть списком чисел через запятую, например 50,500.')
+        only = set(options['cases'].split(',')) if options['cases'] else None
+
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare'], encoding='utf-8') as fh:
+                    baseline = json.load(fh)['results']
+            except (OSError, ValueError, KeyError) as exc:
+                raise CommandError(f'Не удалось прочитать базовую линию {options["compare"]}: {exc}')
+
+        # Never touch the real database: seed and measure in the test database
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            results, overhead, concurrency, routes = {}, None, None, None
+            for size in sizes:
+                self.seed(size, options)
+                for name, metrics in benchmarks.run_suite(repeat=options['repeat'], only=only).items():
+                    results[f'{size}_rooms/{name}'] = metrics
+                if options['overhead'] and overhead is None:
+                    overhead = benchmarks.middleware_overhead()
+                if options['routes'] and routes is None:
+                    routes = benchmarks.route_queries()
+                if options['concurrency'] and concurrency is None:
+                    concurrency = benchmarks.db_concurrency(options['readers'], options['duration'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+
+        self.report(results, baseline)
+        if overhead is not None:
+            self.report_overhead(overhead, options['overhead_budget'])
+        if routes is not None:
+            self.report_routes(routes)
+        if concurrency is not None:
+            self.report_concurrency(concurrency, options['readers'])
+        if options['allocation']:
+            # In memory only: no database involved
+            self.report_allocation(benchmarks.simulate_allocation(
+                options['allocation_rooms'], options['allocation_nights'], seed=options['seed'],
+            ), options)
+
+        if options['save']:
+            self.save(options['save'], results, sizes, options)
+        if baseline is not None:
+            regressions = benchmarks.compare(results, baseline, options['threshold'])
+            for name, metric, before, after in regressions:
+                self.stdout.write(self.style.ERROR(f'Регрессия {name}: {metric} {before} -> {after}'))
+            if regressions:
+                raise CommandError(f'Найдено регрессий: {len(regressions)}.')
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно базовой линии нет.'))
+
+    def seed(self, size, options):
+        self.stdout.write(f'Подготовка данных: {size} номеров...')
+        call_command('flush', interactive=False, verbosity=0)
+        call_command(
+            'seed_large', rooms=size, users=size * options['users_per_room'],
+            bookings=size * options['bookings_per_room'], seed=options['seed'], stdout=StringIO(),
+        )
+
+    def report(self, results, baseline):
+        self.stdout.write(f'{"case":<42} {"wall ms":>10} {"queries":>8} {"peak KiB":>10}  baseline')
+        for name, metrics in results.items():
+            previous = (baseline or {}).get(name)
+            reference = (f'{previous["wall_ms"]:.2f} ms / {previous["queries"]} q / {previous["peak_kib"]:.0f} KiB'
+                         if previous else '-')
+            self.stdout.write(
+                f'{name:<42} {metrics["wall_ms"]:>10.2f} {metrics["queries"]:>8} {metrics["peak_kib"]:>10.1f}  {reference}'
+            )
+
+    def report_overhead(self, overhead, budget):
+        self.stdout.write(f'{"PerformanceMiddleware":<22} {"off ms":>8} {"on ms":>8} {"overhead":>14}')
+        for name, row in overhead.items():
+            self.stdout.write(f'{name:<22} {row["off_ms"]:>8.3f} {row["on_ms"]:>8.3f} '
+                              f'{row["overhead_ms"]:>7.3f} ms {row["overhead"]:>5.1%}')
+        over = [name for name, row in overhead.items() if row['overhead'] > budget]
+        if over:
+            raise CommandError(f'Накладные расходы PerformanceMiddleware выше {budget:.0%}: {", ".join(over)}.')
+        self.stdout.write(self.style.SUCCESS(f'Накладные расходы PerformanceMiddleware в пределах {budget:.0%}.'))
+
+    def report_routes(self, routes):
+        self.stdout.write('Запросов к БД на запрос (аноним с сессией / вошедший пользователь):')
+        setups = list(benchmarks.AUTH_SETUPS)
+        self.stdout.write(f'{"route":<20} ' + ' '.join(f'{"anon " + setup:>12} {"user " + setup:>12}' for setup in setups))
+        for name, row in routes.items():
+            cells = []
+            for setup in setups:
+                anonymous = row[setup]['anonymous']
+                cells.append(f'{"-" if anonymous is None else anonymous:>12} {row[setup]["user"]:>12}')
+            self.stdout.write(f'{name:<20} ' + ' '.join(cells))
+
+    def report_concurrency(self, concurrency, readers):
+        self.stdout.write(f'Поиск номеров в {readers} процессах во время бронирований:')
+        self.stdout.write(f'{"setup":<16} {"reads/s":>8} {"p50 ms":>8} {"p99 ms":>8} {"max ms":>8} '
+                          f'{"writes/s":>9} {"write ms":>9} {"errors":>7} {"connect ms":>11}')
+        for name, row in concurrency.items():
+            self.stdout.write(
+                f'{name:<16} {row["reads_per_s"]:>8.1f} {row["read_p50_ms"]:>8.2f} {row["read_p99_ms"]:>8.2f} '
+                f'{row["read_max_ms"]:>8.2f} {row["writes_per_s"]:>9.1f} {row["write_p50_ms"]:>9.2f} '
+                f'{row["lock_errors"]:>7} {row["connect_ms"]:>11.3f}'
+            )
+
+    def report_allocation(self, allocation, options):
+        requests = next(iter(allocation.values()))['requests']
+        self.stdout.write(f'Распределение номеров: {options["allocation_rooms"]} номеров, '
+                          f'{options["allocation_nights"]} ночей, заявок {requests}:')
+        self.stdout.write(f'{"policy":<14} {"occupancy":>10} {"rejected":>9} {"orphans":>8} {"us/decision":>12}')
+        for name, row in allocation.items():
+            self.stdout.write(f'{name:<14} {row["occupancy"]:>10.2%} {row["rejected"]:>9} '
+                              f'{row["orphan_nights"]:>8} {row["us_per_decision"]:>12.1f}')
+
+    def save(self, path, results, sizes, options):
+        payload = {
+            'meta': {
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'machine': platform.machine(),
+                'sizes': sizes,
+                'bookings_per_room': options['bookings_per_room'],
+                'repeat': options['repeat'],
+            },
+            'results': results,
+        }
+        with open(path, 'w', encoding='utf-8') as fh:
+            json.dump(payload, fh, indent=2, ensure_ascii=False)
+            fh.write('\n')
+        self.stdout.write(self.style.SUCCESS(f'Базовая линия сохранена: {path}'))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+from hotel import holds
+
+
+class Command(BaseCommand):
+    help = ('Expires pending bookings whose hold (settings.BOOKING_HOLD_MINUTES) has run out '
+            'and releases their nights. Run it from cron or with --loop.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, help='Bookings per transaction (500 on SQLite by default).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would be released.')
+        parser.add_argument('--loop', action='store_true', help='Keep sweeping every --interval seconds.')
+        parser.add_argument('--interval', type=float, default=60.0, help='Seconds between sweeps with --loop.')
+
+    def handle(self, *args, **options):
+        while True:
+            result = holds.sweep(chunk_size=options['chunk_size'], dry_run=options['dry_run'])
+            verb = 'Будет освобождено' if options['dry_run'] else 'Освобождено'
+            self.stdout.write(self.style.SUCCESS(
+                f'Истекших броней: {result.bookings}. {verb} ночей: {result.nights}, номеров: {result.rooms} '
+                f'({result.seconds:.2f} с, транзакций: {result.chunks}).'
+            ))
+            if not options['loop'] or options['dry_run']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,72 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from hotel import loadtest
+
+
+class Command(BaseCommand):
+    help = ('Replays a mix of requests against the hotel views (in-process through the WSGI and/or ASGI handler, '
+            'or against a running server with --base-url) and reports p50/p95/p99 latency per route.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=100, help='Requests per route.')
+        parser.add_argument('--concurrency', type=int, default=4, help='Parallel clients (threads; coroutines for ASGI).')
+        parser.add_argument('--routes', default=','.join(loadtest.DEFAULT_ROUTES),
+                            help='Comma-separated route names (room_search = room_list with date filters).')
+        parser.add_argument('--base-url', help='Target a running server, e.g. http://127.0.0.1:8000 (anonymous routes only).')
+        parser.add_argument('--interface', choices=('wsgi', 'asgi', 'both'), default='wsgi',
+                            help='In-process code path: WSGI handler from threads, ASGI handler from coroutines, or both.')
+        parser.add_argument('--seed', type=int, default=1)
+        parser.add_argument('--json', dest='json_path', help='Also write the results to this JSON file.')
+
+    def handle(self, *args, **options):
+        routes = [route.strip() for route in options['routes'].split(',') if route.strip()]
+        mix = loadtest.RequestMix(seed=options['seed'])
+
+        interfaces = ['wsgi', 'asgi'] if options['interface'] == 'both' else [options['interface']]
+        if options['base_url']:
+            skipped = [route for route in routes if route not in loadtest.ANONYMOUS_ROUTES]
+            if skipped:
+                self.stdout.write(self.style.WARNING(f'Пропущены маршруты, требующие входа: {", ".join(skipped)}'))
+            routes = [route for route in routes if route in loadtest.ANONYMOUS_ROUTES]
+            interfaces = ['http']
+
+        plan = mix.build(routes, options['requests'])
+        if not plan:
+            raise CommandError('Нет маршрутов для нагрузки: заполните базу (seed_data / seed_large).')
+
+        report = {'concurrency': options['concurrency']}
+        for interface in interfaces:
+            if interface == 'http':
+                results, wall = loadtest.run(plan, loadtest.HttpTarget(options['base_url']), options['concurrency'])
+            elif interface == 'asgi':
+                results, wall = loadtest.run_async(plan, loadtest.AsyncInProcessTarget(user=mix.user), options['concurrency'])
+            else:
+                results, wall = loadtest.run(plan, loadtest.InProcessTarget(user=mix.user), options['concurrency'])
+            self.print_results(interface, results, wall, len(plan), options['concurrency'])
+            report[interface] = {'wall_s': wall, 'throughput': len(plan) / wall, 'routes': results}
+
+        if len(interfaces) == 2:
+            wsgi, asgi = report['wsgi']['throughput'], report['asgi']['throughput']
+            self.stdout.write(self.style.SUCCESS(f'ASGI/WSGI по пропускной способности: {asgi / wsgi:.2f}x'))
+
+        if options['json_path']:
+            if len(interfaces) == 1:
+                report = {'concurrency': options['concurrency'], 'wall_s': wall, 'routes': results}
+            with open(options['json_path'], 'w', encoding='utf-8') as handle:
+                json.dump(report, handle, indent=2)
+
+    def print_results(self, interface, results, wall, count, concurrency):
+        header = f'{"route":<20}{"n":>7}{"err":>6}{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"max ms":>10}'
+        self.stdout.write(f'[{interface}]')
+        self.stdout.write(header)
+        self.stdout.write('-' * len(header))
+        for route, row in results.items():
+            self.stdout.write(
+                f'{route:<20}{row["count"]:>7}{row["errors"]:>6}{row["p50_ms"]:>10.1f}'
+                f'{row["p95_ms"]:>10.1f}{row["p99_ms"]:>10.1f}{row["max_ms"]:>10.1f}'
+            )
+        clients = 'корутин' if interface == 'asgi' else 'потоков'
+        self.stdout.write(self.style.SUCCESS(
+            f'{count} запросов за {wall:.2f} с ({count / wall:.0f} запросов/с, {clients}: {concurrency})'
+        ))
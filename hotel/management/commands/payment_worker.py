@@ -0,0 +1,51 @@
+import multiprocessing
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from hotel import payment_queue
+from hotel.models import PaymentJob
+
+
+def run_worker(poll_interval, batch):
+    payment_queue.work(poll_interval=poll_interval, batch=batch)
+
+
+class Command(BaseCommand):
+    help = ('Processes the payment queue: charges queued jobs through the configured provider, '
+            'retries transient failures and marks paid bookings.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes (provider calls run in parallel).')
+        parser.add_argument('--batch', type=int, default=1, help='Jobs claimed at a time by one worker.')
+        parser.add_argument('--poll-interval', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Process the jobs that are due now and exit.')
+
+    def handle(self, *args, **options):
+        if options['once']:
+            handled = payment_queue.run_once(limit=options['batch'])
+            queued = PaymentJob.objects.filter(status='queued').count()
+            self.stdout.write(self.style.SUCCESS(f'Обработано задач: {handled}, в очереди на повтор: {queued}.'))
+            return
+
+        self.stdout.write(f'Обработчики оплат запущены: {options["processes"]} (Ctrl+C для остановки).')
+        if options['processes'] == 1:
+            try:
+                run_worker(options['poll_interval'], options['batch'])
+            except KeyboardInterrupt:
+                pass
+            return
+
+        # Each process opens its own database connection
+        connections.close_all()
+        workers = [
+            multiprocessing.Process(target=run_worker, args=(options['poll_interval'], options['batch']), daemon=True)
+            for _ in range(options['processes'])
+        ]
+        for worker in workers:
+            worker.start()
+        try:
+            for worker in workers:
+                worker.join()
+        except KeyboardInterrupt:
+            for worker in workers:
+                worker.terminate()
@@ -0,0 +1,67 @@
+import os
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+from hotel import photos
+from hotel.models import Room
+
+
+class Command(BaseCommand):
+    help = ('Generates the WebP/JPEG photo variants of every room whose variants are missing or out of date, '
+            'resizing in parallel worker processes.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=os.cpu_count() or 2, help='Resizing processes.')
+        parser.add_argument('--force', action='store_true', help='Re-render rooms whose variants look up to date.')
+        parser.add_argument('--rooms', help='Comma-separated room ids (default: all rooms).')
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        rooms = Room.objects.order_by('pk')
+        if options['rooms']:
+            rooms = rooms.filter(pk__in=[int(pk) for pk in options['rooms'].split(',')])
+
+        # Rooms whose photo was removed only need their variants cleared
+        cleared = 0
+        for room in rooms.filter(Q(photo='') | Q(photo__isnull=True)).exclude(photo_variants={}):
+            cleared += photos.apply(room, {})
+
+        todo = [room for room in rooms.exclude(Q(photo='') | Q(photo__isnull=True))
+                if options['force'] or photos.is_stale(room)]
+        done = failed = 0
+        if todo:
+            # Children only resize bytes; keep the parent's database handles out of the fork
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers']) as pool:
+                queue, running = iter(todo), {}
+                while True:
+                    # At most two images per worker in flight bounds memory on large backfills
+                    while len(running) < options['workers'] * 2:
+                        room = next(queue, None)
+                        if room is None:
+                            break
+                        try:
+                            with room.photo.open('rb') as source:
+                                running[pool.submit(photos.render, source.read())] = room
+                        except OSError as exc:
+                            failed += 1
+                            self.stderr.write(f'Номер {room.number}: {exc}')
+                    if not running:
+                        break
+                    finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in finished:
+                        room = running.pop(future)
+                        try:
+                            photos.apply(room, photos.store(future.result(), room.photo.name))
+                            done += 1
+                        except Exception as exc:
+                            failed += 1
+                            self.stderr.write(f'Номер {room.number}: {exc}')
+                    self.stdout.write(f'  обработано: {done + failed}/{len(todo)}', ending='\r')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с: обработано {done}, ошибок {failed}, очищено {cleared}.'
+        ))
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from hotel import availability, search_cache
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the per-room occupancy index from bookings, or checks it against them with --check.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only compare the index with the bookings table, do not rebuild.')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rows = availability.rebuild()
+            search_cache.invalidate_all()
+            self.stdout.write(self.style.SUCCESS(f'Индекс занятости перестроен: {rows} строк.'))
+
+        mismatches = availability.verify()
+        if mismatches:
+            for room_id, month, stored, expected in mismatches[:20]:
+                self.stdout.write(self.style.ERROR(
+                    f'Комната {room_id}, {month:%Y-%m}: в индексе {stored:031b}, по броням {expected:031b}'
+                ))
+            raise CommandError(f'Индекс занятости расходится с бронированиями: {len(mismatches)} строк.')
+        self.stdout.write(self.style.SUCCESS('Индекс занятости совпадает с бронированиями.'))
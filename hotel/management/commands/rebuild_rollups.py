@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand, CommandError
+from hotel import rollups
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the daily occupancy/revenue rollups from bookings, or checks them against bookings with --check.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only compare the rollups with the bookings table, do not rebuild.')
+        parser.add_argument('--batch-size', type=int, default=5000, help='Bookings fetched and rows inserted per batch.')
+
+    def handle(self, *args, **options):
+        if not options['check']:
+            rows = rollups.rebuild(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(f'Сводные таблицы перестроены: {rows} строк по номерам.'))
+
+        mismatches = rollups.verify()
+        if mismatches:
+            for table, key, day, stored, expected in mismatches[:20]:
+                self.stdout.write(self.style.ERROR(
+                    f'{table} {key}, {day:%Y-%m-%d}: в сводке {stored}, по броням {expected}'
+                ))
+            raise CommandError(f'Сводные таблицы расходятся с бронированиями: {len(mismatches)} строк.')
+        self.stdout.write(self.style.SUCCESS('Сводные таблицы совпадают с бронированиями.'))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand, CommandError
+from hotel import fulltext
+
+
+class Command(BaseCommand):
+    help = ('Refills the FTS5 search indexes (rooms, guests, employees) from their tables, '
+            'or checks them against the tables with --check.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Only compare the indexes with their tables, do not rebuild.')
+
+    def handle(self, *args, **options):
+        if not fulltext.supported():
+            raise CommandError('Полнотекстовый поиск FTS5 доступен только на SQLite.')
+        if not options['check']:
+            for table, rows in fulltext.rebuild().items():
+                self.stdout.write(self.style.SUCCESS(f'Индекс {table} перестроен: {rows} строк.'))
+
+        missing = fulltext.missing_triggers()
+        if missing:
+            raise CommandError(f'Нет триггеров поискового индекса: {", ".join(missing)}. Запустите команду без --check.')
+        mismatches = fulltext.verify()
+        if mismatches:
+            for table, indexed, total in mismatches:
+                self.stdout.write(self.style.ERROR(f'{table}: в индексе {indexed} строк, в таблице {total}'))
+            raise CommandError(f'Поисковые индексы расходятся с таблицами: {len(mismatches)}.')
+        self.stdout.write(self.style.SUCCESS('Поисковые индексы совпадают с таблицами.'))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import IntegrityError
+
+from hotel import allocation
+from hotel.models import Room
+
+
+class Command(BaseCommand):
+    help = ('Moves future bookings made by room type (auto_assigned) between rooms of the same type so that '
+            'fewer lone free nights are left between stays. Rooms picked by guests are never touched.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--room-type', choices=[key for key, _ in Room.ROOM_TYPES],
+                            help='Only this room type (default: every type).')
+        parser.add_argument('--dry-run', action='store_true', help='Only report what would move.')
+
+    def handle(self, *args, **options):
+        room_types = [options['room_type']] if options['room_type'] else [key for key, _ in Room.ROOM_TYPES]
+        moved = 0
+        for room_type in room_types:
+            try:
+                plan = allocation.repack(room_type, dry_run=options['dry_run'])
+            except (allocation.CalendarChanged, IntegrityError):
+                raise CommandError(f'Брони типа {room_type} менялись во время перестановки, запустите команду еще раз.')
+            moved += len(plan.moves)
+            self.stdout.write(
+                f'{room_type}: броней к переносу {len(plan.moves)} из {plan.stays}, '
+                f'одиночных пустых ночей {plan.orphans_before} -> {plan.orphans_after}'
+            )
+        verb = 'Будет перенесено' if options['dry_run'] else 'Перенесено'
+        self.stdout.write(self.style.SUCCESS(f'{verb} бронирований: {moved}.'))
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+from hotel import search_cache
+
+
+class Command(BaseCommand):
+    help = 'Shows hit/miss counters of the room search cache (meaningful for shared file/database cache backends).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Reset the counters after printing them.')
+
+    def handle(self, *args, **options):
+        stats = search_cache.stats()
+        self.stdout.write(
+            f"hits={stats['hits']} misses={stats['misses']} hit_ratio={stats['hit_ratio']:.1%}"
+        )
+        if options['reset']:
+            search_cache.reset_stats()
+            self.stdout.write(self.style.SUCCESS('Счётчики кэша поиска сброшены.'))
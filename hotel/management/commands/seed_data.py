@@ -1,6 +1,7 @@
 from django.core.management.base import BaseCommand
 from django.contrib.auth import get_user_model
-from hotel.models import Room, Employee, Booking
+from hotel import amenities, availability, rates, reservations, rollups, search_cache
+from hotel.models import Room, Employee, Booking, RatePlan
 from datetime import date, timedelta
 import random
 
@@ -57,30 +58,52 @@ class Command(BaseCommand):
         ]
         rooms = [Room(**data) for data in rooms_data]
         Room.objects.bulk_create(rooms)
+        amenities.rebuild()
         self.stdout.write(self.style.SUCCESS(f'Создано {len(rooms)} номеров.'))
 
-        # 5. Create Bookings (Demo)
+        # 5. Create Rate Plans (weekends, summer season for suites, long stays)
+        RatePlan.objects.all().delete()
+        today = date.today()
+        season_start = date(today.year if today.month <= 8 else today.year + 1, 6, 1)
+        rate_plans = [
+            RatePlan(name='Выходные +20%', start_date=today - timedelta(days=30), end_date=today + timedelta(days=365),
+                     weekdays=0b0110000, percent=20),
+            RatePlan(name='Летний сезон: люксы', room_type='suite', start_date=season_start,
+                     end_date=season_start.replace(month=8, day=31), price=55000),
+            RatePlan(name='От 7 ночей −10%', start_date=today - timedelta(days=30), end_date=today + timedelta(days=365),
+                     min_nights=7, percent=-10),
+        ]
+        RatePlan.objects.bulk_create(rate_plans)
+        self.stdout.write(self.style.SUCCESS(f'Создано {len(rate_plans)} тарифов.'))
+
+        # 6. Create Bookings (Demo)
         Booking.objects.all().delete()
         test_user = User.objects.get(username='user')
         admin_employee = Employee.objects.get(access_level='admin')
         
-        today = date.today()
-        
         bookings_data = [
             # Past Paid Booking
-            {'user': test_user, 'room': rooms[0], 'check_in_date': today - timedelta(days=10), 'check_out_date': today - timedelta(days=5), 'guests': 1, 'status': 'paid', 'total_price': rooms[0].price_per_night * 5, 'processed_by': admin_employee},
+            {'user': test_user, 'room': rooms[0], 'check_in_date': today - timedelta(days=10), 'check_out_date': today - timedelta(days=5), 'guests': 1, 'status': 'paid', 'processed_by': admin_employee},
             # Current Paid Booking (Occupied)
-            {'user': test_user, 'room': rooms[1], 'check_in_date': today - timedelta(days=2), 'check_out_date': today + timedelta(days=3), 'guests': 1, 'status': 'paid', 'total_price': rooms[1].price_per_night * 5, 'processed_by': admin_employee},
+            {'user': test_user, 'room': rooms[1], 'check_in_date': today - timedelta(days=2), 'check_out_date': today + timedelta(days=3), 'guests': 1, 'status': 'paid', 'processed_by': admin_employee},
             # Future Pending Booking (Occupied)
-            {'user': test_user, 'room': rooms[2], 'check_in_date': today + timedelta(days=7), 'check_out_date': today + timedelta(days=10), 'guests': 2, 'status': 'pending', 'total_price': rooms[2].price_per_night * 3, 'processed_by': admin_employee},
+            {'user': test_user, 'room': rooms[2], 'check_in_date': today + timedelta(days=7), 'check_out_date': today + timedelta(days=10), 'guests': 2, 'status': 'pending', 'processed_by': admin_employee},
             # Future Paid Booking
-            {'user': test_user, 'room': rooms[3], 'check_in_date': today + timedelta(days=15), 'check_out_date': today + timedelta(days=17), 'guests': 2, 'status': 'paid', 'total_price': rooms[3].price_per_night * 2, 'processed_by': admin_employee},
+            {'user': test_user, 'room': rooms[3], 'check_in_date': today + timedelta(days=15), 'check_out_date': today + timedelta(days=17), 'guests': 2, 'status': 'paid', 'processed_by': admin_employee},
             # Future Cancelled Booking
-            {'user': test_user, 'room': rooms[4], 'check_in_date': today + timedelta(days=20), 'check_out_date': today + timedelta(days=22), 'guests': 3, 'status': 'cancelled', 'total_price': rooms[4].price_per_night * 2, 'processed_by': admin_employee},
+            {'user': test_user, 'room': rooms[4], 'check_in_date': today + timedelta(days=20), 'check_out_date': today + timedelta(days=22), 'guests': 3, 'status': 'cancelled', 'processed_by': admin_employee},
         ]
         
+        for data in bookings_data:
+            data['total_price'] = rates.quote(data['room'], data['check_in_date'], data['check_out_date']).total
         bookings = [Booking(**data) for data in bookings_data]
         Booking.objects.bulk_create(bookings)
         self.stdout.write(self.style.SUCCESS(f'Создано {len(bookings)} демо-бронирований.'))
 
+        # bulk_create() bypasses signals, so claimed nights, the availability index and the rollups are rebuilt in one pass
+        reservations.rebuild()
+        availability.rebuild()
+        rollups.rebuild()
+        search_cache.invalidate_all()
+
         self.stdout.write(self.style.SUCCESS('--- Заполнение базы данных завершено ---'))
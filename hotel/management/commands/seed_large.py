@@ -0,0 +1,211 @@
+from django.core.management.base import BaseCommand
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from hotel import amenities, availability, rates, reservations, rollups, search_cache, signals
+from hotel.models import Room, Employee, Booking, Payment, RatePlan
+from datetime import date, timedelta
+import random
+import time
+import uuid
+
+User = get_user_model()
+
+# Room mix and nightly price ranges (KZT) per type
+ROOM_TYPE_WEIGHTS = {'single': 30, 'double': 45, 'suite': 10, 'family': 15}
+ROOM_PRICES = {'single': (12000, 20000), 'double': (18000, 32000), 'suite': (38000, 90000), 'family': (28000, 45000)}
+ROOM_GUESTS = {'single': (1, 1), 'double': (2, 3), 'suite': (2, 4), 'family': (3, 6)}
+AMENITIES = ['Wi-Fi', 'ТВ', 'Душ', 'Ванна', 'Балкон', 'Мини-бар', 'Кондиционер', 'Кухня', 'Джакузи', 'Завтрак включен']
+
+# Most stays are short; a long tail of week-long and two-week stays
+STAY_WEIGHTS = {1: 25, 2: 25, 3: 18, 4: 10, 5: 7, 6: 4, 7: 6, 10: 3, 14: 2}
+MEAN_GAP_NIGHTS = 1.5
+FUTURE_DAYS = 365
+
+PAYMENT_METHODS = ['kaspi', 'kaspi', 'kaspi', 'halyk', 'halyk', 'bcc']
+
+LOAD_PREFIX = 'load_'
+LOAD_ROOM_PREFIX = 'L'
+
+
+class Command(BaseCommand):
+    help = ('Generates a large, realistic data set (rooms, users, bookings, payments) in chunked bulk_create '
+            'batches with bounded memory, for reproducing performance problems locally.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rooms', type=int, default=2000)
+        parser.add_argument('--users', type=int, default=100000)
+        parser.add_argument('--bookings', type=int, default=1000000)
+        parser.add_argument('--chunk', type=int, default=5000, help='Rows per bulk_create batch / transaction.')
+        parser.add_argument('--seed', type=int, default=42, help='Random seed, for reproducible data sets.')
+        parser.add_argument('--flush', action='store_true', help='Delete previously generated load data first.')
+
+    def handle(self, *args, **options):
+        self.rng = random.Random(options['seed'])
+        self.chunk = options['chunk']
+        started = time.perf_counter()
+
+        if options['flush']:
+            self.flush()
+
+        room_ids = self.create_rooms(options['rooms'])
+        self.create_rate_plans(room_ids)
+        user_ids = self.create_users(options['users'])
+        employee_ids = list(Employee.objects.values_list('pk', flat=True)) or [None]
+        bookings, payments = self.create_bookings(options['bookings'], room_ids, user_ids, employee_ids)
+
+        self.stdout.write('Перестроение производных данных (занятые ночи, индекс занятости, сводки)...')
+        reservations.rebuild(batch_size=self.chunk)
+        availability.rebuild()
+        rollups.rebuild(batch_size=self.chunk)
+        search_cache.invalidate_all()
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {time.perf_counter() - started:.1f} с: {len(room_ids)} номеров, {len(user_ids)} пользователей, '
+            f'{bookings} бронирований, {payments} платежей.'
+        ))
+
+    def flush(self):
+        # Derived data is rebuilt at the end, so skip the per-booking signals
+        with signals.suspended():
+            rooms = Room.objects.filter(number__startswith=LOAD_ROOM_PREFIX)
+            Booking.objects.filter(room__in=rooms).delete()
+            rooms.delete()
+            User.objects.filter(username__startswith=LOAD_PREFIX).delete()
+            RatePlan.objects.filter(name__startswith=LOAD_PREFIX).delete()
+        self.stdout.write('Старые нагрузочные данные удалены.')
+
+    def create_rooms(self, count):
+        types, weights = zip(*ROOM_TYPE_WEIGHTS.items())
+        existing = Room.objects.filter(number__startswith=LOAD_ROOM_PREFIX).count()
+        rooms = []
+        for index in range(existing, existing + count):
+            room_type = self.rng.choices(types, weights)[0]
+            low, high = ROOM_PRICES[room_type]
+            rooms.append(Room(
+                number=f'{LOAD_ROOM_PREFIX}{index:05d}',
+                room_type=room_type,
+                price_per_night=round(self.rng.randint(low, high), -2),
+                max_guests=self.rng.randint(*ROOM_GUESTS[room_type]),
+                description=f'Номер {index} для нагрузочного тестирования.',
+                amenities=', '.join(self.rng.sample(AMENITIES, self.rng.randint(2, 6))),
+            ))
+        Room.objects.bulk_create(rooms, batch_size=self.chunk)
+        # bulk_create skips the pre_save signal that indexes amenities
+        amenities.rebuild(batch_size=self.chunk)
+        self.stdout.write(f'Создано {count} номеров.')
+        return list(Room.objects.filter(number__startswith=LOAD_ROOM_PREFIX).values_list('pk', flat=True))
+
+    def create_rate_plans(self, room_ids):
+        """A rate card over the booking timeline: weekends, summer, New Year, long stays and a few room promotions."""
+        today = date.today()
+        first, last = date(today.year - 3, 1, 1), date(today.year + 2, 12, 31)
+        plans = [
+            RatePlan(name=f'{LOAD_PREFIX}weekend', start_date=first, end_date=last, weekdays=0b0110000, percent=15),
+            RatePlan(name=f'{LOAD_PREFIX}week', start_date=first, end_date=last, min_nights=7, percent=-10),
+        ]
+        for year in range(first.year, last.year + 1):
+            plans.append(RatePlan(name=f'{LOAD_PREFIX}summer_{year}', start_date=date(year, 6, 1), end_date=date(year, 8, 31), percent=25))
+            for room_type, (_, high) in ROOM_PRICES.items():
+                plans.append(RatePlan(
+                    name=f'{LOAD_PREFIX}new_year_{year}_{room_type}', room_type=room_type,
+                    start_date=date(year, 12, 28), end_date=date(year + 1, 1, 3), price=high, priority=1,
+                ))
+        for room_id in self.rng.sample(room_ids, min(len(room_ids), len(room_ids) // 100 + 1)):
+            start = first + timedelta(days=self.rng.randrange((last - first).days))
+            plans.append(RatePlan(
+                name=f'{LOAD_PREFIX}promo_{room_id}', room_id=room_id,
+                start_date=start, end_date=start + timedelta(days=self.rng.randint(7, 30)), percent=-20,
+            ))
+        RatePlan.objects.bulk_create(plans)
+        self.stdout.write(f'Создано {len(plans)} тарифов.')
+
+    def create_users(self, count):
+        # One hash for everyone: load_<n> / loadpassword can log in, and hashing stays off the hot loop
+        password = make_password('loadpassword')
+        start = User.objects.filter(username__startswith=LOAD_PREFIX).count()
+        for offset in range(start, start + count, self.chunk):
+            batch = [
+                User(username=f'{LOAD_PREFIX}{n}', email=f'{LOAD_PREFIX}{n}@test.kz', password=password,
+                     phone_number=f'770{n:08d}'[:15])
+                for n in range(offset, min(offset + self.chunk, start + count))
+            ]
+            User.objects.bulk_create(batch)
+        self.stdout.write(f'Создано {count} пользователей.')
+        return list(User.objects.filter(username__startswith=LOAD_PREFIX).values_list('pk', flat=True))
+
+    def timeline_start(self, per_room, today):
+        # Place the timeline so it ends about a year ahead, with history before today
+        mean_span = sum(n * w for n, w in STAY_WEIGHTS.items()) / sum(STAY_WEIGHTS.values()) + MEAN_GAP_NIGHTS
+        return today + timedelta(days=FUTURE_DAYS - int(per_room * mean_span))
+
+    def stays_for_room(self, per_room, today):
+        """Yields (check_in, check_out) for one room: consecutive stays separated by random gaps."""
+        nights, weights = zip(*STAY_WEIGHTS.items())
+        day = self.timeline_start(per_room, today)
+        for _ in range(per_room):
+            day += timedelta(days=int(self.rng.expovariate(1 / MEAN_GAP_NIGHTS)))
+            check_out = day + timedelta(days=self.rng.choices(nights, weights)[0])
+            yield day, check_out
+            day = check_out
+
+    def pick_status(self, check_out, today):
+        roll = self.rng.random()
+        if check_out <= today:
+            return 'paid' if roll < 0.88 else 'cancelled'
+        return 'paid' if roll < 0.55 else 'pending' if roll < 0.85 else 'cancelled'
+
+    def create_bookings(self, count, room_ids, user_ids, employee_ids):
+        if not room_ids or not user_ids:
+            return 0, 0
+        today = date.today()
+        rooms = Room.objects.filter(number__startswith=LOAD_ROOM_PREFIX)
+        room_rows = rates.room_rows(rooms)
+        guests = dict(rooms.values_list('pk', 'max_guests').iterator())
+        per_room, remainder = divmod(count, len(room_ids))
+        # Every stay is priced from one calendar over the whole timeline (slices of shared nightly rows)
+        start = self.timeline_start(per_room + 1, today)
+        calendar = None
+
+        created = paid = 0
+        buffer = []
+        for position, room_id in enumerate(room_ids):
+            for check_in, check_out in self.stays_for_room(per_room + (position < remainder), today):
+                if calendar is None or check_out > calendar.end:
+                    calendar = rates.RateCalendar(room_rows, start, check_out + timedelta(days=FUTURE_DAYS))
+                buffer.append(Booking(
+                    user_id=self.rng.choice(user_ids),
+                    room_id=room_id,
+                    check_in_date=check_in,
+                    check_out_date=check_out,
+                    guests=self.rng.randint(1, guests[room_id]),
+                    status=self.pick_status(check_out, today),
+                    total_price=calendar.quote(room_id, check_in, check_out).total,
+                    processed_by_id=self.rng.choice(employee_ids),
+                ))
+                if len(buffer) >= self.chunk:
+                    paid += self.flush_bookings(buffer)
+                    created += len(buffer)
+                    buffer = []
+                    self.stdout.write(f'  бронирований: {created}/{count}', ending='\r')
+        if buffer:
+            paid += self.flush_bookings(buffer)
+            created += len(buffer)
+        self.stdout.write(f'Создано {created} бронирований.')
+        return created, paid
+
+    def flush_bookings(self, bookings):
+        with transaction.atomic():
+            Booking.objects.bulk_create(bookings)
+            payments = [
+                Payment(
+                    booking_id=booking.pk,
+                    amount=booking.total_price,
+                    transaction_id=f'LOAD-{uuid.UUID(int=self.rng.getrandbits(128)).hex}',
+                    payment_method=self.rng.choice(PAYMENT_METHODS),
+                    status='completed',
+                )
+                for booking in bookings if booking.status == 'paid'
+            ]
+            Payment.objects.bulk_create(payments)
+        return len(payments)
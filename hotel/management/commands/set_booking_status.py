@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from hotel import bulk_status
+from hotel.models import Booking, Payment, Room
+
+
+class Command(BaseCommand):
+    help = ('Moves bookings to paid or cancelled in chunks of short transactions, creating the payments of paid '
+            'bookings and keeping claimed nights, the availability index and the rollups consistent.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('status', choices=bulk_status.STATUSES)
+        parser.add_argument('--ids', help='Comma-separated booking ids.')
+        parser.add_argument('--from-status', choices=[key for key, _ in Booking.STATUS_CHOICES],
+                            help='Only bookings currently in this status.')
+        parser.add_argument('--room-type', choices=[key for key, _ in Room.ROOM_TYPES])
+        parser.add_argument('--check-in-from', help='Only bookings checking in on or after this date (YYYY-MM-DD).')
+        parser.add_argument('--check-in-to', help='Only bookings checking in before this date (YYYY-MM-DD).')
+        parser.add_argument('--chunk-size', type=int, help='Bookings per transaction (default: 500 on SQLite, 2000 otherwise).')
+        parser.add_argument('--payment-method', choices=[key for key, _ in Payment.PAYMENT_METHODS], default='mock',
+                            help='Method recorded on the payments created for paid bookings.')
+        parser.add_argument('--dry-run', action='store_true', help='Only count the bookings that would change.')
+
+    def handle(self, *args, **options):
+        bookings = Booking.objects.all()
+        if options['ids']:
+            bookings = bookings.filter(pk__in=[int(pk) for pk in options['ids'].split(',')])
+        if options['from_status']:
+            bookings = bookings.filter(status=options['from_status'])
+        if options['room_type']:
+            bookings = bookings.filter(room__room_type=options['room_type'])
+        for option, lookup in (('check_in_from', 'check_in_date__gte'), ('check_in_to', 'check_in_date__lt')):
+            if options[option]:
+                day = parse_date(options[option])
+                if day is None:
+                    raise CommandError(f'Неверная дата: {options[option]}')
+                bookings = bookings.filter(**{lookup: day})
+
+        if options['dry_run']:
+            count = bookings.exclude(status=options['status']).count()
+            self.stdout.write(self.style.SUCCESS(f'Будет изменено бронирований: {count}.'))
+            return
+
+        def progress(result):
+            self.stdout.write(f'  обработано: {result.done}/{result.total} ({result.rate:.0f} броней/с)', ending='\r')
+
+        result = bulk_status.transition(
+            bookings, options['status'], chunk_size=options['chunk_size'],
+            payment_method=options['payment_method'], progress=progress,
+        )
+        self.stdout.write('')
+        self.stdout.write(self.style.SUCCESS(
+            f'Готово за {result.seconds:.1f} с: изменено {result.updated}, создано платежей {result.payments}, '
+            f'пропущено {result.skipped}, пакетов {result.chunks} ({result.rate:.0f} броней/с).'
+        ))
+        if result.skipped:
+            self.stdout.write(self.style.WARNING('Пропущенные брони не активированы: их ночи уже заняты другими бронями.'))
@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from hotel import routers
+
+
+class Command(BaseCommand):
+    help = ('Copies the primary SQLite database into the replica (DJANGO_REPLICA_DB), '
+            'standing in for replication in development.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--interval', type=float,
+                            help='Keep copying every N seconds (simulates replication lag).')
+
+    def handle(self, *args, **options):
+        if not routers.replica_enabled():
+            raise CommandError('Реплика не настроена: задайте переменную окружения DJANGO_REPLICA_DB.')
+        while True:
+            started = time.perf_counter()
+            routers.sync_replica()
+            self.stdout.write(self.style.SUCCESS(f'Реплика обновлена за {time.perf_counter() - started:.2f} с.'))
+            if not options['interval']:
+                return
+            try:
+                time.sleep(options['interval'])
+            except KeyboardInterrupt:
+                return
@@ -0,0 +1,44 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:48
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def build_occupancy(apps, schema_editor):
+    from hotel.availability import build_masks
+
+    Booking = apps.get_model('hotel', 'Booking')
+    RoomOccupancy = apps.get_model('hotel', 'RoomOccupancy')
+    stays = Booking.objects.filter(status__in=['pending', 'paid']).values_list(
+        'room_id', 'check_in_date', 'check_out_date'
+    )
+    RoomOccupancy.objects.bulk_create(
+        [RoomOccupancy(room_id=room_id, month=month, mask=mask) for (room_id, month), mask in build_masks(stays).items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomOccupancy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('month', models.DateField(verbose_name='Месяц')),
+                ('mask', models.IntegerField(default=0, verbose_name='Занятые ночи')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='occupancy', to='hotel.room', verbose_name='Комната')),
+            ],
+            options={
+                'verbose_name': 'Занятость комнаты',
+                'verbose_name_plural': 'Занятость комнат',
+                'indexes': [models.Index(fields=['month', 'room'], name='occupancy_month_room_idx')],
+                'constraints': [models.UniqueConstraint(fields=('room', 'month'), name='unique_room_month_occupancy')],
+            },
+        ),
+        migrations.RunPython(build_occupancy, migrations.RunPython.noop),
+    ]
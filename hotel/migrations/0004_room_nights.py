@@ -0,0 +1,45 @@
+# Generated by Django 5.2.18 on 2026-10-18 02:50
+
+import django.db.models.deletion
+from datetime import timedelta
+
+from django.db import migrations, models
+
+
+def claim_existing_nights(apps, schema_editor):
+    Booking = apps.get_model('hotel', 'Booking')
+    RoomNight = apps.get_model('hotel', 'RoomNight')
+    nights = []
+    stays = Booking.objects.filter(status__in=['pending', 'paid']).order_by('pk').values_list(
+        'pk', 'room_id', 'check_in_date', 'check_out_date'
+    )
+    for booking_id, room_id, check_in, check_out in stays:
+        for offset in range((check_out - check_in).days):
+            nights.append(RoomNight(room_id=room_id, night=check_in + timedelta(days=offset), booking_id=booking_id))
+    # Legacy data may already contain double bookings; the oldest booking keeps the night
+    RoomNight.objects.bulk_create(nights, batch_size=1000, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0003_booking_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RoomNight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('night', models.DateField(verbose_name='Ночь')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='nights', to='hotel.booking', verbose_name='Бронирование')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='claimed_nights', to='hotel.room', verbose_name='Комната')),
+            ],
+            options={
+                'verbose_name': 'Занятая ночь',
+                'verbose_name_plural': 'Занятые ночи',
+                'constraints': [models.UniqueConstraint(fields=('room', 'night'), name='unique_room_night')],
+            },
+        ),
+        migrations.RunPython(claim_existing_nights, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:23
+
+import django.db.models.deletion
+from collections import defaultdict
+from datetime import timedelta
+from decimal import ROUND_DOWN, Decimal
+
+from django.db import migrations, models
+
+
+def build_rollups(apps, schema_editor):
+    Booking = apps.get_model('hotel', 'Booking')
+    Room = apps.get_model('hotel', 'Room')
+    DailyRoomStats = apps.get_model('hotel', 'DailyRoomStats')
+    DailyRoomTypeStats = apps.get_model('hotel', 'DailyRoomTypeStats')
+    room_types = dict(Room.objects.values_list('pk', 'room_type'))
+    by_room, by_type = defaultdict(lambda: [0, Decimal(0), 0]), defaultdict(lambda: [0, Decimal(0), 0])
+
+    def add(room_id, day, nights, revenue, cancelled):
+        for row in (by_room[(room_id, day)], by_type[(room_types[room_id], day)]):
+            row[0] += nights
+            row[1] += revenue
+            row[2] += cancelled
+
+    stays = Booking.objects.values_list('room_id', 'status', 'check_in_date', 'check_out_date', 'total_price')
+    for room_id, status, check_in, check_out, total_price in stays:
+        if status == 'cancelled':
+            add(room_id, check_in, 0, Decimal(0), 1)
+        elif status in ('pending', 'paid'):
+            count = (check_out - check_in).days
+            share = (total_price / count).quantize(Decimal('0.01'), rounding=ROUND_DOWN) if status == 'paid' else Decimal(0)
+            first = total_price - share * (count - 1) if status == 'paid' else Decimal(0)
+            for offset in range(count):
+                add(room_id, check_in + timedelta(days=offset), 1, first if offset == 0 else share, 0)
+
+    DailyRoomStats.objects.bulk_create(
+        [DailyRoomStats(room_id=room_id, day=day, nights_sold=n, revenue=r, cancellations=c) for (room_id, day), (n, r, c) in by_room.items()],
+        batch_size=1000,
+    )
+    DailyRoomTypeStats.objects.bulk_create(
+        [DailyRoomTypeStats(room_type=room_type, day=day, nights_sold=n, revenue=r, cancellations=c) for (room_type, day), (n, r, c) in by_type.items()],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0007_room_photo_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyRoomTypeStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('room_type', models.CharField(choices=[('single', 'Одноместный'), ('double', 'Двухместный'), ('suite', 'Люкс'), ('family', 'Семейный')], max_length=20, verbose_name='Тип комнаты')),
+                ('day', models.DateField(verbose_name='День')),
+                ('nights_sold', models.IntegerField(default=0, verbose_name='Продано ночей')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14, verbose_name='Выручка (KZT)')),
+                ('cancellations', models.IntegerField(default=0, verbose_name='Отмены')),
+            ],
+            options={
+                'verbose_name': 'Отчет по загрузке и выручке',
+                'verbose_name_plural': 'Отчет по загрузке и выручке',
+                'indexes': [models.Index(fields=['day', 'room_type'], name='type_stats_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('room_type', 'day'), name='unique_room_type_day_stats')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyRoomStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(verbose_name='День')),
+                ('nights_sold', models.IntegerField(default=0, verbose_name='Продано ночей')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='Выручка (KZT)')),
+                ('cancellations', models.IntegerField(default=0, verbose_name='Отмены')),
+                ('room', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_stats', to='hotel.room', verbose_name='Комната')),
+            ],
+            options={
+                'verbose_name': 'Статистика комнаты за день',
+                'verbose_name_plural': 'Статистика комнат по дням',
+                'constraints': [models.UniqueConstraint(fields=('room', 'day'), name='unique_room_day_stats')],
+            },
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
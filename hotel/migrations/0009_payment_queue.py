@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0008_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('idempotency_key', models.CharField(max_length=64, unique=True, verbose_name='Ключ идемпотентности')),
+                ('payment_method', models.CharField(choices=[('kaspi', 'Kaspi Pay (Mock)'), ('halyk', 'Halyk Pay (Mock)'), ('bcc', 'BCC Pay (Mock)'), ('mock', 'Имитация платежа')], max_length=20, verbose_name='Метод оплаты')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Сумма (KZT)')),
+                ('status', models.CharField(choices=[('queued', 'В очереди'), ('processing', 'Обрабатывается'), ('succeeded', 'Успешно'), ('failed', 'Ошибка')], default='queued', max_length=20, verbose_name='Статус')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Попыток')),
+                ('available_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Доступна с')),
+                ('locked_by', models.CharField(blank=True, max_length=64, verbose_name='Обработчик')),
+                ('locked_at', models.DateTimeField(blank=True, null=True, verbose_name='Взята в работу')),
+                ('error', models.TextField(blank=True, verbose_name='Ошибка')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Создана')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Изменена')),
+                ('booking', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_jobs', to='hotel.booking', verbose_name='Бронирование')),
+                ('payment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to='hotel.payment', verbose_name='Платеж')),
+            ],
+            options={
+                'verbose_name': 'Задача оплаты',
+                'verbose_name_plural': 'Очередь оплат',
+                'indexes': [models.Index(fields=['status', 'available_at'], name='payment_job_due_idx')],
+            },
+        ),
+    ]
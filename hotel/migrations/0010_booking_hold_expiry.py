@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 03:42
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0009_payment_queue'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='booking',
+            name='status',
+            field=models.CharField(choices=[('pending', 'Ожидает'), ('paid', 'Оплачено'), ('cancelled', 'Отменено'), ('expired', 'Истекло')], default='pending', max_length=20, verbose_name='Статус брони'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['status', 'created_at'], name='booking_hold_expiry_idx'),
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:12
+
+from django.db import migrations, models
+
+
+def backfill_amenities(apps, schema_editor):
+    Amenity = apps.get_model('hotel', 'Amenity')
+    Room = apps.get_model('hotel', 'Room')
+    bits, rooms = {}, []
+    for room in Room.objects.only('pk', 'amenities'):
+        mask = 0
+        for part in room.amenities.split(','):
+            name = ' '.join(part.split())
+            if not name:
+                continue
+            if name.casefold() not in bits:
+                if len(bits) == 63:
+                    raise RuntimeError('More than 63 distinct amenities in Room.amenities; merge duplicates before migrating.')
+                bits[name.casefold()] = len(bits)
+                Amenity.objects.create(name=name, key=name.casefold(), bit=bits[name.casefold()])
+            mask |= 1 << bits[name.casefold()]
+        room.amenity_mask = mask
+        rooms.append(room)
+    Room.objects.bulk_update(rooms, ['amenity_mask'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0010_booking_hold_expiry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Amenity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('key', models.CharField(max_length=100, unique=True, verbose_name='Ключ')),
+                ('bit', models.PositiveSmallIntegerField(unique=True, verbose_name='Бит')),
+            ],
+            options={
+                'verbose_name': 'Удобство',
+                'verbose_name_plural': 'Удобства',
+            },
+        ),
+        migrations.AddField(
+            model_name='room',
+            name='amenity_mask',
+            field=models.BigIntegerField(default=0, editable=False, verbose_name='Удобства (битовая маска)'),
+        ),
+        migrations.AddIndex(
+            model_name='room',
+            index=models.Index(fields=['amenity_mask'], name='room_amenity_mask_idx'),
+        ),
+        migrations.RunPython(backfill_amenities, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0011_amenity_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatePlan',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='Название')),
+                ('room_type', models.CharField(blank=True, choices=[('single', 'Одноместный'), ('double', 'Двухместный'), ('suite', 'Люкс'), ('family', 'Семейный')], max_length=20, verbose_name='Тип комнаты')),
+                ('start_date', models.DateField(verbose_name='С (ночь)')),
+                ('end_date', models.DateField(verbose_name='По (ночь включительно)')),
+                ('weekdays', models.PositiveSmallIntegerField(default=127, verbose_name='Дни недели')),
+                ('min_nights', models.PositiveSmallIntegerField(default=1, verbose_name='От ночей')),
+                ('price', models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, verbose_name='Цена за ночь (KZT)')),
+                ('percent', models.DecimalField(blank=True, decimal_places=2, max_digits=5, null=True, verbose_name='Наценка/скидка, %')),
+                ('priority', models.SmallIntegerField(default=0, verbose_name='Приоритет')),
+                ('room', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='rate_plans', to='hotel.room', verbose_name='Комната')),
+            ],
+            options={
+                'verbose_name': 'Тариф',
+                'verbose_name_plural': 'Тарифы',
+                'indexes': [models.Index(fields=['end_date', 'start_date'], name='rate_plan_dates_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('end_date__gte', models.F('start_date'))), name='rate_plan_dates_order'), models.CheckConstraint(condition=models.Q(models.Q(('percent__isnull', True), ('price__isnull', False)), models.Q(('percent__isnull', False), ('price__isnull', True)), _connector='OR'), name='rate_plan_price_or_percent')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 04:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0012_rate_plans'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='booking',
+            name='auto_assigned',
+            field=models.BooleanField(default=False, verbose_name='Номер подобран отелем'),
+        ),
+    ]
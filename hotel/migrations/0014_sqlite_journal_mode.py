@@ -0,0 +1,29 @@
+from django.conf import settings
+from django.db import migrations
+
+# journal_mode is stored in the SQLite file itself, unlike the per-connection
+# pragmas of OPTIONS['init_command']: it is switched once here, so that a
+# plain `manage.py check` never rewrites the database header.
+
+
+def journal_mode(mode):
+    def switch(apps, schema_editor):
+        connection = schema_editor.connection
+        if connection.vendor != 'sqlite':
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA journal_mode={mode}')
+    return switch
+
+
+class Migration(migrations.Migration):
+    # The journal mode cannot change inside a transaction
+    atomic = False
+
+    dependencies = [
+        ('hotel', '0013_booking_auto_assigned'),
+    ]
+
+    operations = [
+        migrations.RunPython(journal_mode(getattr(settings, 'SQLITE_JOURNAL_MODE', 'wal')), journal_mode('delete')),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 05:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0014_sqlite_journal_mode'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='paymentjob',
+            name='generation',
+            field=models.PositiveIntegerField(default=1, verbose_name='Заход'),
+        ),
+    ]
@@ -0,0 +1,75 @@
+from django.db import migrations
+
+# SQLite FTS5 search indexes of hotel/fulltext.py: one FTS5 table per source
+# table, kept in sync by triggers and filled from the existing rows. The SQL
+# is frozen here (not read from fulltext.INDEXES) so that later changes to the
+# indexes come with their own migration.
+#
+# SQLite drops the triggers of a table that a migration rebuilds (AlterField,
+# AddField with a default, ...): such a migration must re-create the triggers
+# of its table, e.g. with RunPython(lambda apps, schema_editor: fulltext.install(schema_editor.connection.alias)).
+# Otherwise migrate fails at the end with fulltext.MissingTriggers (signals.py).
+
+PHONE_DIGITS = (
+    "replace(replace(replace(replace(replace(replace(coalesce({0}.phone_number, ''), ' ', ''), '-', ''), '(', ''), ')', ''), '+', ''), '.', '')"
+)
+
+INDEXES = [
+    # (FTS table, source table, indexed source columns, {FTS column: expression over the row}, tokenizer)
+    ('hotel_room_fts', 'hotel_room', ['number', 'description', 'amenities'],
+     {'number': '{0}.number', 'description': '{0}.description', 'amenities': '{0}.amenities'},
+     'unicode61 remove_diacritics 2'),
+    ('hotel_user_fts', 'hotel_customuser', ['username', 'first_name', 'last_name', 'email', 'phone_number'],
+     {'username': '{0}.username', 'full_name': "trim({0}.first_name || ' ' || {0}.last_name)",
+      'email': '{0}.email', 'phone': PHONE_DIGITS},
+     'trigram'),
+    ('hotel_employee_fts', 'hotel_employee', ['full_name', 'email', 'phone_number'],
+     {'full_name': '{0}.full_name', 'email': '{0}.email', 'phone': PHONE_DIGITS},
+     'trigram'),
+]
+
+
+class SQLiteOnly(migrations.RunSQL):
+    """RunSQL that does nothing on other databases (FTS5 is an SQLite extension)."""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'sqlite':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+
+
+def index_sql(table, source, fields, columns, tokenize):
+    names = ', '.join(columns)
+
+    def values(row):
+        return ', '.join([f'{row}.id'] + [expression.format(row) for expression in columns.values()])
+
+    # IF NOT EXISTS: databases migrated before this migration may already have
+    # the tables; the backfill below brings them in line with their source
+    sql = [
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {table} USING fts5({names}, tokenize='{tokenize}')",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_insert AFTER INSERT ON {source} BEGIN "
+        f"INSERT INTO {table}(rowid, {names}) VALUES ({values('new')}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_update AFTER UPDATE OF {', '.join(fields)} ON {source} BEGIN "
+        f"DELETE FROM {table} WHERE rowid = old.id; "
+        f"INSERT INTO {table}(rowid, {names}) VALUES ({values('new')}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {table}_delete AFTER DELETE ON {source} BEGIN "
+        f"DELETE FROM {table} WHERE rowid = old.id; END",
+        f'DELETE FROM {table}',
+        f'INSERT INTO {table}(rowid, {names}) SELECT {values(source)} FROM {source}',
+    ]
+    reverse_sql = [f'DROP TRIGGER IF EXISTS {table}_{event}' for event in ('insert', 'update', 'delete')]
+    reverse_sql.append(f'DROP TABLE IF EXISTS {table}')
+    return SQLiteOnly(sql, reverse_sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('hotel', '0015_payment_job_generation'),
+    ]
+
+    operations = [index_sql(*index) for index in INDEXES]
@@ -1,5 +1,8 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.core.files.storage import default_storage
 from django.contrib.auth.models import AbstractUser
+from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 
 # 1. Custom User Model (for registration/authorization)
@@ -54,22 +57,76 @@ class Room(models.Model):
     max_guests = models.PositiveSmallIntegerField(verbose_name=_("Макс. гостей"))
     description = models.TextField(verbose_name=_("Описание"))
     amenities = models.TextField(blank=True, verbose_name=_("Удобства (через запятую)"))
+    # One bit per Amenity parsed from `amenities`, maintained by hotel/amenities.py
+    amenity_mask = models.BigIntegerField(default=0, editable=False, verbose_name=_("Удобства (битовая маска)"))
     photo = models.ImageField(upload_to='room_photos/', blank=True, null=True, verbose_name=_("Фото"))
+    # Resized WebP/JPEG copies of `photo`, maintained by hotel/photos.py
+    photo_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name=_("Варианты фото"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Изменено"))
     
     class Meta:
         verbose_name = _("Комната")
         verbose_name_plural = _("Комнаты")
+        indexes = [
+            # Keyset pagination of the room list
+            models.Index(fields=['price_per_night', 'id'], name='room_price_id_idx'),
+            # Amenity facets group the result set by mask (a covering index scan)
+            models.Index(fields=['amenity_mask'], name='room_amenity_mask_idx'),
+        ]
 
     def __str__(self):
         return f"Комната №{self.number} ({self.get_room_type_display()})"
 
+    def clean(self):
+        from . import amenities
+        try:
+            amenities.check(self.amenities)
+        except amenities.TooManyAmenities as exc:
+            raise ValidationError({'amenities': str(exc)})
+
+    @property
+    def cache_version(self):
+        """Changes on every save; part of the template fragment cache keys of this room."""
+        return int(self.updated_at.timestamp() * 1_000_000)
+
+    def photo_variant(self, name):
+        """{'webp': url, 'jpeg': url, 'width': ..., 'height': ...} of a processed variant, or None."""
+        variant = (self.photo_variants or {}).get(name)
+        if not variant:
+            return None
+        return {
+            'webp': default_storage.url(variant['webp']),
+            'jpeg': default_storage.url(variant['jpeg']),
+            'width': variant['width'],
+            'height': variant['height'],
+        }
+
+    @property
+    def photo_thumb(self):
+        return self.photo_variant('thumb')
+
+    @property
+    def photo_large(self):
+        return self.photo_variant('large')
+
 # 4. Booking Model
+class BookingQuerySet(models.QuerySet):
+    def active(self):
+        return self.filter(status__in=Booking.ACTIVE_STATUSES)
+
+    def overlapping(self, check_in, check_out):
+        return self.filter(check_in_date__lt=check_out, check_out_date__gt=check_in)
+
+
 class Booking(models.Model):
     STATUS_CHOICES = [
         ('pending', _('Ожидает')),
         ('paid', _('Оплачено')),
         ('cancelled', _('Отменено')),
+        ('expired', _('Истекло')),
     ]
+    # Statuses that keep the room occupied for the booked nights
+    ACTIVE_STATUSES = ('pending', 'paid')
     
     user = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name='bookings', verbose_name=_("Пользователь"))
     room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='bookings', verbose_name=_("Комната"))
@@ -78,6 +135,9 @@ class Booking(models.Model):
     guests = models.PositiveSmallIntegerField(verbose_name=_("Количество гостей"))
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name=_("Статус брони"))
     total_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_("Общая стоимость (KZT)"))
+    # Booked by room type: the hotel picked the room and may move the stay to another room
+    # of the same type until check-in (hotel/allocation.py)
+    auto_assigned = models.BooleanField(default=False, verbose_name=_("Номер подобран отелем"))
     
     # For admin/manager tracking
     processed_by = models.ForeignKey('Employee', on_delete=models.SET_NULL, null=True, blank=True, verbose_name=_("Оформил сотрудник"))
@@ -85,6 +145,8 @@ class Booking(models.Model):
     created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Дата создания"))
     updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Дата обновления"))
 
+    objects = BookingQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Бронирование"
         verbose_name_plural = "Бронирования"
@@ -94,10 +156,33 @@ class Booking(models.Model):
                 name='check_out_after_check_in'
             )
         ]
+        indexes = [
+            # Per-room overlap check (booking form, room detail, availability index refresh);
+            # covers the whole predicate so SQLite never touches the table rows.
+            models.Index(fields=['room', 'status', 'check_in_date', 'check_out_date'], name='booking_room_overlap_idx'),
+            # Overlap search across all rooms (room list, index rebuild)
+            models.Index(fields=['status', 'check_in_date', 'check_out_date', 'room'], name='booking_status_dates_idx'),
+            # Booking history in the profile, newest first (id breaks ties for keyset pagination)
+            models.Index(fields=['user', '-check_in_date', '-id'], name='booking_user_check_in_idx'),
+            # Unpaid holds past their TTL, oldest first (hotel/holds.py)
+            models.Index(fields=['status', 'created_at'], name='booking_hold_expiry_idx'),
+        ]
 
     def __str__(self):
         return f"Бронь №{self.id} - {self.room.number} ({self.user.username})"
 
+    def clean(self):
+        # The unique (room, night) claims would reject the save with an IntegrityError;
+        # forms (the admin) get a readable error instead
+        if self.status not in self.ACTIVE_STATUSES or not (self.room_id and self.check_in_date and self.check_out_date):
+            return
+        clash = (
+            Booking.objects.active().overlapping(self.check_in_date, self.check_out_date)
+            .filter(room_id=self.room_id).exclude(pk=self.pk).values_list('pk', flat=True).first()
+        )
+        if clash is not None:
+            raise ValidationError(_('Номер уже занят на эти даты (бронь №%(booking)s).'), params={'booking': clash})
+
 # 5. Payment Model
 class Payment(models.Model):
     PAYMENT_METHODS = [
@@ -126,3 +211,191 @@ class Payment(models.Model):
 
     def __str__(self):
         return f"Платеж №{self.id} на сумму {self.amount} KZT ({self.get_status_display()})"
+
+# 6. Availability Index (maintained from Booking, see hotel/availability.py)
+class RoomOccupancy(models.Model):
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='occupancy', verbose_name=_("Комната"))
+    month = models.DateField(verbose_name=_("Месяц"))  # always the 1st day of the month
+    # Bit N is set when the night starting on day N+1 of the month is taken
+    mask = models.IntegerField(default=0, verbose_name=_("Занятые ночи"))
+
+    class Meta:
+        verbose_name = _("Занятость комнаты")
+        verbose_name_plural = _("Занятость комнат")
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'month'], name='unique_room_month_occupancy')
+        ]
+        indexes = [
+            models.Index(fields=['month', 'room'], name='occupancy_month_room_idx')
+        ]
+
+    def __str__(self):
+        return f"{self.room_id} / {self.month:%Y-%m}: {self.mask:031b}"
+
+# 7. Claimed Room Nights (one row per booked night, see hotel/reservations.py)
+class RoomNight(models.Model):
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='claimed_nights', verbose_name=_("Комната"))
+    night = models.DateField(verbose_name=_("Ночь"))
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='nights', verbose_name=_("Бронирование"))
+
+    class Meta:
+        verbose_name = _("Занятая ночь")
+        verbose_name_plural = _("Занятые ночи")
+        constraints = [
+            # The database itself refuses a second booking of the same room for the same night
+            models.UniqueConstraint(fields=['room', 'night'], name='unique_room_night')
+        ]
+
+    def __str__(self):
+        return f"{self.room_id} / {self.night:%Y-%m-%d} -> {self.booking_id}"
+
+# 8. Daily Rollups (maintained from Booking, see hotel/rollups.py)
+class DailyRoomStats(models.Model):
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, related_name='daily_stats', verbose_name=_("Комната"))
+    day = models.DateField(verbose_name=_("День"))
+    nights_sold = models.IntegerField(default=0, verbose_name=_("Продано ночей"))
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name=_("Выручка (KZT)"))
+    cancellations = models.IntegerField(default=0, verbose_name=_("Отмены"))
+
+    class Meta:
+        verbose_name = _("Статистика комнаты за день")
+        verbose_name_plural = _("Статистика комнат по дням")
+        constraints = [
+            models.UniqueConstraint(fields=['room', 'day'], name='unique_room_day_stats')
+        ]
+
+    def __str__(self):
+        return f"{self.room_id} / {self.day:%Y-%m-%d}"
+
+
+# 9. Daily Rollups by room type (what the management dashboard reads)
+class DailyRoomTypeStats(models.Model):
+    room_type = models.CharField(max_length=20, choices=Room.ROOM_TYPES, verbose_name=_("Тип комнаты"))
+    day = models.DateField(verbose_name=_("День"))
+    nights_sold = models.IntegerField(default=0, verbose_name=_("Продано ночей"))
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0, verbose_name=_("Выручка (KZT)"))
+    cancellations = models.IntegerField(default=0, verbose_name=_("Отмены"))
+
+    class Meta:
+        verbose_name = _("Отчет по загрузке и выручке")
+        verbose_name_plural = _("Отчет по загрузке и выручке")
+        constraints = [
+            models.UniqueConstraint(fields=['room_type', 'day'], name='unique_room_type_day_stats')
+        ]
+        indexes = [
+            # Date-range reports across all room types
+            models.Index(fields=['day', 'room_type'], name='type_stats_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.room_type} / {self.day:%Y-%m-%d}"
+
+
+# 10. Payment Queue (provider calls run in workers, see hotel/payment_queue.py)
+class PaymentJob(models.Model):
+    STATUS_CHOICES = [
+        ('queued', _('В очереди')),
+        ('processing', _('Обрабатывается')),
+        ('succeeded', _('Успешно')),
+        ('failed', _('Ошибка')),
+    ]
+
+    booking = models.ForeignKey(Booking, on_delete=models.CASCADE, related_name='payment_jobs', verbose_name=_("Бронирование"))
+    # One job per booking: a repeated submit finds the existing job instead of charging twice
+    # (the provider key of each charge is payment_queue.charge_key())
+    idempotency_key = models.CharField(max_length=64, unique=True, verbose_name=_("Ключ идемпотентности"))
+    payment_method = models.CharField(max_length=20, choices=Payment.PAYMENT_METHODS, verbose_name=_("Метод оплаты"))
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name=_("Сумма (KZT)"))
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', verbose_name=_("Статус"))
+    attempts = models.PositiveSmallIntegerField(default=0, verbose_name=_("Попыток"))
+    # Bumped when a failed job is queued again: the new charge gets its own provider key
+    generation = models.PositiveIntegerField(default=1, verbose_name=_("Заход"))
+    available_at = models.DateTimeField(default=timezone.now, verbose_name=_("Доступна с"))
+    locked_by = models.CharField(max_length=64, blank=True, verbose_name=_("Обработчик"))
+    locked_at = models.DateTimeField(null=True, blank=True, verbose_name=_("Взята в работу"))
+    error = models.TextField(blank=True, verbose_name=_("Ошибка"))
+    payment = models.ForeignKey(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs', verbose_name=_("Платеж"))
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name=_("Создана"))
+    updated_at = models.DateTimeField(auto_now=True, verbose_name=_("Изменена"))
+
+    class Meta:
+        verbose_name = _("Задача оплаты")
+        verbose_name_plural = _("Очередь оплат")
+        indexes = [
+            # Workers pick the oldest due job
+            models.Index(fields=['status', 'available_at'], name='payment_job_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.idempotency_key}: {self.get_status_display()}"
+
+
+# 11. Amenity vocabulary (parsed from Room.amenities, see hotel/amenities.py)
+class Amenity(models.Model):
+    name = models.CharField(max_length=100, verbose_name=_("Название"))
+    key = models.CharField(max_length=100, unique=True, verbose_name=_("Ключ"))  # casefolded name
+    # Bit of this amenity in Room.amenity_mask (0..62)
+    bit = models.PositiveSmallIntegerField(unique=True, verbose_name=_("Бит"))
+
+    class Meta:
+        verbose_name = _("Удобство")
+        verbose_name_plural = _("Удобства")
+
+    def __str__(self):
+        return self.name
+
+
+# 12. Rate plans (nightly rates by date, priced by hotel/rates.py)
+class RatePlan(models.Model):
+    WEEKDAYS = [
+        (0, _('Пн')), (1, _('Вт')), (2, _('Ср')), (3, _('Чт')), (4, _('Пт')), (5, _('Сб')), (6, _('Вс')),
+    ]
+    ALL_WEEKDAYS = 0b1111111
+
+    name = models.CharField(max_length=100, verbose_name=_("Название"))
+    # Scope: one room, one room type, or (both empty) every room
+    room = models.ForeignKey(Room, on_delete=models.CASCADE, null=True, blank=True, related_name='rate_plans', verbose_name=_("Комната"))
+    room_type = models.CharField(max_length=20, choices=Room.ROOM_TYPES, blank=True, verbose_name=_("Тип комнаты"))
+    start_date = models.DateField(verbose_name=_("С (ночь)"))
+    end_date = models.DateField(verbose_name=_("По (ночь включительно)"))
+    # Bit N is set when the plan applies to nights starting on weekday N (0 = Monday)
+    weekdays = models.PositiveSmallIntegerField(default=ALL_WEEKDAYS, verbose_name=_("Дни недели"))
+    # Length-of-stay plans: only stays of at least this many nights get them
+    min_nights = models.PositiveSmallIntegerField(default=1, verbose_name=_("От ночей"))
+    # Either a fixed nightly rate or a markup/discount of the rate in percent
+    price = models.DecimalField(max_digits=10, decimal_places=2, null=True, blank=True, verbose_name=_("Цена за ночь (KZT)"))
+    percent = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True, verbose_name=_("Наценка/скидка, %"))
+    priority = models.SmallIntegerField(default=0, verbose_name=_("Приоритет"))
+
+    class Meta:
+        verbose_name = _("Тариф")
+        verbose_name_plural = _("Тарифы")
+        constraints = [
+            models.CheckConstraint(condition=models.Q(end_date__gte=models.F('start_date')), name='rate_plan_dates_order'),
+            models.CheckConstraint(
+                condition=models.Q(price__isnull=False, percent__isnull=True) | models.Q(price__isnull=True, percent__isnull=False),
+                name='rate_plan_price_or_percent',
+            ),
+        ]
+        indexes = [
+            # Plans overlapping a quoted period
+            models.Index(fields=['end_date', 'start_date'], name='rate_plan_dates_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def clean(self):
+        errors = {}
+        if (self.price is None) == (self.percent is None):
+            errors['price'] = _('Укажите либо цену за ночь, либо процент.')
+        if self.percent is not None and self.percent <= -100:
+            errors['percent'] = _('Скидка должна быть меньше 100%.')
+        if self.room_id and self.room_type:
+            errors['room_type'] = _('Тариф задается либо для комнаты, либо для типа комнат.')
+        if self.start_date and self.end_date and self.end_date < self.start_date:
+            errors['end_date'] = _('Дата окончания раньше даты начала.')
+        if not self.weekdays & self.ALL_WEEKDAYS:
+            errors['weekdays'] = _('Выберите хотя бы один день недели.')
+        if errors:
+            raise ValidationError(errors)
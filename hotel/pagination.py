@@ -0,0 +1,144 @@
+import base64
+import json
+from functools import reduce
+
+from django.core.exceptions import FieldDoesNotExist
+from django.core.paginator import Paginator
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Keyset (cursor) pagination: instead of OFFSET n, every page continues from
+# the sort key of the last row it showed, e.g. WHERE (price, id) > (15000, 42).
+# With an index on the sort key each page costs the same however deep it is.
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class KeysetPaginator:
+    """Paginates a queryset by a unique ordering, e.g. ('-check_in_date', '-id').
+
+    The last field must make the ordering unique (normally the primary key).
+    """
+
+    def __init__(self, queryset, ordering, per_page):
+        self.queryset = queryset
+        self.ordering = tuple(ordering)
+        self.per_page = per_page
+        self.fields = [name.lstrip('-') for name in self.ordering]
+        self.descending = [name.startswith('-') for name in self.ordering]
+
+    def field(self, name):
+        """Model field or annotation (e.g. a search rank) the ordering uses."""
+        try:
+            return self.queryset.model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return self.queryset.query.annotations[name].output_field
+
+    def encode_cursor(self, obj, direction):
+        key = [getattr(obj, name) for name in self.fields]
+        payload = json.dumps({'d': direction, 'k': [str(value) for value in key]}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, cursor):
+        try:
+            payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+            direction, raw_key = payload['d'], payload['k']
+            key = [self.field(name).to_python(value) for name, value in zip(self.fields, raw_key, strict=True)]
+        except Exception as exc:
+            raise InvalidCursor(cursor) from exc
+        if direction not in ('next', 'prev'):
+            raise InvalidCursor(cursor)
+        return direction, key
+
+    def _after(self, key, reverse=False):
+        """Q matching rows that sort strictly after `key` (before it if reverse)."""
+        clauses = []
+        for position, (name, value) in enumerate(zip(self.fields, key)):
+            later = self.descending[position] == reverse
+            clause = Q(**{f'{name}__{"gt" if later else "lt"}': value})
+            for prefix_name, prefix_value in zip(self.fields[:position], key[:position]):
+                clause &= Q(**{prefix_name: prefix_value})
+            clauses.append(clause)
+        # The redundant bound on the leading field lets the database range-scan the index
+        first_name, first_value = self.fields[0], key[0]
+        first_later = self.descending[0] == reverse
+        bound = Q(**{f'{first_name}__{"gte" if first_later else "lte"}': first_value})
+        return bound & reduce(lambda left, right: left | right, clauses)
+
+    def _query(self, cursor):
+        """(queryset of per_page + 1 rows, direction, key) for `cursor`; bad cursors give the first page."""
+        direction, key = 'next', None
+        if cursor:
+            try:
+                direction, key = self.decode_cursor(cursor)
+            except InvalidCursor:
+                pass
+
+        if direction == 'prev':
+            reversed_ordering = [name[1:] if name.startswith('-') else f'-{name}' for name in self.ordering]
+            queryset = self.queryset.filter(self._after(key, reverse=True)).order_by(*reversed_ordering)
+        else:
+            queryset = self.queryset.order_by(*self.ordering)
+            if key is not None:
+                queryset = queryset.filter(self._after(key))
+        return queryset[:self.per_page + 1], direction, key
+
+    def _page(self, rows, direction, key):
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows = rows[::-1]
+            has_previous, has_next = more, True
+        else:
+            has_previous, has_next = key is not None, more
+
+        next_cursor = self.encode_cursor(rows[-1], 'next') if rows and has_next else None
+        previous_cursor = self.encode_cursor(rows[0], 'prev') if rows and has_previous else None
+        return KeysetPage(rows, next_cursor, previous_cursor)
+
+    def page(self, cursor=None):
+        """Returns the page after/before `cursor`, or the first page. Bad cursors give the first page."""
+        queryset, direction, key = self._query(cursor)
+        return self._page(list(queryset), direction, key)
+
+    async def apage(self, cursor=None):
+        """Async page(), for async views."""
+        queryset, direction, key = self._query(cursor)
+        return self._page([row async for row in queryset], direction, key)
+
+
+class CappedCountPaginator(Paginator):
+    """Admin paginator that never runs a full COUNT(*) over a large table.
+
+    Counting stops at `count_limit` rows (a LIMITed subquery). Larger result
+    sets show pages up to the limit; filters and search narrow them down.
+    """
+
+    count_limit = 10000
+
+    @cached_property
+    def count(self):
+        return self.object_list[:self.count_limit].count()
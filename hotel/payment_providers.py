@@ -0,0 +1,61 @@
+import random
+import time
+import uuid
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+# Payment provider adapters. The queue worker (hotel/payment_queue.py) only
+# talks to the PaymentProvider interface; settings.PAYMENT_PROVIDER names the
+# class and settings.PAYMENT_PROVIDER_OPTIONS its keyword arguments. A real
+# Kaspi/Halyk/BCC adapter implements charge() on top of the provider's API and
+# passes the idempotency key along, so a retried call never charges twice.
+
+
+class ProviderUnavailable(Exception):
+    """Transient failure (timeout, 5xx): the job is retried later."""
+
+
+class PaymentDeclined(Exception):
+    """Final answer from the provider: the job fails without retries."""
+
+
+class PaymentProvider:
+    def charge(self, payment_method, amount, idempotency_key, reference):
+        """Charges `amount` KZT and returns the provider's transaction id.
+
+        Must be idempotent per key: a repeated call with the same key returns
+        the transaction of the first successful one.
+        """
+        raise NotImplementedError
+
+
+class FakeProvider(PaymentProvider):
+    """Local stand-in for development, load tests and the test suite.
+
+    Sleeps `latency` seconds per call and fails transiently with probability
+    `failure_rate`; amounts of zero or less are declined.
+    """
+
+    def __init__(self, latency=0.0, failure_rate=0.0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.charged = {}
+
+    def charge(self, payment_method, amount, idempotency_key, reference):
+        if self.latency:
+            time.sleep(self.latency)
+        if idempotency_key in self.charged:
+            return self.charged[idempotency_key]
+        if self.failure_rate and random.random() < self.failure_rate:
+            raise ProviderUnavailable(f'{payment_method}: провайдер не ответил')
+        if amount <= 0:
+            raise PaymentDeclined(f'{payment_method}: неверная сумма {amount}')
+        transaction_id = f'{payment_method.upper()}-{uuid.uuid4().hex[:12]}'
+        self.charged[idempotency_key] = transaction_id
+        return transaction_id
+
+
+def get_provider():
+    provider_class = import_string(getattr(settings, 'PAYMENT_PROVIDER', 'hotel.payment_providers.FakeProvider'))
+    return provider_class(**getattr(settings, 'PAYMENT_PROVIDER_OPTIONS', {}))
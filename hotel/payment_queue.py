@@ -0,0 +1,195 @@
+import logging
+import os
+import random
+import socket
+import time
+import uuid
+from datetime import timedelta
+
+from django.db import OperationalError, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from . import reservations
+from .models import Booking, Payment, PaymentJob
+from .payment_providers import PaymentDeclined, get_provider
+
+# Payment queue. Checkout only inserts a PaymentJob (a row in the database,
+# so it survives restarts) and returns; `manage.py payment_worker` processes
+# claim due jobs, call the provider outside any transaction and then record
+# the Payment and mark the booking paid in one short transaction. Pages poll
+# the job status (PaymentStatusView), so checkout latency never depends on
+# the provider.
+#
+# Every booking has a single job, found by its idempotency key, so
+# submitting twice finds the same job. The provider gets charge_key(): it is
+# the same for every retry of one charge, so a job retried after a crash or
+# a lost lock cannot charge twice. A failed job queued again (possibly with
+# another method) starts a new generation with a new key; a provider would
+# otherwise replay the failure or reject the changed parameters.
+
+logger = logging.getLogger(__name__)
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 2.0  # seconds, doubled after every failed attempt
+LOCK_TIMEOUT = timedelta(minutes=5)  # a 'processing' job older than this is taken over
+LOCK_RETRIES = 8  # database lock conflicts while recording a charged payment
+
+
+def idempotency_key(booking):
+    return f'booking-{booking.pk}'
+
+
+def charge_key(job):
+    return f'{job.idempotency_key}-{job.pk}-{job.generation}'
+
+
+def worker_id():
+    return f'{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}'
+
+
+def inactive_reason(booking):
+    if booking.status == 'expired':
+        return 'Время удержания брони истекло.'
+    return 'Бронирование отменено.'
+
+
+def enqueue(booking, payment_method):
+    """Queues the payment of a booking; returns (job, created).
+
+    A pending or finished job for the booking is returned as is; a failed one
+    is queued again with the newly chosen method.
+    """
+    with transaction.atomic():
+        job, created = PaymentJob.objects.get_or_create(
+            idempotency_key=idempotency_key(booking),
+            defaults={'booking': booking, 'payment_method': payment_method, 'amount': booking.total_price},
+        )
+        if not created and job.status == 'failed':
+            PaymentJob.objects.filter(pk=job.pk, status='failed').update(
+                status='queued', payment_method=payment_method, amount=booking.total_price,
+                attempts=0, generation=F('generation') + 1, error='', available_at=timezone.now(), updated_at=timezone.now(),
+            )
+            job.refresh_from_db()
+            created = True
+    return job, created
+
+
+def _claimable(now):
+    return Q(status='queued', available_at__lte=now) | Q(status='processing', locked_at__lt=now - LOCK_TIMEOUT)
+
+
+def claim(worker, limit=1):
+    """Takes up to `limit` due jobs for this worker.
+
+    The UPDATE repeats the due condition, so when two workers pick the same
+    candidates only one of them gets each job.
+    """
+    now = timezone.now()
+    candidates = list(
+        PaymentJob.objects.filter(_claimable(now)).order_by('available_at', 'pk').values_list('pk', flat=True)[:limit]
+    )
+    if not candidates:
+        return []
+    PaymentJob.objects.filter(_claimable(now), pk__in=candidates).update(
+        status='processing', locked_by=worker, locked_at=now, attempts=F('attempts') + 1, updated_at=now,
+    )
+    return list(PaymentJob.objects.filter(pk__in=candidates, locked_by=worker, locked_at=now).select_related('booking'))
+
+
+def _finish(job, **fields):
+    # Only the worker still holding the lock may record the outcome
+    return PaymentJob.objects.filter(pk=job.pk, locked_by=job.locked_by).update(
+        locked_by='', updated_at=timezone.now(), **fields,
+    )
+
+
+def process(job, provider):
+    """Charges one claimed job and records the outcome; returns the final job status."""
+    booking = job.booking
+    if booking.status not in Booking.ACTIVE_STATUSES:
+        _finish(job, status='failed', error=inactive_reason(booking))
+        return 'failed'
+    if booking.status == 'paid':
+        # Paid some other way (admin, an earlier job): nothing left to charge
+        payment = Payment.objects.filter(booking=booking, status='completed').first()
+        if payment:
+            _finish(job, status='succeeded', error='', payment=payment)
+            return 'succeeded'
+
+    try:
+        transaction_id = provider.charge(job.payment_method, job.amount, charge_key(job), reference=f'booking-{booking.pk}')
+    except PaymentDeclined as exc:
+        _finish(job, status='failed', error=str(exc))
+        return 'failed'
+    except Exception as exc:
+        if job.attempts >= MAX_ATTEMPTS:
+            _finish(job, status='failed', error=f'Провайдер недоступен: {exc}')
+            return 'failed'
+        delay = RETRY_DELAY * 2 ** (job.attempts - 1)
+        _finish(job, status='queued', error=str(exc), available_at=timezone.now() + timedelta(seconds=delay))
+        logger.warning('Payment job %s: attempt %s failed, retry in %.0fs: %s', job.pk, job.attempts, delay, exc)
+        return 'queued'
+
+    return _record(job, booking.pk, transaction_id)
+
+
+def _record(job, booking_id, transaction_id):
+    """Stores the payment and marks the booking paid, retrying SQLite lock conflicts with other workers."""
+    delay = reservations.RETRY_DELAY
+    for attempt in range(1, LOCK_RETRIES + 1):
+        try:
+            with transaction.atomic():
+                booking = Booking.objects.select_for_update().select_related('room').get(pk=booking_id)
+                if booking.status not in Booking.ACTIVE_STATUSES:
+                    # Cancelled while the provider was charging: keep the money trail, leave the booking alone
+                    _finish(job, status='failed', error=f'{inactive_reason(booking)} Транзакция {transaction_id}: нужен возврат.')
+                    return 'failed'
+                payment, _ = Payment.objects.update_or_create(booking=booking, defaults={
+                    'amount': job.amount, 'transaction_id': transaction_id,
+                    'payment_method': job.payment_method, 'status': 'completed',
+                })
+                if booking.status != 'paid':
+                    booking.status = 'paid'
+                    booking.save()
+                _finish(job, status='succeeded', error='', payment=payment)
+            return 'succeeded'
+        except OperationalError as exc:
+            if attempt == LOCK_RETRIES or not reservations.is_lock_error(exc):
+                raise
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
+
+
+def run_once(worker=None, limit=10, provider=None):
+    """Processes the jobs that are due right now; returns how many were handled."""
+    worker = worker or worker_id()
+    provider = provider or get_provider()
+    handled = 0
+    while True:
+        jobs = claim(worker, limit)
+        if not jobs:
+            return handled
+        for job in jobs:
+            try:
+                process(job, provider)
+            except Exception as exc:
+                # Left 'processing', the job is taken over after LOCK_TIMEOUT (the provider
+                # call is idempotent) until it runs out of attempts
+                logger.exception('Payment job %s failed unexpectedly', job.pk)
+                if job.attempts >= MAX_ATTEMPTS:
+                    _finish(job, status='failed', error=str(exc))
+            handled += 1
+
+
+def work(worker=None, poll_interval=1.0, batch=1, max_jobs=None):
+    """Worker loop: drains due jobs, sleeping poll_interval seconds whenever the queue is empty."""
+    worker = worker or worker_id()
+    provider = get_provider()
+    handled = 0
+    while max_jobs is None or handled < max_jobs:
+        done = run_once(worker, batch, provider)
+        handled += done
+        if not done:
+            time.sleep(poll_interval)
+    return handled
@@ -0,0 +1,196 @@
+import logging
+import threading
+import time
+from collections import deque
+from contextlib import ExitStack
+from datetime import datetime
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+
+# Request-level performance instrumentation. PerformanceMiddleware (enabled
+# with settings.PERFORMANCE_METRICS) splits every request into SQL time and
+# query count (connection execute wrappers), template render time and total
+# time, tagged with the resolved URL name. Aggregates are kept per process and
+# exported in the Prometheus text format by the 'metrics' view, which also
+# serves a rolling log of the latest requests.
+
+logger = logging.getLogger('hotel.performance')
+
+# Upper bounds (seconds) of the request duration histogram
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+UNRESOLVED = '<unresolved>'
+
+
+def format_entry(entry):
+    at, method, view, status, total, db, queries, template = entry
+    return (f'{datetime.fromtimestamp(at):%Y-%m-%dT%H:%M:%S} {method} {view} {status} total={total * 1000:.1f}ms '
+            f'db={db * 1000:.1f}ms/{queries}q template={template * 1000:.1f}ms')
+
+
+class RequestTimer:
+    """Execute wrapper that accumulates SQL time and query count of one request."""
+
+    def __init__(self):
+        self.db = 0.0
+        self.queries = 0
+        self.template = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.db += time.perf_counter() - started
+            self.queries += 1
+
+
+class ViewStats:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.db = 0.0
+        self.template = 0.0
+        self.queries = 0
+        self.max = 0.0
+        self.buckets = [0] * len(BUCKETS)
+
+    def add(self, total, db, template, queries):
+        self.count += 1
+        self.total += total
+        self.db += db
+        self.template += template
+        self.queries += queries
+        self.max = max(self.max, total)
+        for index, bound in enumerate(BUCKETS):
+            if total <= bound:
+                self.buckets[index] += 1
+                break
+
+
+class Registry:
+    """Thread-safe per-view aggregates plus a bounded log of recent requests."""
+
+    def __init__(self, log_size=500):
+        self.lock = threading.Lock()
+        self.views = {}
+        self.recent = deque(maxlen=log_size)
+        self.overhead = 0.0
+        self.counters = {}
+
+    def record(self, view, method, status, total, db, template, queries):
+        # Log lines are formatted only when read, keeping the request path cheap
+        entry = (time.time(), method, view, status, total, db, queries, template)
+        with self.lock:
+            stats = self.views.get(view)
+            if stats is None:
+                stats = self.views[view] = ViewStats()
+            stats.add(total, db, template, queries)
+            self.recent.append(entry)
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(format_entry(entry))
+
+    def add_overhead(self, seconds):
+        with self.lock:
+            self.overhead += seconds
+
+    def count(self, name, help_text, value=1):
+        """Adds to a process-wide counter outside the request path (background jobs)."""
+        with self.lock:
+            current = self.counters.get(name, (help_text, 0))[1]
+            self.counters[name] = (help_text, current + value)
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+            self.recent.clear()
+            self.overhead = 0.0
+            self.counters = {}
+
+    def log(self):
+        with self.lock:
+            entries = list(self.recent)
+        return [format_entry(entry) for entry in entries]
+
+    def prometheus(self):
+        with self.lock:
+            views = sorted(self.views.items())
+            overhead = self.overhead
+            counters = sorted(self.counters.items())
+            lines = [
+                '# HELP hotel_request_duration_seconds Total request time, by URL name.',
+                '# TYPE hotel_request_duration_seconds histogram',
+            ]
+            for view, stats in views:
+                cumulative = 0
+                for bound, count in zip(BUCKETS, stats.buckets):
+                    cumulative += count
+                    lines.append(f'hotel_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {cumulative}')
+                lines.append(f'hotel_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {stats.count}')
+                lines.append(f'hotel_request_duration_seconds_sum{{view="{view}"}} {stats.total:.6f}')
+                lines.append(f'hotel_request_duration_seconds_count{{view="{view}"}} {stats.count}')
+            for name, help_text, attr in (
+                ('hotel_request_db_seconds_total', 'Time spent executing SQL.', 'db'),
+                ('hotel_request_template_seconds_total', 'Template render time, SQL excluded.', 'template'),
+                ('hotel_request_queries_total', 'SQL queries executed.', 'queries'),
+                ('hotel_request_max_seconds', 'Slowest request since start.', 'max'),
+            ):
+                lines.append(f'# HELP {name} {help_text}')
+                lines.append(f'# TYPE {name} {"gauge" if attr == "max" else "counter"}')
+                for view, stats in views:
+                    value = getattr(stats, attr)
+                    lines.append(f'{name}{{view="{view}"}} {value if attr == "queries" else f"{value:.6f}"}')
+        lines += [
+            '# HELP hotel_instrumentation_overhead_seconds_total Time spent by the middleware on its own bookkeeping.',
+            '# TYPE hotel_instrumentation_overhead_seconds_total counter',
+            f'hotel_instrumentation_overhead_seconds_total {overhead:.6f}',
+        ]
+        for name, (help_text, value) in counters:
+            lines += [
+                f'# HELP {name} {help_text}',
+                f'# TYPE {name} counter',
+                f'{name} {value:.6f}' if isinstance(value, float) else f'{name} {value}',
+            ]
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry(getattr(settings, 'PERFORMANCE_LOG_SIZE', 500))
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else UNRESOLVED
+
+
+class PerformanceMiddleware:
+    """Times every request; list it first in MIDDLEWARE so the total covers the whole stack."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PERFORMANCE_METRICS', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        timer = request._performance_timer = RequestTimer()
+        started = time.perf_counter()
+        with ExitStack() as wrappers:
+            for alias in connections:
+                wrappers.enter_context(connections[alias].execute_wrapper(timer))
+            response = self.get_response(request)
+        finished = time.perf_counter()
+
+        registry.record(view_name(request), request.method, response.status_code,
+                        finished - started, timer.db, timer.template, timer.queries)
+        registry.add_overhead(time.perf_counter() - finished)
+        return response
+
+    def process_template_response(self, request, response):
+        # Render here (this middleware runs last) so the render can be timed;
+        # the handler then sees an already rendered response.
+        timer = request._performance_timer
+        db_before = timer.db
+        started = time.perf_counter()
+        response.render()
+        timer.template = time.perf_counter() - started - (timer.db - db_before)
+        return response
@@ -0,0 +1,148 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait as wait_futures
+from io import BytesIO
+from pathlib import Path
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.static import serve
+from PIL import Image, ImageOps
+
+from . import search_cache
+from .models import Room
+
+# Room photo pipeline. An uploaded Room.photo is rendered into fixed-size
+# variants (a card thumbnail for room_list, a large image for room_detail),
+# each as WebP and JPEG, stored under content-hashed names so they can be
+# cached forever. Room.photo_variants records the files and the photo they
+# were made from; a room whose photo no longer matches is "stale".
+#
+# Uploads are processed after commit on a small thread pool inside the web
+# process; `manage.py process_photos` backfills existing rooms with a
+# process pool.
+
+logger = logging.getLogger(__name__)
+
+VARIANT_DIR = 'room_photos/variants'
+VARIANTS = {
+    'thumb': (400, 300),
+    'large': (1000, 600),
+}
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+CACHE_SECONDS = 365 * 24 * 60 * 60
+
+_executor = None
+_executor_lock = threading.Lock()
+_pending = set()
+
+
+def render(data):
+    """Renders every variant of an encoded image: [(variant, format, bytes, width, height)].
+
+    Pure function of the input bytes (no database or storage access), so it
+    can run in a worker process.
+    """
+    with Image.open(BytesIO(data)) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        rendered = []
+        for name, size in VARIANTS.items():
+            resized = ImageOps.fit(image, size, Image.Resampling.LANCZOS)
+            for fmt, (pil_format, options) in FORMATS.items():
+                buffer = BytesIO()
+                resized.save(buffer, pil_format, **options)
+                rendered.append((name, fmt, buffer.getvalue(), *resized.size))
+    return rendered
+
+
+def store(rendered, source):
+    """Writes rendered variants under content-hashed names and returns the photo_variants dict."""
+    variants = {'source': source}
+    for name, fmt, data, width, height in rendered:
+        path = f'{VARIANT_DIR}/{hashlib.sha256(data).hexdigest()[:20]}.{fmt}'
+        if not default_storage.exists(path):
+            path = default_storage.save(path, ContentFile(data))
+        variants.setdefault(name, {'width': width, 'height': height})[fmt] = path
+    return variants
+
+
+def is_stale(room):
+    return (room.photo.name or '') != (room.photo_variants or {}).get('source', '')
+
+
+def apply(room, variants):
+    """Saves variants unless the photo changed meanwhile; bumps the room version for the fragment cache."""
+    same_photo = Q(photo=room.photo.name) if room.photo.name else Q(photo='') | Q(photo__isnull=True)
+    updated = Room.objects.filter(same_photo, pk=room.pk).update(photo_variants=variants, updated_at=timezone.now())
+    if updated:
+        search_cache.invalidate_all()
+    return bool(updated)
+
+
+def process_room(room_id):
+    """Brings the variants of one room in line with its current photo."""
+    room = Room.objects.filter(pk=room_id).first()
+    if room is None or not is_stale(room):
+        return False
+    variants = {}
+    if room.photo:
+        with room.photo.open('rb') as source:
+            variants = store(render(source.read()), room.photo.name)
+    return apply(room, variants)
+
+
+def _run(room_id):
+    try:
+        process_room(room_id)
+    except Exception:
+        logger.exception('Room %s: photo processing failed', room_id)
+    finally:
+        connections.close_all()  # this worker thread's own connections
+
+
+def executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=settings.PHOTO_WORKERS, thread_name_prefix='room-photos')
+        return _executor
+
+
+def schedule(room_id):
+    """Processes the room's photo once the current transaction commits.
+
+    Runs on the background pool, or inline when settings.PHOTO_BACKGROUND is off.
+    """
+    def submit():
+        if not settings.PHOTO_BACKGROUND:
+            process_room(room_id)
+            return
+        future = executor().submit(_run, room_id)
+        with _executor_lock:
+            _pending.add(future)
+        future.add_done_callback(_pending.discard)
+
+    transaction.on_commit(submit)
+
+
+def wait(timeout=None):
+    """Blocks until the scheduled photo jobs are done (for tests and shutdown)."""
+    with _executor_lock:
+        pending = list(_pending)
+    wait_futures(pending, timeout=timeout)
+
+
+def serve_variant(request, path):
+    """Serves a variant file; names are content hashes, so they never change and can be cached for a year."""
+    response = serve(request, path, document_root=Path(settings.MEDIA_ROOT) / VARIANT_DIR)
+    patch_cache_control(response, public=True, max_age=CACHE_SECONDS, immutable=True)
+    return response
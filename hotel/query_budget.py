@@ -0,0 +1,38 @@
+from contextlib import contextmanager
+
+from django.db import connections
+from django.test.utils import CaptureQueriesContext
+
+# Query budgets: every view (and admin changelist) declares how many SQL
+# queries a single request may issue. The test suite renders each route and
+# fails as soon as one goes over, which catches N+1 regressions early.
+
+
+def query_budget(max_queries):
+    """Class decorator that declares the per-request query budget of a view or ModelAdmin."""
+    def decorate(cls):
+        cls.query_budget = max_queries
+        return cls
+    return decorate
+
+
+def budget_of(view):
+    """Returns the declared budget of a URL callback or class, or None."""
+    cls = getattr(view, 'view_class', None) or getattr(view, 'model_admin', None) or view
+    if not isinstance(cls, type):
+        cls = type(cls)
+    return getattr(cls, 'query_budget', None)
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+@contextmanager
+def enforce_query_budget(max_queries, label='', using='default'):
+    """Raises QueryBudgetExceeded if the block runs more than max_queries queries."""
+    with CaptureQueriesContext(connections[using]) as captured:
+        yield captured
+    if len(captured) > max_queries:
+        queries = '\n'.join(f'  {query["sql"]}' for query in captured.captured_queries)
+        raise QueryBudgetExceeded(f'{label or "block"}: {len(captured)} queries, budget {max_queries}\n{queries}')
@@ -0,0 +1,207 @@
+from datetime import timedelta
+from decimal import Decimal
+
+from django.db.models import Q
+
+from .availability import month_start, next_month
+from .models import RatePlan, Room
+
+# Quote engine. A stay costs the sum of its nightly rates; a night's rate is
+# Room.price_per_night unless a RatePlan covers it:
+#
+#   * fixed-price plans replace the rate; when several cover a night the most
+#     specific scope wins (room > room type > every room), then the highest
+#     priority, then the newest plan;
+#   * percent plans (weekend markups, length-of-stay discounts) all add up and
+#     apply to that rate, rounded half up to whole tenge per night;
+#   * a plan with min_nights only applies to stays of at least that many nights.
+#
+# Money is counted in integer tiyn, so totals are exact and equal to the sum of
+# the nightly rates shown to the guest. A RateCalendar loads the plans of a
+# period in one query and paints each plan onto per-night arrays once per
+# (room type, level) instead of resolving plans per room and night; rooms of
+# the same type and base price share one row. That keeps a month grid of
+# every room to a few milliseconds (see `manage.py benchmark`).
+
+
+def to_tiyn(amount):
+    return int(Decimal(amount).scaleb(2))
+
+
+def to_decimal(tiyn):
+    return Decimal(tiyn).scaleb(-2)
+
+
+def adjust(tiyn, basis_points):
+    """Applies a markup/discount in hundredths of a percent, rounded half up to whole tenge."""
+    if not basis_points:
+        return tiyn
+    scaled = tiyn * (10000 + basis_points)
+    return (scaled + 500000) // 1000000 * 100
+
+
+class Plan:
+    """A RatePlan row reduced to what pricing needs, with its nights in the calendar period."""
+
+    def __init__(self, row, start, end):
+        (self.pk, self.room_id, self.room_type, first, last, self.weekdays, self.min_nights,
+         price, percent, self.priority) = row
+        self.price = None if price is None else to_tiyn(price)
+        self.basis_points = 0 if percent is None else to_tiyn(percent)
+        self.specificity = 2 if self.room_id else 1 if self.room_type else 0
+        begin = max((first - start).days, 0)
+        stop = min((last - start).days + 1, (end - start).days)
+        if self.weekdays & RatePlan.ALL_WEEKDAYS == RatePlan.ALL_WEEKDAYS:
+            self.nights = range(begin, stop)
+        else:
+            weekday = start.weekday()
+            self.nights = [night for night in range(begin, stop) if self.weekdays >> (weekday + night) % 7 & 1]
+
+    @property
+    def order(self):
+        # Painting order of fixed prices: the last plan painted on a night wins
+        return (self.specificity, self.priority, self.pk)
+
+    def covers(self, room_type, room_id):
+        if self.room_id:
+            return self.room_id == room_id
+        return not self.room_type or self.room_type == room_type
+
+
+class Quote:
+    def __init__(self, room_id, check_in, nightly):
+        self.room_id = room_id
+        self.check_in = check_in
+        self.nightly_tiyn = nightly
+
+    @property
+    def nights(self):
+        return len(self.nightly_tiyn)
+
+    @property
+    def check_out(self):
+        return self.check_in + timedelta(days=self.nights)
+
+    @property
+    def total(self):
+        return to_decimal(sum(self.nightly_tiyn))
+
+    @property
+    def nightly(self):
+        """[(night, rate)] as Decimal tenge."""
+        return [(self.check_in + timedelta(days=offset), to_decimal(tiyn)) for offset, tiyn in enumerate(self.nightly_tiyn)]
+
+
+def _plans(start, end, rooms=None):
+    plans = RatePlan.objects.filter(start_date__lt=end, end_date__gte=start)
+    if rooms is not None:
+        rooms = list(rooms)
+        plans = plans.filter(
+            Q(room__isnull=True, room_type__in=[''] + sorted({room_type for _, room_type, _ in rooms}))
+            | Q(room__in=[pk for pk, _, _ in rooms])
+        )
+    return plans.values_list(
+        'pk', 'room_id', 'room_type', 'start_date', 'end_date', 'weekdays', 'min_nights', 'price', 'percent', 'priority',
+    )
+
+
+def room_rows(rooms):
+    """(id, room_type, price_per_night) of Room instances, or of a Room queryset in one query."""
+    if hasattr(rooms, 'values_list'):
+        return list(rooms.values_list('id', 'room_type', 'price_per_night'))
+    return [(room.pk, room.room_type, room.price_per_night) for room in rooms]
+
+
+class RateCalendar:
+    """Nightly rates of many rooms over the nights start .. end - 1.
+
+    `rooms` are (id, room_type, price_per_night) rows (see room_rows()); the
+    plans are loaded in one query, or taken from `plans` when given.
+    """
+
+    def __init__(self, rooms, start, end, plans=None):
+        if end <= start:
+            raise ValueError('end must be after start')
+        self.start, self.end = start, end
+        self.size = (end - start).days
+        self.rooms = {pk: (room_type, to_tiyn(price)) for pk, room_type, price in rooms}
+        if plans is None:
+            # A few rooms only need their own plans; for many, all plans of the period are fewer rows
+            plans = _plans(start, end, rooms if len(self.rooms) < 50 else None)
+        self.plans = sorted((Plan(row, start, end) for row in plans), key=lambda plan: plan.order)
+        self.own_plans = {plan.room_id for plan in self.plans if plan.room_id}
+        self.levels = sorted({1} | {plan.min_nights for plan in self.plans})
+        self._layers = {}
+        self._rows = {}
+
+    def level(self, nights):
+        """The length-of-stay threshold that applies to a stay of `nights` nights."""
+        return max(level for level in self.levels if level <= nights)
+
+    def _layer(self, room_type, room_id, level):
+        key = (room_type, room_id, level)
+        layer = self._layers.get(key)
+        if layer is None:
+            fixed = [None] * self.size
+            basis_points = [0] * self.size
+            for plan in self.plans:
+                if plan.min_nights > level or not plan.covers(room_type, room_id):
+                    continue
+                if plan.price is not None:
+                    for night in plan.nights:
+                        fixed[night] = plan.price
+                else:
+                    for night in plan.nights:
+                        basis_points[night] += plan.basis_points
+            layer = self._layers[key] = (fixed, basis_points)
+        return layer
+
+    def row(self, room_id, level=1):
+        """Nightly rates of one room in tiyn for the whole period; rooms priced alike share the list."""
+        room_type, base = self.rooms[room_id]
+        key = (room_type, room_id if room_id in self.own_plans else None, level, base)
+        row = self._rows.get(key)
+        if row is None:
+            fixed, basis_points = self._layer(*key[:3])
+            row = self._rows[key] = [
+                adjust(base if price is None else price, points) for price, points in zip(fixed, basis_points)
+            ]
+        return row
+
+    def quote(self, room_id, check_in, check_out):
+        nights = (check_out - check_in).days
+        first = (check_in - self.start).days
+        if nights <= 0 or first < 0 or check_out > self.end:
+            raise ValueError('the stay is outside of the calendar period')
+        return Quote(room_id, check_in, self.row(room_id, self.level(nights))[first:first + nights])
+
+    def grid(self):
+        """{room id: [nightly rate as Decimal]} for one-night stays; equal rows are shared lists."""
+        rows = {}
+        amounts = {}  # a few hundred distinct rates: one Decimal each
+        grid = {}
+        for room_id in self.rooms:
+            row = self.row(room_id)
+            converted = rows.get(id(row))
+            if converted is None:
+                converted = rows[id(row)] = [
+                    amounts.get(tiyn) or amounts.setdefault(tiyn, to_decimal(tiyn)) for tiyn in row
+                ]
+            grid[room_id] = converted
+        return grid
+
+
+def quote(room, check_in, check_out):
+    """Prices one stay of a Room in one query (the plans that can cover it)."""
+    return RateCalendar(room_rows([room]), check_in, check_out).quote(room.pk, check_in, check_out)
+
+
+def month_calendar(month, rooms=None):
+    """RateCalendar of every room (or of a Room queryset) for one month."""
+    month = month_start(month)
+    rooms = Room.objects.order_by('id') if rooms is None else rooms
+    return RateCalendar(room_rows(rooms), month, next_month(month))
+
+
+def month_grid(month, rooms=None):
+    return month_calendar(month, rooms).grid()
@@ -0,0 +1,139 @@
+import random
+import time
+from datetime import timedelta
+
+from django.db import IntegrityError, OperationalError, transaction
+
+from . import rates
+from .models import Booking, RoomNight
+
+# Reservation engine. A booking owns one RoomNight row per night, and the
+# (room, night) unique constraint lets the database arbitrate concurrent
+# claims: the losing transaction gets an IntegrityError instead of a double
+# booking. Claims on different rooms never touch the same rows, so there is
+# no application-level lock to serialize them.
+
+MAX_ATTEMPTS = 5
+RETRY_DELAY = 0.02  # seconds, doubled after every attempt
+
+
+class RoomUnavailable(Exception):
+    pass
+
+
+def stay_nights(check_in, check_out):
+    return [check_in + timedelta(days=offset) for offset in range((check_out - check_in).days)]
+
+
+def sync_nights(booking):
+    """Makes the claimed nights of one booking match its room, dates and status."""
+    wanted = set()
+    if booking.status in Booking.ACTIVE_STATUSES:
+        wanted = {(booking.room_id, night) for night in stay_nights(booking.check_in_date, booking.check_out_date)}
+    claimed = set(RoomNight.objects.filter(booking=booking).values_list('room_id', 'night'))
+    if claimed == wanted:
+        return
+
+    released = claimed - wanted
+    if released:
+        RoomNight.objects.filter(booking=booking, night__in=[night for _, night in released]).delete()
+    missing = wanted - claimed
+    if missing:
+        RoomNight.objects.bulk_create(
+            [RoomNight(room_id=room_id, night=night, booking=booking) for room_id, night in sorted(missing)]
+        )
+
+
+def sync_bookings(bookings):
+    """Re-syncs claimed nights after a bulk queryset.update() that skipped signals.
+
+    Works on the whole set at once: one query reads the current claims, one
+    releases the nights of inactive bookings, one claims the missing nights.
+    """
+    wanted = {}
+    for pk, room_id, check_in, check_out, status in bookings.values_list(
+        'pk', 'room_id', 'check_in_date', 'check_out_date', 'status'
+    ):
+        wanted[pk] = set()
+        if status in Booking.ACTIVE_STATUSES:
+            wanted[pk] = {(room_id, night) for night in stay_nights(check_in, check_out)}
+    claimed = {pk: set() for pk in wanted}
+    for booking_id, room_id, night in RoomNight.objects.filter(booking_id__in=list(wanted)).values_list(
+        'booking_id', 'room_id', 'night'
+    ):
+        claimed[booking_id].add((room_id, night))
+
+    released_all = [pk for pk in wanted if claimed[pk] and not wanted[pk]]
+    if released_all:
+        RoomNight.objects.filter(booking_id__in=released_all).delete()
+    for pk in wanted:
+        # Moved or shortened stays are rare here; release their nights one booking at a time
+        released = claimed[pk] - wanted[pk] if wanted[pk] else set()
+        if released:
+            RoomNight.objects.filter(booking_id=pk, night__in=[night for _, night in released]).delete()
+    missing = [
+        RoomNight(room_id=room_id, night=night, booking_id=pk)
+        for pk in wanted for room_id, night in sorted(wanted[pk] - claimed[pk])
+    ]
+    if missing:
+        RoomNight.objects.bulk_create(missing, batch_size=1000)
+
+
+def rebuild(batch_size=5000):
+    """Recreates all claims from the bookings table (after bulk_create imports).
+
+    Streams the bookings and inserts in batches, so memory stays bounded on
+    large tables.
+    """
+    claimed = 0
+    with transaction.atomic():
+        RoomNight.objects.all().delete()
+        nights = []
+        stays = Booking.objects.active().order_by('pk').values_list('pk', 'room_id', 'check_in_date', 'check_out_date')
+        for booking_id, room_id, check_in, check_out in stays.iterator(chunk_size=batch_size):
+            nights.extend(RoomNight(room_id=room_id, night=night, booking_id=booking_id) for night in stay_nights(check_in, check_out))
+            if len(nights) >= batch_size:
+                RoomNight.objects.bulk_create(nights, batch_size=1000, ignore_conflicts=True)
+                claimed += len(nights)
+                nights = []
+        RoomNight.objects.bulk_create(nights, batch_size=1000, ignore_conflicts=True)
+    return claimed + len(nights)
+
+
+def is_lock_error(exc):
+    message = str(exc).lower()
+    return 'locked' in message or 'deadlock' in message or 'could not serialize' in message
+
+
+def reserve(room, user, check_in, check_out, guests, **fields):
+    """Creates a pending booking if every night of the stay is still free.
+
+    Raises RoomUnavailable when another booking already holds one of the
+    nights. Transient lock errors from concurrent writers are retried with
+    jittered exponential backoff.
+    """
+    if check_out <= check_in:
+        raise ValueError('check_out must be after check_in')
+
+    total_price = rates.quote(room, check_in, check_out).total
+    delay = RETRY_DELAY
+    for attempt in range(1, MAX_ATTEMPTS + 1):
+        try:
+            with transaction.atomic():
+                # post_save claims the RoomNight rows inside this transaction
+                return Booking.objects.create(
+                    user=user,
+                    room=room,
+                    check_in_date=check_in,
+                    check_out_date=check_out,
+                    guests=guests,
+                    total_price=total_price,
+                    **fields,
+                )
+        except IntegrityError:
+            raise RoomUnavailable(room.pk, check_in, check_out)
+        except OperationalError as exc:
+            if attempt == MAX_ATTEMPTS or not is_lock_error(exc):
+                raise
+            time.sleep(delay * (1 + random.random()))
+            delay *= 2
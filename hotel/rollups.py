@@ -0,0 +1,269 @@
+from collections import defaultdict
+from decimal import ROUND_DOWN, Decimal
+
+from django.db import connection, transaction
+from django.db.models import Sum
+
+from .models import Booking, DailyRoomStats, DailyRoomTypeStats, Room
+from .reservations import stay_nights
+
+# Reporting rollups. DailyRoomStats holds one row per (room, day) and
+# DailyRoomTypeStats one row per (room type, day) with:
+#   nights_sold    nights of pending or paid bookings,
+#   revenue        total_price of paid bookings, spread over their nights,
+#   cancellations  cancelled bookings, counted on their check-in day.
+# Booking saves and deletes apply the difference between the old and the
+# new state of the booking as additive upserts, so the rows stay exact
+# without rescanning bookings; the dashboard reads nothing else.
+
+ZERO = Decimal('0.00')
+CENT = Decimal('0.01')
+METRICS = ('nights_sold', 'revenue', 'cancellations')
+
+
+def state(booking):
+    """The fields of a booking the rollups depend on, as stored by pre_save."""
+    return (booking.room_id, booking.status, booking.check_in_date, booking.check_out_date, booking.total_price)
+
+
+def split(total, parts):
+    """Spreads an amount over `parts` nights to the cent; the first night takes the remainder."""
+    total = Decimal(str(total))
+    share = (total / parts).quantize(CENT, rounding=ROUND_DOWN)
+    return [total - share * (parts - 1)] + [share] * (parts - 1)
+
+
+def contribution(status, check_in, check_out, total_price):
+    """{day: (nights_sold, revenue, cancellations)} that one booking adds to its room."""
+    if status == 'cancelled':
+        return {check_in: (0, ZERO, 1)}
+    if status not in Booking.ACTIVE_STATUSES:
+        return {}
+    nights = stay_nights(check_in, check_out)
+    if status == 'paid':
+        revenue = split(total_price, len(nights))
+    else:
+        revenue = [ZERO] * len(nights)
+    return {night: (1, amount, 0) for night, amount in zip(nights, revenue)}
+
+
+def _add(deltas, key, values, sign=1):
+    row = deltas[key]
+    for index, value in enumerate(values):
+        row[index] += sign * value
+
+
+def _new_deltas():
+    return defaultdict(lambda: [0, ZERO, 0])
+
+
+def _upsert(model, key_field, deltas):
+    """Adds {(key, day): [nights, revenue, cancellations]} to the model's rows in one statement."""
+    rows = [
+        (key, connection.ops.adapt_datefield_value(day), nights, connection.ops.adapt_decimalfield_value(revenue), cancelled)
+        for (key, day), (nights, revenue, cancelled) in deltas.items()
+        if nights or revenue or cancelled
+    ]
+    if not rows:
+        return
+    qn = connection.ops.quote_name
+    table = qn(model._meta.db_table)
+    key = qn(model._meta.get_field(key_field).column)
+    updates = ', '.join(f'{qn(column)} = {table}.{qn(column)} + excluded.{qn(column)}' for column in METRICS)
+    sql = (
+        f'INSERT INTO {table} ({key}, {qn("day")}, {", ".join(qn(column) for column in METRICS)}) '
+        f'VALUES (%s, %s, %s, %s, %s) ON CONFLICT ({key}, {qn("day")}) DO UPDATE SET {updates}'
+    )
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, rows)
+
+
+def apply(room_deltas, type_deltas):
+    with transaction.atomic(savepoint=False):
+        _upsert(DailyRoomStats, 'room', room_deltas)
+        _upsert(DailyRoomTypeStats, 'room_type', type_deltas)
+
+
+def record_change(old, new, room_type=None, rooms=True):
+    """Applies the change of one booking from state `old` to state `new` (either may be None).
+
+    States are tuples from state(); room_type is the type of the booking's
+    current room when the caller has it loaded. The other room's type is
+    looked up only when the booking moved. rooms=False leaves the per-room
+    rows alone (they are being deleted together with the room).
+    """
+    current_room = (new or old)[0]
+    room_deltas, type_deltas = _new_deltas(), _new_deltas()
+    for sign, booking_state in ((-1, old), (1, new)):
+        if booking_state is None:
+            continue
+        room_id, status, check_in, check_out, total_price = booking_state
+        if room_id != current_room or room_type is None:
+            booking_type = Room.objects.values_list('room_type', flat=True).get(pk=room_id)
+        else:
+            booking_type = room_type
+        for day, values in contribution(status, check_in, check_out, total_price).items():
+            _add(room_deltas, (room_id, day), values, sign)
+            _add(type_deltas, (booking_type, day), values, sign)
+    apply(room_deltas if rooms else {}, type_deltas)
+
+
+def record_created(states, room_types):
+    """Adds new bookings (states from state()) in one upsert per table; room_types maps room ids to types."""
+    room_deltas, type_deltas = _new_deltas(), _new_deltas()
+    for room_id, status, check_in, check_out, total_price in states:
+        for day, values in contribution(status, check_in, check_out, total_price).items():
+            _add(room_deltas, (room_id, day), values)
+            _add(type_deltas, (room_types[room_id], day), values)
+    apply(room_deltas, type_deltas)
+
+
+def record_moves(moves):
+    """Re-attributes bookings moved to another room of the same type: [(state before the move, new room id)].
+
+    The per-type rows do not change; the per-room rows take one upsert.
+    """
+    room_deltas = _new_deltas()
+    for (room_id, status, check_in, check_out, total_price), new_room_id in moves:
+        for day, values in contribution(status, check_in, check_out, total_price).items():
+            _add(room_deltas, (room_id, day), values, -1)
+            _add(room_deltas, (new_room_id, day), values)
+    apply(room_deltas, {})
+
+
+def move_room(room_id, old_type, new_type):
+    """Re-attributes a room's history after its room_type changed."""
+    if old_type == new_type:
+        return
+    room_deltas, type_deltas = {}, _new_deltas()
+    for day, *values in DailyRoomStats.objects.filter(room_id=room_id).values_list('day', *METRICS).iterator():
+        _add(type_deltas, (old_type, day), values, -1)
+        _add(type_deltas, (new_type, day), values)
+    apply(room_deltas, type_deltas)
+
+
+def _expected(bookings):
+    """Folds (room_id, status, check_in, check_out, total_price) rows into {(room_id, day): [metrics]}."""
+    rows = _new_deltas()
+    for room_id, status, check_in, check_out, total_price in bookings:
+        for day, values in contribution(status, check_in, check_out, total_price).items():
+            _add(rows, (room_id, day), values)
+    return rows
+
+
+def _states(bookings):
+    return bookings.values_list('room_id', 'status', 'check_in_date', 'check_out_date', 'total_price')
+
+
+def refresh(room_id, start, end, room_type=None):
+    """Recomputes one room's rows for days start .. end - 1 from its bookings.
+
+    The per-type rows receive the same difference, so both tables stay in step.
+    """
+    if room_type is None:
+        room_type = Room.objects.values_list('room_type', flat=True).get(pk=room_id)
+    bookings = Booking.objects.filter(room_id=room_id, check_in_date__lt=end, check_out_date__gt=start)
+    expected = _expected(_states(bookings))
+    stored = DailyRoomStats.objects.filter(room_id=room_id, day__gte=start, day__lt=end).values_list('day', *METRICS)
+
+    room_deltas, type_deltas = _new_deltas(), _new_deltas()
+    for key, values in expected.items():
+        if start <= key[1] < end:
+            _add(room_deltas, key, values)
+            _add(type_deltas, (room_type, key[1]), values)
+    for day, *values in stored:
+        _add(room_deltas, (room_id, day), values, -1)
+        _add(type_deltas, (room_type, day), values, -1)
+    apply(room_deltas, type_deltas)
+
+
+def refresh_bookings(bookings):
+    """Refreshes every room-day touched by the given Booking queryset (after a bulk update)."""
+    spans = {}
+    for room_id, room_type, check_in, check_out in bookings.values_list('room_id', 'room__room_type', 'check_in_date', 'check_out_date'):
+        start, end, _ = spans.get(room_id, (check_in, check_out, room_type))
+        spans[room_id] = (min(start, check_in), max(end, check_out), room_type)
+    for room_id, (start, end, room_type) in spans.items():
+        refresh(room_id, start, end, room_type)
+
+
+def _expected_by_room(batch_size):
+    """Streams the bookings table room by room; yields {(room_id, day): [metrics]} per room."""
+    bookings = _states(Booking.objects.order_by('room_id', 'check_in_date')).iterator(chunk_size=batch_size)
+    current, chunk = None, []
+    for row in bookings:
+        if row[0] != current and chunk:
+            yield _expected(chunk)
+            chunk = []
+        current = row[0]
+        chunk.append(row)
+    if chunk:
+        yield _expected(chunk)
+
+
+def rebuild(batch_size=5000):
+    """Drops and recreates both rollups from the bookings table.
+
+    Bookings are streamed one room at a time, so memory stays bounded by the
+    history of a single room.
+    """
+    written = 0
+    with transaction.atomic():
+        DailyRoomStats.objects.all().delete()
+        DailyRoomTypeStats.objects.all().delete()
+        pending = []
+        for rows in _expected_by_room(batch_size):
+            pending.extend(
+                DailyRoomStats(room_id=room_id, day=day, nights_sold=nights, revenue=revenue, cancellations=cancelled)
+                for (room_id, day), (nights, revenue, cancelled) in rows.items()
+            )
+            if len(pending) >= batch_size:
+                DailyRoomStats.objects.bulk_create(pending, batch_size=1000)
+                written += len(pending)
+                pending = []
+        DailyRoomStats.objects.bulk_create(pending, batch_size=1000)
+        written += len(pending)
+
+        by_type = (
+            DailyRoomStats.objects.values('room__room_type', 'day')
+            .annotate(nights=Sum('nights_sold'), amount=Sum('revenue'), cancelled=Sum('cancellations'))
+            .order_by()
+        )
+        DailyRoomTypeStats.objects.bulk_create(
+            (
+                DailyRoomTypeStats(room_type=row['room__room_type'], day=row['day'], nights_sold=row['nights'],
+                                   revenue=row['amount'], cancellations=row['cancelled'])
+                for row in by_type.iterator()
+            ),
+            batch_size=1000,
+        )
+    return written
+
+
+def verify():
+    """Compares both rollups with the bookings table.
+
+    Returns a list of (table, key, day, stored, expected) for every row that
+    differs; an empty list means the rollups are consistent.
+    """
+    room_types = dict(Room.objects.values_list('pk', 'room_type'))
+    expected_rooms, expected_types = {}, _new_deltas()
+    for rows in _expected_by_room(5000):
+        for (room_id, day), values in rows.items():
+            expected_rooms[(room_id, day)] = tuple(values)
+            _add(expected_types, (room_types[room_id], day), values)
+
+    mismatches = []
+    for table, model, key_field, expected in (
+        ('room', DailyRoomStats, 'room_id', expected_rooms),
+        ('room_type', DailyRoomTypeStats, 'room_type', {key: tuple(values) for key, values in expected_types.items()}),
+    ):
+        stored = {
+            (key, day): tuple(values)
+            for key, day, *values in model.objects.values_list(key_field, 'day', *METRICS).iterator()
+        }
+        empty = (0, ZERO, 0)
+        for key in sorted(set(expected) | set(stored)):
+            if stored.get(key, empty) != expected.get(key, empty):
+                mismatches.append((table, key[0], key[1], stored.get(key, empty), expected.get(key, empty)))
+    return mismatches
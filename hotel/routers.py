@@ -0,0 +1,114 @@
+import sqlite3
+import time
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections
+
+# Primary/replica routing. Writes always go to the primary ('default'). Reads
+# go to the 'replica' alias, when DATABASES has one, only inside views marked
+# with @read_replica (search pages, the availability API, the profile, admin
+# reports); checkout, payment status and auth keep reading the primary.
+#
+# Read-your-writes: a request that writes sets a short-lived cookie, and while
+# it is present the user's replica views read from the primary as well, so a
+# booking shows up on the confirmation and profile pages even when the replica
+# lags behind. The window is settings.REPLICA_STICKY_SECONDS and should cover
+# the replication lag.
+
+REPLICA = 'replica'
+STICKY_COOKIE = 'primary_until'
+# Sessions are read on every request and must never be stale
+PRIMARY_ONLY_APPS = frozenset({'sessions'})
+
+_routing = ContextVar('hotel_db_routing', default=None)
+
+
+class RoutingState:
+    """Routing of the current request, shared by the middleware and the router."""
+
+    def __init__(self):
+        self.read_db = DEFAULT_DB_ALIAS
+        self.wrote = False
+
+
+def read_replica(cls):
+    """Class decorator for read-only views and ModelAdmins whose GET requests may read from the replica."""
+    cls.read_replica = True
+    return cls
+
+
+def replica_enabled():
+    return REPLICA in connections.settings
+
+
+def sticky_seconds():
+    return getattr(settings, 'REPLICA_STICKY_SECONDS', 30)
+
+
+def is_pinned(request):
+    """True while the user's own recent write may not have reached the replica."""
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+class PrimaryReplicaRouter:
+    def db_for_read(self, model, **hints):
+        state = _routing.get()
+        if state is None or model._meta.app_label in PRIMARY_ONLY_APPS:
+            return DEFAULT_DB_ALIAS
+        return state.read_db
+
+    def db_for_write(self, model, **hints):
+        state = _routing.get()
+        if state is not None and model._meta.app_label not in PRIMARY_ONLY_APPS:
+            state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Both aliases hold the same data
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # The replica gets its schema from the primary
+        return False if db == REPLICA else None
+
+
+class ReplicaRoutingMiddleware:
+    """Sends the reads of @read_replica views to the replica and pins users who just wrote to the primary."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        state = RoutingState()
+        token = _routing.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _routing.reset(token)
+        if state.wrote:
+            seconds = sticky_seconds()
+            response.set_cookie(STICKY_COOKIE, f'{time.time() + seconds:.0f}', max_age=seconds, httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        cls = getattr(view_func, 'view_class', None) or getattr(view_func, 'model_admin', None)
+        if (getattr(cls, 'read_replica', False) and request.method in ('GET', 'HEAD')
+                and replica_enabled() and not is_pinned(request)):
+            _routing.get().read_db = REPLICA
+
+
+def sync_replica():
+    """Copies the primary SQLite database into the replica file (a stand-in for real replication)."""
+    primary = connections[DEFAULT_DB_ALIAS]
+    primary.ensure_connection()
+    replica = connections[REPLICA]
+    replica.close()
+    target = sqlite3.connect(replica.settings_dict['NAME'])
+    try:
+        primary.connection.backup(target)
+    finally:
+        target.close()
@@ -0,0 +1,167 @@
+import hashlib
+import time
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.db import transaction
+
+from .availability import stay_masks
+from .models import Room
+
+# Cache of room search result pages, stored in the 'search' cache alias
+# (local memory by default, see CACHES in settings).
+#
+# Invalidation is generation based: every (month, room type) pair has a
+# version number, and a search key embeds the versions of the months and
+# room types it covers. A booking change bumps only the versions of the
+# months its nights fall in for its room's type, so unrelated searches stay
+# cached. Room changes bump the global rooms version.
+
+CACHE_ALIAS = 'search'
+ROOMS_VERSION_KEY = 'search:v:rooms'
+HITS_KEY = 'search:hits'
+MISSES_KEY = 'search:misses'
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def _month_version_key(month, room_type):
+    return f'search:v:{month:%Y-%m}:{room_type}'
+
+
+def _room_types(room_type):
+    return [room_type] if room_type else [key for key, _ in Room.ROOM_TYPES]
+
+
+def _months(check_in, check_out):
+    return sorted(stay_masks(check_in, check_out)) if check_in and check_out else []
+
+
+def _versions(keys):
+    cache = get_cache()
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # A missing (never set or evicted) version starts from a fresh value,
+            # so entries written under an older generation can never match again.
+            cache.add(key, time.time_ns(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def _bump(keys):
+    cache = get_cache()
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.add(key, time.time_ns(), timeout=None)
+
+
+def _invalidate(keys):
+    # Bump now, and again after commit: a concurrent search that read the
+    # pre-commit data in between must not leave a stale entry behind.
+    if not keys:
+        return
+    _bump(keys)
+    transaction.on_commit(lambda: _bump(keys))
+
+
+def normalize(check_in=None, check_out=None, room_type=None, max_guests=None, cursor=None, amenity_mask=0, keywords=''):
+    """Canonical form of a search, so equivalent query strings share a cache entry."""
+    if room_type in ('', 'all'):
+        room_type = None
+    if isinstance(max_guests, str):
+        max_guests = int(max_guests) if max_guests.isdigit() else None
+    keywords = ' '.join((keywords or '').casefold().split())
+    return (check_in, check_out, room_type, max_guests or None, cursor or '', amenity_mask or 0, keywords)
+
+
+def versioned_key(params, check_in, check_out, room_type):
+    """Cache key for `params` that changes whenever bookings in [check_in, check_out) of room_type change."""
+    version_keys = [ROOMS_VERSION_KEY] + [
+        _month_version_key(month, kind) for month in _months(check_in, check_out) for kind in _room_types(room_type)
+    ]
+    raw = repr((params, _versions(version_keys)))
+    return 'search:page:' + hashlib.sha1(raw.encode()).hexdigest()
+
+
+def search_key(query):
+    check_in, check_out, room_type = query[:3]
+    return versioned_key(query, check_in, check_out, room_type)
+
+
+def cached_page(query, compute, key=None):
+    """Returns the cached result for a normalized query, computing and storing it on a miss."""
+    cache = get_cache()
+    key = key or search_key(query)
+    page = cache.get(key)
+    if page is None:
+        _count(MISSES_KEY)
+        page = compute()
+        cache.set(key, page)
+    else:
+        _count(HITS_KEY)
+    return page
+
+
+async def acached_page(query, compute, key=None):
+    """Async cached_page(): `compute` is a coroutine function and cache I/O uses the async cache API."""
+    cache = get_cache()
+    key = key or await sync_to_async(search_key)(query)
+    page = await cache.aget(key)
+    if page is None:
+        await _acount(MISSES_KEY)
+        page = await compute()
+        await cache.aset(key, page)
+    else:
+        await _acount(HITS_KEY)
+    return page
+
+
+def invalidate_stay(room_type, check_in, check_out):
+    """Drops cached searches that overlap the stay's months for the given room type (None = all types)."""
+    _invalidate([_month_version_key(month, kind) for month in _months(check_in, check_out) for kind in _room_types(room_type)])
+
+
+def invalidate_bookings(bookings):
+    """Invalidates every search touched by a Booking queryset (after queryset.update())."""
+    keys = set()
+    for room_type, check_in, check_out in bookings.values_list('room__room_type', 'check_in_date', 'check_out_date'):
+        keys.update(_month_version_key(month, room_type) for month in _months(check_in, check_out))
+    _invalidate(sorted(keys))
+
+
+def invalidate_all():
+    _invalidate([ROOMS_VERSION_KEY])
+
+
+def _count(key):
+    cache = get_cache()
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, timeout=None):
+            cache.incr(key)
+
+
+async def _acount(key):
+    cache = get_cache()
+    try:
+        await cache.aincr(key)
+    except ValueError:
+        if not await cache.aadd(key, 1, timeout=None):
+            await cache.aincr(key)
+
+
+def stats():
+    counters = get_cache().get_many([HITS_KEY, MISSES_KEY])
+    hits, misses = counters.get(HITS_KEY, 0), counters.get(MISSES_KEY, 0)
+    total = hits + misses
+    return {'hits': hits, 'misses': misses, 'hit_ratio': hits / total if total else 0.0}
+
+
+def reset_stats():
+    get_cache().delete_many([HITS_KEY, MISSES_KEY])
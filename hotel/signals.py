@@ -0,0 +1,132 @@
+from contextlib import contextmanager
+
+from django.db.models import QuerySet
+from django.db.models.signals import post_delete, post_migrate, post_save, pre_save
+from django.dispatch import receiver
+
+from . import amenities, auth_backends, availability, fulltext, photos, reservations, rollups, search_cache
+from .models import Booking, CustomUser, RatePlan, Room
+
+
+@receiver(pre_save, sender=Booking)
+def remember_previous_stay(sender, instance, raw=False, **kwargs):
+    # Keep the old room/dates so moving or shortening a booking frees the old nights too,
+    # and the old status/price so the rollups can take back what the booking counted
+    instance._previous_stay = instance._previous_state = None
+    if raw or instance.pk is None:
+        return
+    instance._previous_state = (
+        Booking.objects.filter(pk=instance.pk)
+        .values_list('room_id', 'status', 'check_in_date', 'check_out_date', 'total_price')
+        .first()
+    )
+    if instance._previous_state:
+        room_id, _, check_in, check_out, _ = instance._previous_state
+        instance._previous_stay = (room_id, check_in, check_out)
+
+
+@receiver(post_save, sender=Booking)
+def update_occupancy_on_save(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    # Claim nights first: a conflicting claim raises IntegrityError and rolls the save back
+    reservations.sync_nights(instance)
+    previous = getattr(instance, '_previous_stay', None)
+    if previous and previous != (instance.room_id, instance.check_in_date, instance.check_out_date):
+        availability.refresh_stay(*previous)
+        # The old room's type is not loaded; a moved booking invalidates all types for its old dates
+        search_cache.invalidate_stay(None, previous[1], previous[2])
+    availability.refresh_stay(instance.room_id, instance.check_in_date, instance.check_out_date)
+    search_cache.invalidate_stay(instance.room.room_type, instance.check_in_date, instance.check_out_date)
+    rollups.record_change(getattr(instance, '_previous_state', None), rollups.state(instance), instance.room.room_type)
+
+
+@receiver(post_delete, sender=Booking)
+def update_occupancy_on_delete(sender, instance, origin=None, **kwargs):
+    availability.refresh_stay(instance.room_id, instance.check_in_date, instance.check_out_date)
+    search_cache.invalidate_stay(None, instance.check_in_date, instance.check_out_date)
+    # When the room itself is being deleted its per-room rows go with it; only the type totals change
+    room_deleted = isinstance(origin, Room) or (isinstance(origin, QuerySet) and origin.model is Room)
+    rollups.record_change(rollups.state(instance), None, rooms=not room_deleted)
+
+
+@receiver(pre_save, sender=Room)
+def remember_previous_room_type(sender, instance, raw=False, **kwargs):
+    instance._previous_room_type = instance._previous_amenities = None
+    if not raw and instance.pk is not None:
+        previous = Room.objects.filter(pk=instance.pk).values_list('room_type', 'amenities', 'amenity_mask').first()
+        if previous:
+            instance._previous_room_type, *instance._previous_amenities = previous
+
+
+@receiver(pre_save, sender=Room)
+def index_amenities(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    previous = instance._previous_amenities
+    if previous and previous[0] == instance.amenities:
+        instance.amenity_mask = previous[1]
+    else:
+        instance.amenity_mask = amenities.mask_for(instance.amenities)
+
+
+@receiver(post_save, sender=Room)
+def move_rollups_on_type_change(sender, instance, raw=False, **kwargs):
+    previous = getattr(instance, '_previous_room_type', None)
+    if not raw and previous:
+        rollups.move_room(instance.pk, previous, instance.room_type)
+
+
+@receiver(post_save, sender=Room)
+@receiver(post_delete, sender=Room)
+def invalidate_search_on_room_change(sender, **kwargs):
+    search_cache.invalidate_all()
+
+
+@receiver(post_save, sender=RatePlan)
+@receiver(post_delete, sender=RatePlan)
+def invalidate_search_on_rate_change(sender, **kwargs):
+    # Cached availability calendars carry nightly rates
+    search_cache.invalidate_all()
+
+
+@receiver(post_save, sender=Room)
+def process_new_photo(sender, instance, raw=False, **kwargs):
+    # Variants record the photo they were made from, so only a new or removed photo schedules work
+    if not raw and photos.is_stale(instance):
+        photos.schedule(instance.pk)
+
+
+@contextmanager
+def suspended():
+    """Disconnects the Booking bookkeeping receivers for bulk jobs.
+
+    Lets large deletes take Django's fast path instead of firing a signal per
+    row. The caller must rebuild claimed nights, the availability index and
+    the rollups afterwards.
+    """
+    receivers = [
+        (pre_save, remember_previous_stay),
+        (post_save, update_occupancy_on_save),
+        (post_delete, update_occupancy_on_delete),
+    ]
+    for signal, receiver_func in receivers:
+        signal.disconnect(receiver_func, sender=Booking)
+    try:
+        yield
+    finally:
+        for signal, receiver_func in receivers:
+            signal.connect(receiver_func, sender=Booking)
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def invalidate_cached_user(sender, instance, **kwargs):
+    auth_backends.invalidate(instance.pk)
+
+
+@receiver(post_migrate)
+def check_search_index_triggers(sender, using, **kwargs):
+    # Fail the migrate that left an FTS index without its triggers instead of serving stale searches
+    if sender.label == 'hotel':
+        fulltext.check_triggers(using)
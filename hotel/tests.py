@@ -1,3 +1,1791 @@
-from django.test import TestCase
+import os
+import hashlib
+import importlib
+import json
+import random
+import re
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from PIL import Image
+from django.conf import settings
+from django.contrib import admin
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.cache import caches
+from django.core.exceptions import ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection, connections, router
+from django.db.migrations.executor import MigrationExecutor
+from django.template import engines
+from django.test import Client, TestCase, TransactionTestCase, override_settings, tag
+from django.test.utils import CaptureQueriesContext
+from django.urls import clear_url_caches, get_resolver, resolve, reverse
+from django.utils import timezone
+
+from . import (
+    allocation, amenities, availability, benchmarks, fulltext, bulk_status, group_bookings, holds, payment_queue, performance, photos, rates, reservations, rollups, routers,
+    search_cache, signals, urls,
+)
+from .forms import RatePlanForm
+from .models import (
+    Amenity, Booking, DailyRoomStats, DailyRoomTypeStats, Employee, Payment, PaymentJob, RatePlan, Room, RoomNight, RoomOccupancy,
+)
+from .payment_providers import FakeProvider, PaymentDeclined, ProviderUnavailable
+from .pagination import CappedCountPaginator, KeysetPaginator
+from .query_budget import budget_of, enforce_query_budget
+
+User = get_user_model()
+
+
+class HotelTestCase(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('guest', 'guest@test.kz', 'guestpassword')
+        cls.room_a = Room.objects.create(number='101', room_type='single', price_per_night=15000, max_guests=1, description='A')
+        cls.room_b = Room.objects.create(number='201', room_type='double', price_per_night=22000, max_guests=2, description='B')
+
+    def setUp(self):
+        search_cache.get_cache().clear()
+        caches['template_fragments'].clear()
+
+    def book(self, room, check_in, check_out, status='pending'):
+        return Booking.objects.create(
+            user=self.user, room=room, check_in_date=check_in, check_out_date=check_out,
+            guests=1, status=status, total_price=room.price_per_night * (check_out - check_in).days,
+        )
+
+
+class AvailabilityIndexTests(HotelTestCase):
+    def test_stay_masks_split_across_months(self):
+        masks = availability.stay_masks(date(2030, 1, 30), date(2030, 2, 2))
+        self.assertEqual(masks, {date(2030, 1, 1): 0b11 << 29, date(2030, 2, 1): 0b1})
+
+    def test_index_follows_booking_lifecycle(self):
+        booking = self.book(self.room_a, date(2030, 3, 10), date(2030, 3, 13))
+        self.assertEqual(list(availability.occupied_room_ids(date(2030, 3, 12), date(2030, 3, 14))), [self.room_a.pk])
+        self.assertFalse(availability.occupied_room_ids(date(2030, 3, 13), date(2030, 3, 15)).exists())
+
+        booking.check_in_date, booking.check_out_date = date(2030, 4, 1), date(2030, 4, 3)
+        booking.save()
+        self.assertFalse(availability.occupied_room_ids(date(2030, 3, 10), date(2030, 3, 13)).exists())
+
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertFalse(RoomOccupancy.objects.exists())
+
+    def test_bulk_update_is_reindexed_by_admin_helper(self):
+        self.book(self.room_a, date(2030, 5, 1), date(2030, 5, 4))
+        self.book(self.room_b, date(2030, 5, 2), date(2030, 5, 3))
+        bookings = Booking.objects.all()
+        bookings.update(status='cancelled')
+        availability.refresh_bookings(bookings)
+        self.assertEqual(availability.verify(), [])
+        self.assertFalse(RoomOccupancy.objects.exists())
+
+    def test_room_list_excludes_occupied_rooms(self):
+        self.book(self.room_a, date(2030, 6, 1), date(2030, 6, 5), status='paid')
+        response = self.client.get(reverse('room_list'), {'check_in': '2030-06-04', 'check_out': '2030-06-06'})
+        self.assertEqual(list(response.context['rooms']), [self.room_b])
+
+    def test_rebuild_command_checks_index(self):
+        self.book(self.room_b, date(2030, 7, 30), date(2030, 8, 2))
+        RoomOccupancy.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_availability', '--check', stdout=StringIO())
+        call_command('rebuild_availability', stdout=StringIO())
+        self.assertEqual(RoomOccupancy.objects.count(), 2)
+        self.assertEqual(availability.verify(), [])
+
+
+@skipUnless(connection.vendor == 'sqlite', 'EXPLAIN QUERY PLAN is SQLite-specific')
+class QueryPlanTests(HotelTestCase):
+    """Pins the hot booking queries to their indexes so a schema change that
+    falls back to a full table scan fails the build."""
+
+    check_in, check_out = date(2030, 1, 10), date(2030, 1, 14)
+
+    def query_plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return [row[-1] for row in cursor.fetchall()]
+
+    def assertSearchesIndex(self, queryset, table, index):
+        plan = self.query_plan(queryset)
+        steps = [step for step in plan if f' {table} ' in f'{step} ']
+        self.assertTrue(steps, plan)
+        for step in steps:
+            self.assertTrue(step.startswith('SEARCH'), plan)
+            self.assertIn(index, step, plan)
+        self.assertFalse([step for step in plan if 'TEMP B-TREE' in step], plan)
+
+    def test_room_overlap_check(self):
+        queryset = Booking.objects.filter(room=self.room_a).active().overlapping(self.check_in, self.check_out)
+        self.assertSearchesIndex(queryset, 'hotel_booking', 'booking_room_overlap_idx')
+        self.assertSearchesIndex(queryset.values('pk')[:1], 'hotel_booking', 'COVERING INDEX booking_room_overlap_idx')
+
+    def test_all_rooms_overlap_search(self):
+        queryset = Booking.objects.active().overlapping(self.check_in, self.check_out).values_list('room_id', flat=True)
+        self.assertSearchesIndex(queryset, 'hotel_booking', 'COVERING INDEX booking_status_dates_idx')
+
+    def test_profile_history(self):
+        queryset = Booking.objects.filter(user=self.user).order_by('-check_in_date')
+        self.assertSearchesIndex(queryset, 'hotel_booking', 'booking_user_check_in_idx')
+
+    def test_profile_keyset_page(self):
+        paginator = KeysetPaginator(Booking.objects.filter(user=self.user), ('-check_in_date', '-id'), 20)
+        queryset = Booking.objects.filter(user=self.user).filter(paginator._after([self.check_in, 10])).order_by('-check_in_date', '-id')
+        self.assertSearchesIndex(queryset, 'hotel_booking', 'booking_user_check_in_idx')
+
+    def test_occupancy_index_lookup(self):
+        queryset = availability.occupied_room_ids(date(2030, 1, 30), date(2030, 2, 3))
+        self.assertSearchesIndex(queryset, 'hotel_roomoccupancy', 'occupancy_month_room_idx')
+
+
+class ReservationTests(HotelTestCase):
+    def test_reserve_claims_nights(self):
+        booking = reservations.reserve(self.room_a, self.user, date(2030, 2, 1), date(2030, 2, 4), 1)
+        self.assertEqual(booking.total_price, 45000)
+        self.assertEqual(RoomNight.objects.filter(booking=booking).count(), 3)
+        with self.assertRaises(reservations.RoomUnavailable):
+            reservations.reserve(self.room_a, self.user, date(2030, 2, 3), date(2030, 2, 5), 1)
+        # The failed attempt left nothing behind, and other rooms are unaffected
+        self.assertEqual(Booking.objects.count(), 1)
+        reservations.reserve(self.room_b, self.user, date(2030, 2, 3), date(2030, 2, 5), 1)
+
+    def test_cancelling_releases_nights(self):
+        booking = reservations.reserve(self.room_a, self.user, date(2030, 2, 1), date(2030, 2, 4), 1)
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertFalse(RoomNight.objects.exists())
+        reservations.reserve(self.room_a, self.user, date(2030, 2, 1), date(2030, 2, 4), 1)
+
+    def test_view_rejects_overlapping_booking(self):
+        self.client.force_login(self.user)
+        url = reverse('booking_create', kwargs={'room_id': self.room_a.pk})
+        data = {'check_in_date': '2030-03-01', 'check_out_date': '2030-03-03', 'guests': 1}
+        self.assertEqual(self.client.post(url, data).status_code, 302)
+        self.assertEqual(self.client.post(url, data).status_code, 200)
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_admin_form_rejects_overlapping_booking(self):
+        existing = self.book(self.room_a, date(2030, 3, 1), date(2030, 3, 4), status='paid')
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@test.kz', 'bosspassword'))
+        data = {
+            'user': self.user.pk, 'room': self.room_a.pk, 'check_in_date': '2030-03-03', 'check_out_date': '2030-03-05',
+            'guests': 1, 'status': 'paid', 'total_price': '30000',
+        }
+        response = self.client.post(reverse('admin:hotel_booking_add'), data)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(f'бронь №{existing.pk}', str(response.context['adminform'].form.non_field_errors()))
+        self.assertEqual(Booking.objects.count(), 1)
+
+        # Inactive bookings claim nothing, and a booking never clashes with itself
+        self.assertEqual(self.client.post(reverse('admin:hotel_booking_add'), {**data, 'status': 'cancelled'}).status_code, 302)
+        change = reverse('admin:hotel_booking_change', args=[existing.pk])
+        response = self.client.post(change, {**data, 'check_in_date': '2030-03-02', 'check_out_date': '2030-03-06'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(RoomNight.objects.filter(booking=existing).count(), 4)
+
+
+class BookingStressTests(TransactionTestCase):
+    """Fires many overlapping booking requests at the view from parallel threads.
+
+    The regular run sends 300 requests at 4 rooms over 20 days (about 40 of
+    them book, the rest collide) to stay fast; HOTEL_STRESS_REQUESTS /
+    HOTEL_STRESS_THREADS scale it. The long run (3000 requests at 40 rooms over
+    120 days, about a minute) is tagged 'stress' and skipped unless
+    HOTEL_STRESS_LONG is set:
+
+        HOTEL_STRESS_LONG=1 python manage.py test hotel --tag stress
+    """
+
+    requests = int(os.environ.get('HOTEL_STRESS_REQUESTS', 300))
+    threads = int(os.environ.get('HOTEL_STRESS_THREADS', 8))
+
+    def test_parallel_overlapping_requests_never_double_book(self):
+        self.stress(self.requests, rooms=4, days=20)
+
+    @tag('stress')
+    @skipUnless(os.environ.get('HOTEL_STRESS_LONG'), 'long stress run, set HOTEL_STRESS_LONG=1')
+    def test_thousands_of_overlapping_requests_never_double_book(self):
+        created = self.stress(3000, rooms=40, days=120)
+        # Enough free nights that a large share books; the rest collide
+        self.assertGreater(created, 500)
+
+    def stress(self, requests, rooms, days):
+        """Posts `requests` random 1-4 night stays; returns the number of bookings made."""
+        user = User.objects.create_user('stress', 'stress@test.kz', 'stresspassword')
+        rooms = [
+            Room.objects.create(number=str(100 + i), room_type='double', price_per_night=20000, max_guests=2, description='S')
+            for i in range(rooms)
+        ]
+        start = date(2030, 9, 1)
+        rng = random.Random(42)
+        jobs = []
+        for _ in range(requests):
+            check_in = start + timedelta(days=rng.randrange(days))
+            jobs.append((rng.choice(rooms).pk, check_in, check_in + timedelta(days=rng.randint(1, 4))))
+        statuses = []
+        lock = threading.Lock()
+
+        clients = []
+        for _ in range(self.threads):
+            client = Client()
+            client.force_login(user)
+            clients.append(client)
+
+        def worker(client, chunk):
+            try:
+                for room_id, check_in, check_out in chunk:
+                    response = client.post(
+                        reverse('booking_create', kwargs={'room_id': room_id}),
+                        {'check_in_date': check_in.isoformat(), 'check_out_date': check_out.isoformat(), 'guests': 1},
+                    )
+                    with lock:
+                        statuses.append(response.status_code)
+            finally:
+                connections.close_all()
+
+        workers = [threading.Thread(target=worker, args=(clients[i], jobs[i::self.threads])) for i in range(self.threads)]
+        started = time.perf_counter()
+        for thread in workers:
+            thread.start()
+        for thread in workers:
+            thread.join()
+        elapsed = time.perf_counter() - started
+
+        self.assertEqual(len(statuses), requests)
+        self.assertEqual(set(statuses) - {200, 302}, set())
+        created = statuses.count(302)
+        self.assertEqual(Booking.objects.count(), created)
+
+        for room in rooms:
+            taken = set()
+            for check_in, check_out in Booking.objects.filter(room=room).active().values_list('check_in_date', 'check_out_date'):
+                nights = set(reservations.stay_nights(check_in, check_out))
+                self.assertFalse(taken & nights, f'room {room.number} double-booked')
+                taken |= nights
+        self.assertEqual(availability.verify(), [])
+
+        sys.stderr.write(
+            f'\n[stress] {requests} requests, {self.threads} threads: {created} bookings, '
+            f'{requests / elapsed:.0f} req/s, {created / elapsed:.1f} bookings/s\n'
+        )
+        return created
+
+
+class QueryBudgetTests(HotelTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser('boss', 'boss@test.kz', 'bosspassword')
+        cls.employee = Employee.objects.create(
+            full_name='Сауле', position='Ресепшн', phone_number='1', email='s@hotel.kz', start_date=date(2020, 1, 1)
+        )
+        cls.rooms = [
+            Room.objects.create(
+                number=str(300 + i), room_type='suite', price_per_night=40000, max_guests=2, description='S',
+                amenities='Wi-Fi, Джакузи' if i % 2 else 'Wi-Fi, ТВ, Мини-бар',
+            )
+            for i in range(25)
+        ]
+        cls.bookings = [
+            reservations.reserve(room, cls.user, date(2030, 1, 1), date(2030, 1, 3), 1, processed_by=cls.employee)
+            for room in cls.rooms
+        ]
+        cls.payments = [
+            Payment.objects.create(booking=booking, amount=booking.total_price, payment_method='kaspi', transaction_id=f'T-{booking.pk}')
+            for booking in cls.bookings[:20]
+        ]
+
+    def routes(self):
+        """url name -> (method, kwargs, data) for one representative request."""
+        unpaid = self.bookings[-1]
+        new_password = 'Xq7!long-enough-pass'
+        return {
+            'home': ('get', {}, None),
+            'about': ('get', {}, None),
+            'contact': ('get', {}, None),
+            'register': ('post', {}, {'username': 'new', 'email': 'new@test.kz', 'password1': new_password, 'password2': new_password}),
+            'login': ('post', {}, {'username': 'guest', 'password': 'guestpassword'}),
+            'logout': ('post', {}, None),
+            'profile': ('get', {}, None),
+            'room_list': ('get', {}, {'check_in': '2030-01-02', 'check_out': '2030-01-05', 'room_type': 'suite', 'max_guests': '2', 'amenity': '0'}),
+            'room_detail': ('get', {'pk': self.room_a.pk}, None),
+            'booking_create': ('post', {'room_id': self.room_a.pk}, {'check_in_date': '2030-05-01', 'check_out_date': '2030-05-03', 'guests': 1}),
+            'room_type_booking': ('post', {}, {'check_in_date': '2030-08-01', 'check_out_date': '2030-08-03', 'room_type': 'double', 'guests': 1}),
+            'group_booking': ('post', {}, {'check_in_date': '2030-06-01', 'check_out_date': '2030-06-04', 'rooms': '101, 201', 'guests': 1, 'mode': 'all'}),
+            'group_booking_api': ('post', {}, json.dumps({'check_in': '2030-07-01', 'check_out': '2030-07-04', 'rooms': [self.room_a.pk, self.room_b.pk]})),
+            'booking_confirm': ('get', {'pk': unpaid.pk}, None),
+            'payment_mock': ('post', {'booking_id': unpaid.pk}, {'payment_method': 'halyk'}),
+            'payment_success': ('get', {'pk': self.payments[0].pk}, None),
+            'payment_status': ('get', {'booking_id': self.bookings[0].pk}, {'format': 'json'}),
+            'room_availability': ('get', {}, {'range': ['2030-01-01/2030-01-03', '2030-01-05/2030-01-07'], 'month': '2030-01', 'rates': '1'}),
+            'metrics': ('get', {}, None),
+        }
+
+    def test_every_route_declares_a_budget(self):
+        routes = self.routes()
+        for pattern in urls.urlpatterns:
+            self.assertIsNotNone(budget_of(pattern.callback), pattern.name)
+            self.assertIn(pattern.name, routes)
+
+    def test_routes_stay_within_budget(self):
+        for pattern in urls.urlpatterns:
+            method, kwargs, data = self.routes()[pattern.name]
+            with self.subTest(pattern.name):
+                if pattern.name not in ('login', 'register'):
+                    self.client.force_login(self.user)
+                with enforce_query_budget(budget_of(pattern.callback), pattern.name):
+                    # A string is a JSON body (the JSON APIs)
+                    extra = {'content_type': 'application/json'} if isinstance(data, str) else {}
+                    response = getattr(self.client, method)(reverse(pattern.name, kwargs=kwargs), data or {}, **extra)
+                self.assertLess(response.status_code, 400)
+                self.client.logout()
+
+    def test_admin_changelists_stay_within_budget(self):
+        self.client.force_login(self.admin)
+        for model, model_admin in admin.site._registry.items():
+            if model._meta.app_label != 'hotel':
+                continue
+            with self.subTest(model.__name__):
+                url = reverse(f'admin:hotel_{model._meta.model_name}_changelist')
+                with enforce_query_budget(budget_of(model_admin), url):
+                    response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+
+
+class KeysetPaginationTests(HotelTestCase):
+    def test_walks_forward_and_back_without_gaps(self):
+        for offset in range(0, 50, 2):
+            self.book(self.room_a, date(2030, 1, 1) + timedelta(days=offset), date(2030, 1, 2) + timedelta(days=offset))
+            # Two bookings on the same date exercise the id tie-breaker
+            self.book(self.room_b, date(2030, 1, 1) + timedelta(days=offset), date(2030, 1, 2) + timedelta(days=offset))
+        expected = list(Booking.objects.order_by('-check_in_date', '-id'))
+        paginator = KeysetPaginator(Booking.objects.all(), ('-check_in_date', '-id'), 7)
+
+        pages, page = [], paginator.page()
+        while True:
+            pages.append(page)
+            if not page.has_next:
+                break
+            page = paginator.page(page.next_cursor)
+        self.assertEqual([booking for page in pages for booking in page], expected)
+        self.assertFalse(pages[0].has_previous)
+
+        back = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual(back.object_list, pages[-2].object_list)
+        self.assertEqual(paginator.page('not-a-cursor').object_list, pages[0].object_list)
+
+    def test_room_list_pages_by_price(self):
+        for number in range(30):
+            Room.objects.create(number=f'9{number:02}', room_type='double', price_per_night=10000 + number % 5, max_guests=2, description='D')
+        seen, cursor = [], None
+        while True:
+            response = self.client.get(reverse('room_list'), {'cursor': cursor} if cursor else {})
+            seen.extend(room.pk for room in response.context['rooms'])
+            cursor = response.context['page'].next_cursor
+            if cursor is None:
+                break
+        self.assertEqual(seen, list(Room.objects.order_by('price_per_night', 'id').values_list('pk', flat=True)))
+
+    def test_capped_count(self):
+        for offset in range(5):
+            self.book(self.room_a, date(2030, 1, 1) + timedelta(days=offset), date(2030, 1, 2) + timedelta(days=offset))
+        paginator = CappedCountPaginator(Booking.objects.order_by('pk'), 2)
+        paginator.count_limit = 3
+        self.assertEqual(paginator.count, 3)
+        self.assertEqual(paginator.num_pages, 2)
+
+
+class SearchCacheTests(HotelTestCase):
+    june = {'check_in': '2030-06-10', 'check_out': '2030-06-12'}
+
+    def search(self, **params):
+        return [room.pk for room in self.client.get(reverse('room_list'), params).context['rooms']]
+
+    def test_identical_searches_hit_the_cache(self):
+        self.assertEqual(self.search(**self.june), [self.room_a.pk, self.room_b.pk])
+        with self.assertNumQueries(0):
+            self.search(**self.june, room_type='all')
+        self.assertEqual(search_cache.stats()['hits'], 1)
+        self.assertEqual(search_cache.stats()['misses'], 1)
+
+    def test_booking_invalidates_only_overlapping_months_and_types(self):
+        self.search(**self.june)
+        self.search(check_in='2030-08-01', check_out='2030-08-03')
+        self.search(**self.june, room_type='double')
+
+        self.book(self.room_a, date(2030, 6, 11), date(2030, 6, 13))
+        with self.assertNumQueries(0):
+            self.search(check_in='2030-08-01', check_out='2030-08-03')
+            self.search(**self.june, room_type='double')
+        self.assertEqual(self.search(**self.june), [self.room_b.pk])
+
+    def test_admin_bulk_actions_invalidate(self):
+        booking = self.book(self.room_a, date(2030, 6, 11), date(2030, 6, 13))
+        self.assertEqual(self.search(**self.june), [self.room_b.pk])
+        admin_client = Client()
+        admin_client.force_login(User.objects.create_superuser('boss', 'boss@test.kz', 'bosspassword'))
+        response = admin_client.post(
+            reverse('admin:hotel_booking_changelist'), {'action': 'mark_cancelled', '_selected_action': [booking.pk]},
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.get(pk=booking.pk).status, 'cancelled')
+        self.assertEqual(self.search(**self.june), [self.room_a.pk, self.room_b.pk])
+
+    def test_room_change_invalidates_everything(self):
+        self.search(**self.june)
+        self.room_b.price_per_night = 1000
+        self.room_b.save()
+        self.assertEqual(self.search(**self.june), [self.room_b.pk, self.room_a.pk])
+
+    def test_file_and_database_backends(self):
+        with tempfile.TemporaryDirectory() as directory:
+            backends = [
+                {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': directory},
+                {'BACKEND': 'django.core.cache.backends.db.DatabaseCache', 'LOCATION': 'hotel_search_cache_test'},
+            ]
+            for backend in backends:
+                with self.subTest(backend['BACKEND']), override_settings(CACHES={'default': backend, 'search': backend, 'sessions': backend}):
+                    if 'db' in backend['BACKEND']:
+                        call_command('createcachetable', stdout=StringIO())
+                    search_cache.get_cache().clear()
+                    self.search(**self.june)
+                    self.search(**self.june)
+                    self.book(self.room_a, date(2030, 6, 1), date(2030, 6, 20))
+                    self.assertEqual(self.search(**self.june), [self.room_b.pk])
+                    self.assertEqual(search_cache.stats(), {'hits': 1, 'misses': 2, 'hit_ratio': 1 / 3})
+                    Booking.objects.all().delete()
+
+
+class TemplateCachingTests(HotelTestCase):
+    def test_room_markup_is_cached_until_the_room_changes(self):
+        self.client.get(reverse('room_list'))
+        self.client.get(reverse('room_detail', kwargs={'pk': self.room_a.pk}))
+        self.assertEqual(len(caches['template_fragments']._cache), 3)
+
+        # Served from fragments even when the underlying value changes behind the cache
+        Room.objects.filter(pk=self.room_a.pk).update(description='Обновлённое описание')
+        search_cache.invalidate_all()
+        self.assertNotContains(self.client.get(reverse('room_list')), 'Обновлённое описание')
+
+        # A save changes the room version, so both pages re-render it
+        self.room_a.refresh_from_db()
+        self.room_a.description = 'Новое описание номера'
+        self.room_a.save()
+        self.assertContains(self.client.get(reverse('room_list')), 'Новое описание номера')
+        self.assertContains(self.client.get(reverse('room_detail', kwargs={'pk': self.room_a.pk})), 'Новое описание номера')
+
+    def test_booking_links_keep_search_dates(self):
+        response = self.client.get(reverse('room_list'), {'check_in': '2030-02-01', 'check_out': '2030-02-03'})
+        self.assertContains(response, '?check_in=2030-02-01&check_out=2030-02-03', count=2)
+        response = self.client.get(reverse('room_list'), {'check_in': '2030-03-01', 'check_out': '2030-03-03'})
+        self.assertContains(response, '?check_in=2030-03-01&check_out=2030-03-03', count=2)
+
+    def test_templates_use_the_cached_loader(self):
+        loader = engines['django'].engine.template_loaders[0]
+        self.assertEqual(type(loader).__module__, 'django.template.loaders.cached')
+
+
+def jpeg_bytes(size=(1600, 1200), color=(30, 120, 200)):
+    buffer = BytesIO()
+    Image.new('RGB', size, color).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+class PhotoPipelineTests(HotelTestCase):
+    def setUp(self):
+        super().setUp()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name, PHOTO_BACKGROUND=False))
+
+    def upload(self, room, data):
+        room.photo = SimpleUploadedFile('room.jpg', data, content_type='image/jpeg')
+        with self.captureOnCommitCallbacks(execute=True):
+            room.save()
+        room.refresh_from_db()
+
+    def test_upload_renders_hashed_variants(self):
+        self.upload(self.room_a, jpeg_bytes())
+        variants = self.room_a.photo_variants
+        self.assertEqual(variants['source'], self.room_a.photo.name)
+        for name, size in photos.VARIANTS.items():
+            for fmt in photos.FORMATS:
+                path = variants[name][fmt]
+                with default_storage.open(path) as fh:
+                    data = fh.read()
+                self.assertEqual(path, f'{photos.VARIANT_DIR}/{hashlib.sha256(data).hexdigest()[:20]}.{fmt}')
+                with Image.open(BytesIO(data)) as image:
+                    self.assertEqual((image.format.lower(), image.size), (fmt, size))
+
+        response = self.client.get(reverse('room_list'))
+        self.assertContains(response, f'srcset="/media/{variants["thumb"]["webp"]}"')
+        self.assertContains(response, 'width="400" height="300"')
+        response = self.client.get(reverse('room_detail', kwargs={'pk': self.room_a.pk}))
+        self.assertContains(response, f'src="/media/{variants["large"]["jpeg"]}"')
+
+        # Saving without a new photo schedules nothing; removing the photo clears the variants
+        with mock.patch.object(photos, 'schedule') as schedule:
+            self.room_a.save()
+        schedule.assert_not_called()
+        self.room_a.photo = None
+        with self.captureOnCommitCallbacks(execute=True):
+            self.room_a.save()
+        self.room_a.refresh_from_db()
+        self.assertEqual(self.room_a.photo_variants, {})
+
+    def load_urls(self):
+        from HotelBookingSystem import urls
+        importlib.reload(urls)
+        clear_url_caches()
+
+    def test_variants_are_served_with_far_future_caching_in_development(self):
+        self.upload(self.room_a, jpeg_bytes())
+        url = f'/media/{self.room_a.photo_variants["thumb"]["webp"]}'
+        # In production the web server serves MEDIA_ROOT; the app has no media route
+        self.assertEqual(self.client.get(url).status_code, 404)
+
+        self.addCleanup(self.load_urls)
+        with override_settings(DEBUG=True):
+            self.load_urls()
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertIn(f'max-age={photos.CACHE_SECONDS}', response['Cache-Control'])
+
+
+class AsyncViewTests(HotelTestCase):
+    def test_search_pages_are_async_only_under_asgi(self):
+        paths = [reverse('home'), reverse('room_list'), reverse('room_detail', kwargs={'pk': self.room_a.pk})]
+        for path in paths:
+            self.assertFalse(resolve(path).func.view_class.view_is_async, path)
+        with override_settings(ROOT_URLCONF=settings.ASGI_URLCONF):
+            for path in paths:
+                self.assertTrue(resolve(path).func.view_class.view_is_async, path)
+            asgi_names = {key for key in get_resolver().reverse_dict if isinstance(key, str)}
+        self.assertEqual(asgi_names, {key for key in get_resolver().reverse_dict if isinstance(key, str)})
+
+    @override_settings(ROOT_URLCONF=settings.ASGI_URLCONF)
+    async def test_search_and_detail_through_asgi(self):
+        await sync_to_async(self.book)(self.room_a, date(2030, 6, 10), date(2030, 6, 12))
+        params = {'check_in': '2030-06-11', 'check_out': '2030-06-13'}
+        response = await self.async_client.get(reverse('room_list'), params)
+        self.assertEqual([room.pk for room in response.context['rooms']], [self.room_b.pk])
+        cached = await self.async_client.get(reverse('room_list'), params)
+        self.assertEqual([room.pk for room in cached.context['rooms']], [self.room_b.pk])
+        self.assertEqual(await sync_to_async(search_cache.stats)(), {'hits': 1, 'misses': 1, 'hit_ratio': 0.5})
+
+        response = await self.async_client.get(reverse('room_detail', kwargs={'pk': self.room_b.pk}))
+        self.assertTrue(response.context['is_available'])
+        response = await self.async_client.get(reverse('room_detail', kwargs={'pk': 999999}))
+        self.assertEqual(response.status_code, 404)
+
+
+class AvailabilityApiTests(HotelTestCase):
+    url = reverse('room_availability')
+
+    def test_ranges_and_calendar_in_two_queries(self):
+        self.book(self.room_a, date(2030, 1, 30), date(2030, 2, 2))
+        self.book(self.room_b, date(2030, 2, 10), date(2030, 2, 11), status='paid')
+        params = {'range': ['2030-01-28/2030-01-31', '2030-02-05/2030-02-09', '2030-02-10/2030-02-12'], 'month': '2030-02'}
+        with self.assertNumQueries(2):
+            data = self.client.get(self.url, params).json()
+        self.assertEqual(data['rooms'], [[self.room_a.pk, '101', 'single'], [self.room_b.pk, '201', 'double']])
+        self.assertEqual([r['free'] for r in data['ranges']], [[self.room_b.pk], [self.room_a.pk, self.room_b.pk], [self.room_a.pk]])
+        self.assertEqual(data['calendar'], {'month': '2030-02', 'days': 28, 'occupied': {str(self.room_a.pk): 0b1, str(self.room_b.pk): 1 << 9}})
+
+    def test_etag_revalidation(self):
+        params = {'month': '2030-03', 'room_type': 'single'}
+        etag = self.client.get(self.url, params)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        # A double room booking does not touch single-room answers; a single room booking does
+        self.book(self.room_b, date(2030, 3, 1), date(2030, 3, 2))
+        self.assertEqual(self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.book(self.room_a, date(2030, 3, 1), date(2030, 3, 2))
+        response = self.client.get(self.url, params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_rejects_bad_input(self):
+        for params in ({}, {'range': '2030-01-05/2030-01-01'}, {'range': 'tomorrow'}, {'month': '2030-13'}):
+            with self.subTest(params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+    def test_rejects_dates_beyond_the_horizon(self):
+        # month=9999-12 used to fail computing the following month (year 10000)
+        for params in ({'month': '9999-12'}, {'range': '9999-12-01/9999-12-31'}, {'month': '2030-01', 'range': '9999-12-30/9999-12-31'}):
+            with self.subTest(params):
+                response = self.client.get(self.url, params)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        limit = availability.horizon()
+        self.assertEqual(self.client.get(self.url, {'month': f'{limit:%Y-%m}'}).status_code, 200)
+
+        # The room search and the booking forms refuse them too
+        response = self.client.get(reverse('room_list'), {'check_in': '9999-12-30', 'check_out': '9999-12-31'})
+        self.assertIn('Неверный формат даты.', [str(message) for message in response.context['messages']])
+        self.client.force_login(self.user)
+        far = {'check_in_date': '9999-12-30', 'check_out_date': '9999-12-31', 'guests': 1}
+        response = self.client.post(reverse('booking_create', kwargs={'room_id': self.room_a.pk}), far)
+        self.assertIn(f'{limit:%d.%m.%Y}', str(response.context['form'].non_field_errors()))
+        response = self.client.post(reverse('group_booking_api'), json.dumps({
+            'check_in': '9999-12-30', 'check_out': '9999-12-31', 'rooms': [self.room_a.pk],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Booking.objects.exists())
+
+    def test_stays_longer_than_a_year_are_refused_everywhere(self):
+        self.assertEqual(self.client.get(self.url, {'range': '2030-01-01/2031-01-03'}).status_code, 400)
+        # The room search ignores the dates instead of building a century of mask branches
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('room_list'), {'check_in': '2000-01-01', 'check_out': '2100-01-01'})
+        self.assertNotIn('is_filtered', response.context)
+        self.assertEqual(len(response.context['rooms']), 2)
+        self.assertIn('Неверный формат даты.', [str(message) for message in response.context['messages']])
+
+        self.client.force_login(self.user)
+        long_stay = {'check_in_date': '2030-01-01', 'check_out_date': '2031-01-03', 'guests': 1}
+        response = self.client.post(reverse('booking_create', kwargs={'room_id': self.room_a.pk}), long_stay)
+        self.assertIn('366', str(response.context['form'].non_field_errors()))
+        response = self.client.post(reverse('room_type_booking'), {**long_stay, 'room_type': 'single'})
+        self.assertIn('366', str(response.context['form'].non_field_errors()))
+        response = self.client.post(reverse('group_booking'), {**long_stay, 'rooms': '101', 'mode': 'all'})
+        self.assertIn('366', str(response.context['form'].non_field_errors()))
+        response = self.client.post(reverse('group_booking_api'), json.dumps({
+            'check_in': '2030-01-01', 'check_out': '2031-01-03', 'rooms': [self.room_a.pk],
+        }), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Booking.objects.exists())
+
+
+class LoadToolingTests(TransactionTestCase):
+    def test_seed_large_builds_consistent_data(self):
+        call_command('seed_large', rooms=6, users=5, bookings=120, chunk=25, stdout=StringIO())
+        self.assertEqual(Room.objects.count(), 6)
+        self.assertEqual(Booking.objects.count(), 120)
+        self.assertEqual(Payment.objects.count(), Booking.objects.filter(status='paid').count())
+        self.assertEqual(availability.verify(), [])
+        self.assertEqual(RoomNight.objects.count(), sum(
+            (check_out - check_in).days
+            for check_in, check_out in Booking.objects.active().values_list('check_in_date', 'check_out_date')
+        ))
+
+        # Stays are priced from the generated rate card
+        for booking in Booking.objects.select_related('room').order_by('pk')[::20]:
+            self.assertEqual(booking.total_price, rates.quote(booking.room, booking.check_in_date, booking.check_out_date).total)
+
+        call_command('seed_large', rooms=2, users=1, bookings=10, flush=True, stdout=StringIO())
+        self.assertEqual(Room.objects.count(), 2)
+        self.assertEqual(availability.verify(), [])
+
+    def test_loadtest_reports_every_route(self):
+        call_command('seed_large', rooms=4, users=2, bookings=40, stdout=StringIO())
+        out = StringIO()
+        call_command('loadtest', requests=3, concurrency=2, stdout=out)
+        report = out.getvalue()
+        for route in ('home', 'room_search', 'room_detail', 'room_availability', 'profile', 'booking_confirm'):
+            self.assertRegex(report, rf'{route}\s+3\s+0\s')
+
+    def test_loadtest_compares_wsgi_and_asgi(self):
+        call_command('seed_large', rooms=4, users=2, bookings=40, stdout=StringIO())
+        out = StringIO()
+        call_command('loadtest', requests=2, concurrency=3, interface='both',
+                     routes='home,room_search,room_detail,profile', stdout=out)
+        report = out.getvalue()
+        self.assertIn('[wsgi]', report)
+        self.assertIn('[asgi]', report)
+        self.assertIn('ASGI/WSGI', report)
+        self.assertEqual(len(re.findall(r'(home|room_search|room_detail|profile)\s+2\s+0\s', report)), 8)
+
+
+class BenchmarkTests(HotelTestCase):
+    def test_suite_measures_every_case(self):
+        self.book(self.room_a, date.today() + timedelta(days=1), date.today() + timedelta(days=3))
+        results = benchmarks.run_suite(repeat=1, warmup=0)
+        self.assertIn('room_search_30n', results)
+        self.assertIn('admin_booking_changelist', results)
+        for name, metrics in results.items():
+            with self.subTest(name):
+                self.assertGreater(metrics['queries'], 0)
+                self.assertGreater(metrics['wall_ms'], 0)
+                self.assertGreater(metrics['peak_kib'], 0)
+
+    def test_compare_flags_regressions(self):
+        baseline = {'room_list': {'wall_ms': 10.0, 'queries': 3, 'peak_kib': 100.0}}
+        self.assertEqual(benchmarks.compare({'room_list': {'wall_ms': 11.5, 'queries': 3, 'peak_kib': 110.0}}, baseline), [])
+        self.assertEqual(benchmarks.compare({'other': {'wall_ms': 99.0, 'queries': 9, 'peak_kib': 999.0}}, baseline), [])
+        regressions = benchmarks.compare({'room_list': {'wall_ms': 30.0, 'queries': 4, 'peak_kib': 100.0}}, baseline)
+        self.assertEqual([metric for _, metric, _, _ in regressions], ['wall_ms', 'queries'])
+
+
+@override_settings(PERFORMANCE_METRICS=True)
+class PerformanceMiddlewareTests(HotelTestCase):
+    def setUp(self):
+        super().setUp()
+        performance.registry.reset()
+
+    def test_records_breakdown_per_url_name(self):
+        self.client.get(reverse('room_list'), {'check_in': '2030-01-01', 'check_out': '2030-01-03'})
+        self.client.get(reverse('room_detail', kwargs={'pk': self.room_a.pk}))
+        self.client.get('/no-such-page/')
+
+        self.assertEqual(set(performance.registry.views), {'room_list', 'room_detail', performance.UNRESOLVED})
+        stats = performance.registry.views['room_list']
+        self.assertEqual(stats.count, 1)
+        self.assertGreater(stats.queries, 0)
+        self.assertGreater(stats.db, 0)
+        self.assertGreater(stats.template, 0)
+        self.assertGreaterEqual(stats.total, stats.db + stats.template)
+
+    def test_exports_prometheus_text_and_log(self):
+        self.client.get(reverse('home'))
+        response = self.client.get(reverse('metrics'))
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        self.assertContains(response, 'hotel_request_duration_seconds_count{view="home"} 1')
+        self.assertContains(response, 'hotel_request_duration_seconds_bucket{view="home",le="+Inf"} 1')
+        self.assertContains(response, 'hotel_request_queries_total{view="home"}')
+
+        log = self.client.get(reverse('metrics'), {'format': 'log'}).content.decode()
+        self.assertRegex(log, r'GET home 200 total=[\d.]+ms db=[\d.]+ms/\d+q template=[\d.]+ms')
+
+    def test_endpoint_is_internal(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.1.2.3').status_code, 403)
+        self.client.force_login(User.objects.create_superuser('ops', 'ops@test.kz', 'opspassword'))
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='10.1.2.3').status_code, 200)
+
+    @override_settings(PERFORMANCE_METRICS=False)
+    def test_disabled_by_default(self):
+        self.client.get(reverse('home'))
+        self.assertEqual(performance.registry.views, {})
+
+
+class DatabaseConnectionTests(TransactionTestCase):
+    def pragma(self, name):
+        with connection.cursor() as cursor:
+            cursor.execute(f'PRAGMA {name}')
+            return cursor.fetchone()[0]
+
+    def test_connections_apply_configured_pragmas(self):
+        connection.close()
+        # WAL is switched on by the migration, not by every connection
+        self.assertNotIn('journal_mode', connection.settings_dict['OPTIONS']['init_command'])
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+        self.assertEqual(self.pragma('busy_timeout'), 5000)
+        self.assertEqual(self.pragma('synchronous'), 1)  # NORMAL
+        self.assertEqual(self.pragma('mmap_size'), 256 * 1024 * 1024)
+        self.assertTrue(connection.settings_dict['CONN_HEALTH_CHECKS'])
+
+    def test_benchmark_profiles_switch_the_journal_mode(self):
+        with benchmarks.sqlite_pragmas(benchmarks.SQLITE_PROFILES['sqlite_defaults']):
+            self.assertEqual(self.pragma('journal_mode'), 'delete')
+        self.assertEqual(self.pragma('journal_mode'), 'wal')
+
+
+class PhotoBackfillTests(TransactionTestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        self.enterContext(override_settings(MEDIA_ROOT=media.name))
+
+    def test_background_pool_and_parallel_backfill(self):
+        room = Room.objects.create(number='1', room_type='single', price_per_night=10000, max_guests=1, description='A',
+                                   photo=SimpleUploadedFile('a.jpg', jpeg_bytes(color=(200, 10, 10))))
+        photos.wait(timeout=30)
+        room.refresh_from_db()
+        self.assertEqual(set(room.photo_variants), {'source', 'thumb', 'large'})
+
+        # Rooms written without signals (bulk imports) are picked up by the backfill
+        Room.objects.bulk_create([
+            Room(number=str(n), room_type='double', price_per_night=20000, max_guests=2, description='B',
+                 photo=default_storage.save(f'room_photos/{n}.jpg', ContentFile(jpeg_bytes(color=(n, n, n)))))
+            for n in range(2, 6)
+        ])
+        out = StringIO()
+        call_command('process_photos', workers=2, stdout=out)
+        self.assertIn('обработано 4, ошибок 0', out.getvalue())
+        for room in Room.objects.all():
+            self.assertFalse(photos.is_stale(room), room.number)
+            self.assertTrue(default_storage.exists(room.photo_variants['large']['webp']))
+
+
+class RollupTests(HotelTestCase):
+    def type_stats(self, room_type):
+        return {
+            day: (nights, revenue, cancelled)
+            for day, nights, revenue, cancelled in DailyRoomTypeStats.objects.filter(room_type=room_type)
+            .exclude(nights_sold=0, revenue=0, cancellations=0).values_list('day', *rollups.METRICS)
+        }
+
+    def test_split_gives_the_remainder_to_the_first_night(self):
+        self.assertEqual(rollups.split(Decimal('10000.00'), 3), [Decimal('3333.34'), Decimal('3333.33'), Decimal('3333.33')])
+
+    def test_rollups_follow_booking_lifecycle(self):
+        booking = self.book(self.room_a, date(2030, 3, 10), date(2030, 3, 12))
+        self.assertEqual(self.type_stats('single'), {date(2030, 3, 10): (1, 0, 0), date(2030, 3, 11): (1, 0, 0)})
+
+        booking.status = 'paid'
+        booking.save()
+        self.assertEqual(self.type_stats('single')[date(2030, 3, 10)], (1, Decimal('15000.00'), 0))
+
+        booking.room = self.room_b
+        booking.save()
+        self.assertEqual(self.type_stats('single'), {})
+        self.assertEqual(sum(row[1] for row in self.type_stats('double').values()), Decimal('30000.00'))
+
+        booking.status = 'cancelled'
+        booking.save()
+        self.assertEqual(self.type_stats('double'), {date(2030, 3, 10): (0, 0, 1)})
+        self.assertEqual(rollups.verify(), [])
+
+        booking.delete()
+        self.assertEqual(self.type_stats('double'), {})
+        self.assertEqual(rollups.verify(), [])
+
+    def test_bulk_update_is_refreshed_by_sync_derived(self):
+        self.book(self.room_a, date(2030, 5, 1), date(2030, 5, 4))
+        self.book(self.room_b, date(2030, 5, 2), date(2030, 5, 3))
+        bookings = Booking.objects.all()
+        bookings.update(status='paid')
+        bulk_status.sync_derived(bookings)
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(self.type_stats('double'), {date(2030, 5, 2): (1, Decimal('22000.00'), 0)})
+
+    def test_room_type_change_and_room_delete_keep_totals_consistent(self):
+        self.book(self.room_a, date(2030, 6, 1), date(2030, 6, 3), status='paid')
+        self.room_a.room_type = 'suite'
+        self.room_a.save()
+        self.assertEqual(self.type_stats('single'), {})
+        self.assertEqual(len(self.type_stats('suite')), 2)
+        self.assertEqual(rollups.verify(), [])
+
+        self.room_a.delete()
+        self.assertEqual(self.type_stats('suite'), {})
+        self.assertEqual(rollups.verify(), [])
+
+    def test_rebuild_command_checks_rollups(self):
+        self.book(self.room_b, date(2030, 7, 30), date(2030, 8, 2), status='paid')
+        self.book(self.room_a, date(2030, 8, 1), date(2030, 8, 2), status='cancelled')
+        DailyRoomStats.objects.all().delete()
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', '--check', stdout=StringIO())
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(DailyRoomStats.objects.count(), 4)
+        self.assertEqual(rollups.verify(), [])
+
+    def test_dashboard_reads_only_the_rollups(self):
+        self.book(self.room_b, date(2030, 1, 10), date(2030, 1, 12), status='paid')
+        # Bookings removed without signals: the report still answers from the rollups
+        with signals.suspended():
+            Booking.objects.all().delete()
+        staff = User.objects.create_user('manager', 'manager@test.kz', 'managerpassword', is_staff=True)
+        self.client.force_login(staff)
+        url = reverse('admin:hotel_dailyroomtypestats_changelist')
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        staff.user_permissions.add(Permission.objects.get(codename='view_dailyroomtypestats'))
+        response = self.client.get(url, {'start': '2030-01-01', 'end': '2030-01-31', 'period': 'month'})
+        self.assertEqual(response.status_code, 200)
+        [total] = response.context['totals']
+        self.assertEqual((total['nights'], total['revenue'], total['cancellations']), (2, Decimal('44000.00'), 0))
+        # One double room over 31 days
+        self.assertAlmostEqual(total['occupancy'], 2 / 31 * 100)
+
+
+class BulkStatusTests(HotelTestCase):
+    def consistent(self):
+        self.assertEqual(availability.verify(), [])
+        self.assertEqual(rollups.verify(), [])
+
+    def test_transition_runs_in_chunks_and_creates_payments(self):
+        bookings = [self.book(self.room_a, date(2030, 1, 1) + timedelta(days=2 * i), date(2030, 1, 2) + timedelta(days=2 * i)) for i in range(5)]
+        Payment.objects.create(booking=bookings[0], amount=15000, payment_method='kaspi', status='pending')
+        before = Booking.objects.get(pk=bookings[1].pk).updated_at
+        seen = []
+
+        result = bulk_status.transition(Booking.objects.all(), 'paid', chunk_size=2, progress=lambda r: seen.append(r.done))
+        self.assertEqual((result.updated, result.payments, result.chunks, result.skipped), (5, 4, 3, 0))
+        self.assertEqual(seen, [2, 4, 5])
+        self.assertFalse(Booking.objects.exclude(status='paid').exists())
+        self.assertEqual(Payment.objects.filter(status='completed').count(), 5)
+        self.assertGreater(Booking.objects.get(pk=bookings[1].pk).updated_at, before)
+        self.consistent()
+
+        # Already paid bookings are not touched again
+        self.assertEqual(bulk_status.transition(Booking.objects.all(), 'paid').total, 0)
+
+        result = bulk_status.transition(Booking.objects.all(), 'cancelled', chunk_size=3)
+        self.assertEqual(result.updated, 5)
+        self.assertFalse(RoomNight.objects.exists())
+        self.consistent()
+
+    def test_reactivation_skips_bookings_whose_nights_were_taken(self):
+        cancelled = self.book(self.room_a, date(2030, 2, 1), date(2030, 2, 3), status='cancelled')
+        free = self.book(self.room_b, date(2030, 2, 1), date(2030, 2, 3), status='cancelled')
+        self.book(self.room_a, date(2030, 2, 2), date(2030, 2, 4))
+
+        result = bulk_status.transition(Booking.objects.filter(pk__in=[cancelled.pk, free.pk]), 'paid')
+        self.assertEqual((result.updated, result.skipped), (1, 1))
+        self.assertEqual(Booking.objects.get(pk=cancelled.pk).status, 'cancelled')
+        self.assertEqual(Booking.objects.get(pk=free.pk).status, 'paid')
+        self.assertFalse(Payment.objects.filter(booking=cancelled).exists())
+        self.consistent()
+
+    def test_admin_action_reports_progress(self):
+        booking = self.book(self.room_b, date(2030, 3, 1), date(2030, 3, 4))
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@test.kz', 'bosspassword'))
+        response = self.client.post(reverse('admin:hotel_booking_changelist'), {
+            'action': 'mark_paid', '_selected_action': [booking.pk],
+        }, follow=True)
+        self.assertContains(response, '1 бронирований отмечены как оплаченные')
+        self.assertEqual(booking.payment.status, 'completed')
+        self.consistent()
+
+    def test_command_filters_and_dry_run(self):
+        self.book(self.room_a, date(2030, 4, 1), date(2030, 4, 2))
+        self.book(self.room_b, date(2030, 4, 1), date(2030, 4, 2))
+        out = StringIO()
+        call_command('set_booking_status', 'cancelled', '--room-type', 'double', '--dry-run', stdout=out)
+        self.assertIn('Будет изменено бронирований: 1', out.getvalue())
+        self.assertFalse(Booking.objects.filter(status='cancelled').exists())
+
+        call_command('set_booking_status', 'cancelled', '--room-type', 'double', '--check-in-from', '2030-04-01', stdout=out)
+        self.assertEqual(list(Booking.objects.filter(status='cancelled').values_list('room', flat=True)), [self.room_b.pk])
+        self.consistent()
+
+
+class ScriptedProvider(FakeProvider):
+    """Fake provider that raises the queued exceptions first, then succeeds."""
+
+    def __init__(self, *outcomes):
+        super().__init__()
+        self.outcomes = list(outcomes)
+        self.calls = 0
+        self.keys = []
+
+    def charge(self, payment_method, amount, idempotency_key, reference):
+        self.calls += 1
+        self.keys.append(idempotency_key)
+        if self.outcomes:
+            raise self.outcomes.pop(0)
+        return super().charge(payment_method, amount, idempotency_key, reference)
+
+
+class PaymentQueueTests(HotelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.booking = self.book(self.room_b, date(2030, 5, 1), date(2030, 5, 3))
+        self.client.force_login(self.user)
+
+    def pay(self, method='kaspi'):
+        return self.client.post(reverse('payment_mock', kwargs={'booking_id': self.booking.pk}), {'payment_method': method})
+
+    def poll(self):
+        return self.client.get(reverse('payment_status', kwargs={'booking_id': self.booking.pk}), {'format': 'json'}).json()
+
+    def expire_retry_delay(self):
+        PaymentJob.objects.update(available_at=timezone.now())
+
+    def test_checkout_only_queues_and_double_submit_is_idempotent(self):
+        with mock.patch.object(FakeProvider, 'charge', side_effect=AssertionError('provider called from the web request')):
+            response = self.pay()
+            self.pay('halyk')
+        self.assertRedirects(response, reverse('payment_status', kwargs={'booking_id': self.booking.pk}))
+        self.assertEqual(PaymentJob.objects.count(), 1)
+        self.assertEqual(self.poll(), {'status': 'queued', 'error': '', 'redirect': None})
+
+        provider = ScriptedProvider()
+        self.assertEqual(payment_queue.run_once(provider=provider), 1)
+        payment = Payment.objects.get(booking=self.booking)
+        self.assertEqual((payment.status, payment.payment_method, payment.amount), ('completed', 'kaspi', Decimal('44000.00')))
+        self.booking.refresh_from_db()
+        self.assertEqual(self.booking.status, 'paid')
+        self.assertEqual(self.poll()['redirect'], reverse('payment_success', kwargs={'pk': payment.pk}))
+        self.assertEqual(rollups.verify(), [])
+
+        # A late duplicate submit neither queues nor charges again
+        self.pay()
+        self.assertEqual(payment_queue.run_once(provider=provider), 0)
+        self.assertEqual((provider.calls, Payment.objects.count()), (1, 1))
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        self.pay()
+        provider = ScriptedProvider(ProviderUnavailable('timeout'), ProviderUnavailable('timeout'))
+        with self.assertLogs('hotel.payment_queue', 'WARNING'):
+            payment_queue.run_once(provider=provider)
+        job = PaymentJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.error), ('queued', 1, 'timeout'))
+        self.assertGreater(job.available_at, timezone.now())
+        # Not due yet
+        self.assertEqual(payment_queue.run_once(provider=provider), 0)
+
+        self.expire_retry_delay()
+        with self.assertLogs('hotel.payment_queue', 'WARNING'):
+            payment_queue.run_once(provider=provider)
+        self.expire_retry_delay()
+        payment_queue.run_once(provider=provider)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.attempts, provider.calls), ('succeeded', 3, 3))
+
+    def test_declined_payment_fails_and_can_be_resubmitted(self):
+        self.pay()
+        payment_queue.run_once(provider=ScriptedProvider(PaymentDeclined('Недостаточно средств')))
+        self.assertEqual(self.poll(), {'status': 'failed', 'error': 'Недостаточно средств', 'redirect': None})
+        self.assertContains(self.client.get(reverse('payment_status', kwargs={'booking_id': self.booking.pk})), 'Недостаточно средств')
+
+        self.pay('bcc')
+        job = PaymentJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.payment_method), ('queued', 0, 'bcc'))
+
+        payment_queue.run_once(provider=ScriptedProvider())
+        self.assertRedirects(
+            self.client.get(reverse('payment_status', kwargs={'booking_id': self.booking.pk})),
+            reverse('payment_success', kwargs={'pk': Payment.objects.get().pk}),
+        )
+
+    def test_each_charge_has_its_own_provider_key(self):
+        # Retries of one charge reuse its key; a resubmit after a failure is a new charge with a new key
+        provider = ScriptedProvider(ProviderUnavailable('timeout'), PaymentDeclined('Карта заблокирована'))
+        self.pay()
+        with self.assertLogs('hotel.payment_queue', 'WARNING'):
+            payment_queue.run_once(provider=provider)
+        self.expire_retry_delay()
+        payment_queue.run_once(provider=provider)
+        self.assertEqual(self.poll()['status'], 'failed')
+        self.pay('halyk')
+        payment_queue.run_once(provider=provider)
+        job = PaymentJob.objects.get()
+        self.assertEqual((job.status, job.generation), ('succeeded', 2))
+        first, retry, resubmit = provider.keys
+        self.assertEqual(first, retry)
+        self.assertNotEqual(first, resubmit)
+        self.assertEqual(resubmit, payment_queue.charge_key(job))
+        self.assertEqual(Payment.objects.get(booking=self.booking).payment_method, 'halyk')
+
+        # The admin's retry of a failed job starts a new generation too
+        PaymentJob.objects.update(status='failed')
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@test.kz', 'bosspassword'))
+        self.client.post(reverse('admin:hotel_paymentjob_changelist'), {'action': 'retry_now', '_selected_action': [job.pk]})
+        self.assertEqual(PaymentJob.objects.get().generation, 3)
+
+    def test_booking_cancelled_during_charge_is_not_marked_paid(self):
+        self.pay()
+        booking = self.booking
+
+        class CancellingProvider(FakeProvider):
+            def charge(self, *args, **kwargs):
+                Booking.objects.filter(pk=booking.pk).update(status='cancelled')
+                return super().charge(*args, **kwargs)
+
+        payment_queue.run_once(provider=CancellingProvider())
+        job = PaymentJob.objects.get()
+        self.assertEqual(job.status, 'failed')
+        self.assertIn('нужен возврат', job.error)
+        self.assertFalse(Payment.objects.exists())
+
+    def test_workers_claim_disjoint_jobs_and_take_over_stale_locks(self):
+        other = self.book(self.room_a, date(2030, 5, 1), date(2030, 5, 3))
+        payment_queue.enqueue(self.booking, 'kaspi')
+        payment_queue.enqueue(other, 'kaspi')
+        first = payment_queue.claim('w1', limit=1)
+        second = payment_queue.claim('w2', limit=5)
+        self.assertEqual(len(first), 1)
+        self.assertEqual([job.pk for job in second], [job.pk for job in PaymentJob.objects.exclude(pk=first[0].pk)])
+        self.assertEqual(payment_queue.claim('w3', limit=5), [])
+
+        # A worker that died mid-job loses it after LOCK_TIMEOUT
+        PaymentJob.objects.filter(pk=first[0].pk).update(locked_at=timezone.now() - payment_queue.LOCK_TIMEOUT - timedelta(seconds=1))
+        [taken] = payment_queue.claim('w3', limit=5)
+        self.assertEqual((taken.pk, taken.attempts), (first[0].pk, 2))
+        self.assertEqual(payment_queue.process(first[0], ScriptedProvider()), 'succeeded')
+        taken.refresh_from_db()
+        # The stale worker's charge went through, but the lock now belongs to w3
+        self.assertEqual(taken.status, 'processing')
+
+    @override_settings(PAYMENT_PROVIDER_OPTIONS={'latency': 0})
+    def test_worker_command_once(self):
+        self.pay()
+        out = StringIO()
+        call_command('payment_worker', '--once', stdout=out)
+        self.assertIn('Обработано задач: 1', out.getvalue())
+        self.assertEqual(Booking.objects.get(pk=self.booking.pk).status, 'paid')
+
+
+class HoldExpiryTests(HotelTestCase):
+    def setUp(self):
+        super().setUp()
+        performance.registry.reset()
+
+    def age(self, booking, minutes):
+        Booking.objects.filter(pk=booking.pk).update(created_at=timezone.now() - timedelta(minutes=minutes))
+
+    def test_sweep_expires_only_stale_unpaid_holds(self):
+        stale = [self.book(self.room_a, date(2030, 6, 1) + timedelta(days=3 * i), date(2030, 6, 3) + timedelta(days=3 * i)) for i in range(3)]
+        fresh = self.book(self.room_b, date(2030, 6, 1), date(2030, 6, 2))
+        paid = self.book(self.room_b, date(2030, 6, 5), date(2030, 6, 6), status='paid')
+        paying = self.book(self.room_b, date(2030, 6, 10), date(2030, 6, 12))
+        payment_queue.enqueue(paying, 'kaspi')
+        for booking in stale + [paid, paying]:
+            self.age(booking, 31)
+        self.age(fresh, 29)
+
+        preview = holds.sweep(dry_run=True)
+        self.assertEqual((preview.bookings, preview.nights, preview.rooms), (3, 6, 1))
+        self.assertFalse(Booking.objects.filter(status='expired').exists())
+
+        seen = []
+        with self.assertLogs('hotel.holds', 'INFO'):
+            result = holds.sweep(chunk_size=2, progress=lambda r: seen.append(r.bookings))
+        self.assertEqual((result.bookings, result.nights, result.rooms, result.chunks), (3, 6, 1, 2))
+        self.assertEqual(seen, [2, 3])
+        self.assertEqual(set(Booking.objects.filter(status='expired').values_list('pk', flat=True)), {b.pk for b in stale})
+        self.assertFalse(RoomNight.objects.filter(booking__in=stale).exists())
+        self.assertEqual(availability.verify(), [])
+        self.assertEqual(rollups.verify(), [])
+        self.assertIn('hotel_hold_released_nights_total 6', performance.registry.prometheus())
+
+        # The released nights can be booked again
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('room_list'), {'check_in': '2030-06-01', 'check_out': '2030-06-03'})
+        self.assertContains(response, self.room_a.number)
+        self.assertEqual(holds.sweep().bookings, 0)
+
+    def test_expired_hold_cannot_be_paid(self):
+        booking = self.book(self.room_a, date(2030, 7, 1), date(2030, 7, 2))
+        self.age(booking, 60)
+        self.client.force_login(self.user)
+        self.assertContains(self.client.get(reverse('booking_confirm', kwargs={'pk': booking.pk})), 'Номер удерживается до')
+        payment_queue.enqueue(booking, 'kaspi')
+        PaymentJob.objects.update(status='failed')
+        out = StringIO()
+        call_command('expire_holds', stdout=out)
+        self.assertIn('Истекших броней: 1. Освобождено ночей: 1, номеров: 1', out.getvalue())
+
+        response = self.client.post(reverse('payment_mock', kwargs={'booking_id': booking.pk}), {'payment_method': 'kaspi'})
+        self.assertRedirects(response, reverse('room_detail', kwargs={'pk': self.room_a.pk}))
+        PaymentJob.objects.update(status='queued')
+        provider = ScriptedProvider()
+        payment_queue.run_once(provider=provider)
+        self.assertEqual(PaymentJob.objects.get().error, 'Время удержания брони истекло.')
+        self.assertEqual(provider.calls, 0)
+
+    def test_scheduler_is_off_by_default(self):
+        self.assertIsNone(holds.start_scheduler())
+
+
+class ReplicaRoutingTests(TransactionTestCase):
+    """Routing against a second local SQLite file standing in for the replica."""
+    # Resolved in setUpClass, after the replica alias has been added
+    databases = '__all__'
+
+    @classmethod
+    def setUpClass(cls):
+        cls.replica_dir = tempfile.mkdtemp()
+        default = connections.settings['default']
+        connections.settings[routers.REPLICA] = {
+            **default,
+            'NAME': os.path.join(cls.replica_dir, 'replica.sqlite3'),
+            'TEST': {**default['TEST'], 'NAME': None, 'MIRROR': None},
+        }
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        connections[routers.REPLICA].close()
+        del connections[routers.REPLICA]
+        del connections.settings[routers.REPLICA]
+        shutil.rmtree(cls.replica_dir)
+
+    def setUp(self):
+        search_cache.get_cache().clear()
+        caches['template_fragments'].clear()
+        self.user = User.objects.create_user('guest', 'guest@test.kz', 'guestpassword')
+        self.room = Room.objects.create(number='301', room_type='double', price_per_night=22000, max_guests=2, description='A')
+        routers.sync_replica()
+
+    def test_search_pages_read_from_the_replica(self):
+        room = Room.objects.create(number='777', room_type='suite', price_per_night=50000, max_guests=3, description='New')
+        self.assertNotContains(self.client.get(reverse('room_list')), 'Номер 777')
+        self.assertEqual(self.client.get(reverse('room_detail', kwargs={'pk': room.pk})).status_code, 404)
+
+        routers.sync_replica()
+        search_cache.get_cache().clear()
+        self.assertContains(self.client.get(reverse('room_list')), 'Номер 777')
+        self.assertEqual(self.client.get(reverse('room_detail', kwargs={'pk': room.pk})).status_code, 200)
+
+    def test_users_read_their_own_writes_from_the_primary(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('booking_create', kwargs={'room_id': self.room.pk}), {
+            'check_in_date': '2030-08-01', 'check_out_date': '2030-08-03', 'guests': 1,
+        }, follow=True)
+        booking = Booking.objects.get()
+        self.assertContains(response, 'Бронирование создано!')
+        self.assertIn(routers.STICKY_COOKIE, self.client.cookies)
+        self.assertContains(self.client.get(reverse('profile')), '01.08.2030')
+
+        # Once the pin is gone the lagging replica is read again
+        del self.client.cookies[routers.STICKY_COOKIE]
+        self.assertNotContains(self.client.get(reverse('profile')), '01.08.2030')
+        self.assertEqual(self.client.get(reverse('booking_confirm', kwargs={'pk': booking.pk})).status_code, 404)
+
+    def test_admin_reports_use_the_replica_and_writes_the_primary(self):
+        self.client.force_login(User.objects.create_superuser('boss', 'boss@test.kz', 'bosspassword'))
+        routers.sync_replica()
+        replica = connections[routers.REPLICA]
+        with CaptureQueriesContext(replica) as queries:
+            self.assertEqual(self.client.get(reverse('admin:hotel_dailyroomtypestats_changelist')).status_code, 200)
+        self.assertTrue(queries)
+        with CaptureQueriesContext(replica) as queries:
+            self.assertEqual(self.client.get(reverse('admin:hotel_booking_changelist')).status_code, 200)
+        self.assertFalse(queries)
+        self.assertFalse(router.allow_migrate(routers.REPLICA, 'hotel'))
+        self.assertEqual(router.db_for_write(Booking), 'default')
+
+
+@override_settings(**benchmarks.CACHED_AUTH)
+class SessionUserCacheTests(HotelTestCase):
+    def warm(self):
+        self.client.get(reverse('about'))
+
+    def test_public_pages_skip_session_and_user_queries(self):
+        self.client.session.save()
+        self.warm()
+        with self.assertNumQueries(0):
+            self.client.get(reverse('about'))
+
+        self.client.force_login(self.user)
+        self.warm()
+        for name in ('about', 'home'):
+            with self.subTest(name), self.assertNumQueries(0):
+                self.assertContains(self.client.get(reverse(name)), 'Личный кабинет')
+
+    def test_saved_user_is_reloaded(self):
+        self.client.force_login(self.user)
+        self.warm()
+        self.user.first_name = 'Айгерим'
+        self.user.save()
+        self.assertContains(self.client.get(reverse('profile')), 'Айгерим')
+
+        # A password change (new session auth hash) or deactivation logs the user out at once
+        self.user.set_password('another-password-123')
+        self.user.save()
+        response = self.client.get(reverse('profile'))
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('login', response.url)
+
+
+class AmenityIndexTests(HotelTestCase):
+    def setUp(self):
+        super().setUp()
+        self.room_a.amenities = 'Wi-Fi, Балкон, ТВ'
+        self.room_a.save()
+        self.room_b.amenities = ' wi-fi,ТВ,  ,Мини-бар'
+        self.room_b.save()
+        self.bits = dict(Amenity.objects.values_list('name', 'bit'))
+
+    def test_room_text_is_parsed_into_the_vocabulary(self):
+        self.assertEqual(sorted(self.bits), ['Wi-Fi', 'Балкон', 'Мини-бар', 'ТВ'])
+        self.room_b.refresh_from_db()
+        self.assertEqual(self.room_b.amenity_mask, amenities.mask_of([self.bits['Wi-Fi'], self.bits['ТВ'], self.bits['Мини-бар']]))
+
+        Room.objects.update(amenity_mask=0)
+        self.assertEqual(amenities.rebuild(), 2)
+        self.room_b.refresh_from_db()
+        self.assertEqual(self.room_b.amenity_mask, amenities.mask_of([self.bits['Wi-Fi'], self.bits['ТВ'], self.bits['Мини-бар']]))
+
+    def test_room_list_filters_by_every_selected_amenity(self):
+        def search(*names):
+            response = self.client.get(reverse('room_list'), {'amenity': [self.bits[name] for name in names]})
+            facets = {facet['name']: (facet['count'], facet['selected']) for facet in response.context['amenity_facets']}
+            return [room.pk for room in response.context['rooms']], facets
+
+        rooms, facets = search()
+        self.assertEqual(rooms, [self.room_a.pk, self.room_b.pk])
+        self.assertEqual(facets, {'Wi-Fi': (2, False), 'Балкон': (1, False), 'Мини-бар': (1, False), 'ТВ': (2, False)})
+
+        rooms, facets = search('Wi-Fi', 'Балкон')
+        self.assertEqual(rooms, [self.room_a.pk])
+        self.assertEqual(facets, {'Wi-Fi': (1, True), 'Балкон': (1, True), 'ТВ': (1, False)})
+
+        self.assertEqual(search('Балкон', 'Мини-бар')[0], [])
+
+    def test_facets_take_one_query(self):
+        amenities.vocabulary()
+        with self.assertNumQueries(1):
+            facets = amenities.facets(Room.objects.filter(room_type='double'))
+        self.assertEqual({facet['name']: facet['count'] for facet in facets}, {'Wi-Fi': 1, 'Балкон': 0, 'Мини-бар': 1, 'ТВ': 1})
+
+    def test_vocabulary_is_limited_to_the_mask_width(self):
+        Amenity.objects.bulk_create([Amenity(name=f'A{bit}', key=f'a{bit}', bit=bit) for bit in range(4, amenities.MAX_AMENITIES)])
+        self.room_a.amenities = 'Wi-Fi, Сейф'
+        with self.assertRaises(ValidationError):
+            self.room_a.full_clean()
+
+
+class FullTextSearchTests(HotelTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.admin = User.objects.create_superuser('boss', 'boss@test.kz', 'bosspassword')
+        cls.guest = User.objects.create_user(
+            'aigerim', 'aigerim.n@mail.kz', 'guestpassword', first_name='Айгерим', last_name='Нурланова',
+            phone_number='+7 (701) 555-12-34',
+        )
+        cls.room_c = Room.objects.create(
+            number='301', room_type='suite', price_per_night=45000, max_guests=4,
+            description='Просторный люкс с балконом и видом на горы.', amenities='Wi-Fi, Джакузи, Балкон',
+        )
+
+    def search_rooms(self, q):
+        # queryset.update() and raw SQL bypass the cache invalidation signals
+        search_cache.invalidate_all()
+        return [room.number for room in self.client.get(reverse('room_list'), {'q': q}).context['rooms']]
+
+    def test_public_keyword_search_ranks_matches(self):
+        Room.objects.filter(pk=self.room_a.pk).update(description='Номер без балкона, окна во двор.')
+        # Word prefixes match inflected forms; all words must match
+        self.assertEqual(self.search_rooms('балкон'), ['301', '101'])
+        self.assertEqual(self.search_rooms('балкон горы'), ['301'])
+        self.assertEqual(self.search_rooms('бассейн'), [])
+        self.assertEqual(self.search_rooms('"; DROP'), [])
+
+    def test_index_follows_every_kind_of_write(self):
+        Room.objects.filter(pk=self.room_b.pk).update(description='Тихий номер с камином')
+        self.assertEqual(self.search_rooms('камин'), ['201'])
+        Room.objects.bulk_create([Room(number='401', room_type='family', price_per_night=30000, max_guests=5, description='Камин и кухня')])
+        self.assertCountEqual(self.search_rooms('камин'), ['201', '401'])
+        Room.objects.filter(number='401').delete()
+        self.assertEqual(self.search_rooms('камин'), ['201'])
+        self.assertEqual(fulltext.verify(), [])
+
+    def test_admin_finds_guests_by_phone_fragment_and_name(self):
+        self.client.force_login(self.admin)
+        url = reverse('admin:hotel_customuser_changelist')
+        for term in ('701 555 12', '+7(701)5551234', 'нурлан', 'AIGERIM.N'):
+            with self.subTest(term):
+                response = self.client.get(url, {'q': term})
+                self.assertEqual([user.username for user in response.context['cl'].result_list], ['aigerim'])
+        # Too short for trigrams: the LIKE search answers
+        self.assertEqual(len(self.client.get(url, {'q': 'ai'}).context['cl'].result_list), 1)
+
+    def test_booking_admin_searches_guests_and_room_numbers(self):
+        booking = self.book(self.room_c, date(2030, 3, 1), date(2030, 3, 3))
+        Booking.objects.filter(pk=booking.pk).update(user=self.guest)
+        other = self.book(self.room_a, date(2030, 3, 1), date(2030, 3, 3))
+        self.client.force_login(self.admin)
+        url = reverse('admin:hotel_booking_changelist')
+        self.assertEqual(list(self.client.get(url, {'q': '555-12-34'}).context['cl'].result_list), [booking])
+        self.assertEqual(list(self.client.get(url, {'q': '101'}).context['cl'].result_list), [other])
+
+    def test_install_restores_dropped_triggers_and_rebuild_refills(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DROP TRIGGER hotel_room_fts_update')
+        Room.objects.filter(pk=self.room_b.pk).update(description='Номер с камином')
+        self.assertEqual(self.search_rooms('камином'), [])
+        self.assertEqual(fulltext.install(), [])  # the tables exist, only the trigger is re-created
+        Room.objects.filter(pk=self.room_a.pk).update(description='Тоже с камином')
+        self.assertEqual(self.search_rooms('камином'), ['101'])
+        out = StringIO()
+        call_command('rebuild_search_index', stdout=out)
+        call_command('rebuild_search_index', '--check', stdout=out)
+        self.assertCountEqual(self.search_rooms('камином'), ['101', '201'])
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM hotel_user_fts')
+        with self.assertRaises(CommandError):
+            call_command('rebuild_search_index', '--check', stdout=out)
+
+
+class SearchIndexMigrationTests(TransactionTestCase):
+    def migrate(self, target):
+        MigrationExecutor(connection).migrate([('hotel', target)])
+
+    def test_migration_backfills_and_reverse_drops_the_indexes(self):
+        latest = MigrationExecutor(connection).loader.graph.leaf_nodes('hotel')[0][1]
+        self.addCleanup(self.migrate, latest)
+        Room.objects.create(number='501', room_type='single', price_per_night=15000, max_guests=1, description='Номер с камином')
+
+        self.migrate('0015_payment_job_generation')
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT name FROM sqlite_master WHERE name LIKE '%fts%'")
+            self.assertEqual(cursor.fetchall(), [])
+        Room.objects.create(number='502', room_type='single', price_per_night=15000, max_guests=1, description='Тоже камин')
+
+        self.migrate('0016_search_indexes')
+        self.assertEqual(fulltext.verify(), [])
+        self.assertCountEqual(
+            Room.objects.filter(fulltext.matches(fulltext.ROOMS, 'камин')).values_list('number', flat=True), ['501', '502']
+        )
+
+    def test_migrate_fails_when_a_rebuilt_table_lost_its_triggers(self):
+        # Every index has its three triggers after migrate
+        self.assertEqual(fulltext.missing_triggers(), [])
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM sqlite_master WHERE type = 'trigger' AND name LIKE '%fts%'")
+            self.assertEqual(cursor.fetchone()[0], 3 * len(fulltext.INDEXES))
+            # What SQLite does to the triggers when a migration rebuilds hotel_employee
+            cursor.execute('DROP TRIGGER hotel_employee_fts_update')
+        self.addCleanup(fulltext.install)
+        with self.assertRaisesMessage(fulltext.MissingTriggers, 'hotel_employee_fts_update'):
+            call_command('migrate', verbosity=0)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_search_index', '--check', stdout=StringIO())
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(fulltext.missing_triggers(), [])
+        call_command('migrate', verbosity=0)
+
+
+class RatePlanTests(HotelTestCase):
+    # July 2030 starts on a Monday; nights of the 5th/6th are a Friday and a Saturday
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        RatePlan.objects.create(name='Выходные', start_date=date(2030, 1, 1), end_date=date(2030, 12, 31), weekdays=0b0110000, percent=20)
+        RatePlan.objects.create(name='Лето', room_type='double', start_date=date(2030, 7, 10), end_date=date(2030, 7, 20), price=30000)
+        RatePlan.objects.create(name='Неделя', start_date=date(2030, 1, 1), end_date=date(2030, 12, 31), min_nights=7, percent=Decimal('-12.5'))
+
+    def test_quote_applies_overrides_markups_and_length_of_stay(self):
+        quote = rates.quote(self.room_b, date(2030, 7, 4), date(2030, 7, 7))
+        self.assertEqual([rate for _, rate in quote.nightly], [Decimal('22000.00'), Decimal('26400.00'), Decimal('26400.00')])
+        self.assertEqual(quote.total, Decimal('74800.00'))
+        # A room's own plan beats its type's plan; the weekend markup still applies on top
+        RatePlan.objects.create(name='Акция', room=self.room_b, start_date=date(2030, 7, 11), end_date=date(2030, 7, 12), price=Decimal('25000.50'))
+        quote = rates.quote(self.room_b, date(2030, 7, 10), date(2030, 7, 14))
+        self.assertEqual([rate for _, rate in quote.nightly], [
+            Decimal('30000.00'), Decimal('25000.50'), Decimal('30001.00'), Decimal('36000.00'),  # 25000.50 * 1.2, rounded half up
+        ])
+        # Seven nights: -12.5% on every night (22000 * 0.875 = 19250; with the weekend +20%: 23650)
+        quote = rates.quote(self.room_b, date(2030, 7, 1), date(2030, 7, 8))
+        self.assertEqual(quote.total, 19250 * 5 + 23650 * 2)
+        self.assertEqual(quote.total, sum(rate for _, rate in quote.nightly))
+        self.assertEqual(rates.quote(self.room_a, date(2031, 1, 1), date(2031, 1, 3)).total, Decimal('30000.00'))
+
+    def test_booking_stores_the_quote(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('booking_create', kwargs={'room_id': self.room_b.pk}), {
+            'check_in_date': '2030-07-05', 'check_out_date': '2030-07-11', 'guests': 1,
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Booking.objects.get(room=self.room_b).total_price, Decimal('22000') * 3 + Decimal('26400') * 2 + 30000)
+
+    def test_month_grid_prices_every_room_in_two_queries(self):
+        rooms = [Room(number=f'G{n}', room_type='double', price_per_night=22000, max_guests=2, description='') for n in range(30)]
+        Room.objects.bulk_create(rooms)
+        with self.assertNumQueries(2):
+            grid = rates.month_grid(date(2030, 7, 15))
+        self.assertEqual(len(grid), Room.objects.count())
+        self.assertEqual(len(grid[self.room_a.pk]), 31)
+        # Rooms priced alike share one row
+        self.assertIs(grid[self.room_b.pk], grid[Room.objects.get(number='G7').pk])
+        for night in (date(2030, 7, 5), date(2030, 7, 12), date(2030, 7, 31)):
+            self.assertEqual(grid[self.room_b.pk][night.day - 1], rates.quote(self.room_b, night, night + timedelta(days=1)).total)
+
+    def test_availability_api_returns_rates_and_follows_plan_changes(self):
+        url = reverse('room_availability')
+        calendar = self.client.get(url, {'month': '2030-07', 'rates': '1'}).json()['calendar']
+        self.assertEqual(calendar['rates'][str(self.room_a.pk)][4:7], ['18000.00', '18000.00', '15000.00'])
+        RatePlan.objects.filter(name='Выходные').update(percent=10)
+        RatePlan.objects.get(name='Выходные').save()
+        calendar = self.client.get(url, {'month': '2030-07', 'rates': '1'}).json()['calendar']
+        self.assertEqual(calendar['rates'][str(self.room_a.pk)][5], '16500.00')
+        self.assertNotIn('rates', self.client.get(url, {'month': '2030-07'}).json()['calendar'])
+
+    def test_plans_are_validated(self):
+        plan = RatePlan(name='X', room=self.room_a, room_type='single', start_date=date(2030, 2, 1), end_date=date(2030, 1, 1),
+                        weekdays=0, price=1, percent=1)
+        with self.assertRaises(ValidationError) as raised:
+            plan.full_clean()
+        self.assertEqual(set(raised.exception.message_dict), {'price', 'room_type', 'end_date', 'weekdays'})
+        form = RatePlanForm(data={
+            'name': 'Будни', 'start_date': '2030-01-01', 'end_date': '2030-12-31', 'weekdays': ['0', '1', '2', '3', '6'],
+            'min_nights': 1, 'percent': '-5', 'priority': 0,
+        })
+        self.assertTrue(form.is_valid(), form.errors)
+        self.assertEqual(form.save().weekdays, 0b1001111)
+        self.assertEqual(RatePlanForm(instance=RatePlan.objects.get(name='Выходные')).initial['weekdays'], [4, 5])
+
+
+class GroupBookingTests(HotelTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        Room.objects.bulk_create([
+            Room(number=f'G{n:02}', room_type='double' if n % 2 else 'suite', price_per_night=20000 + n * 100, max_guests=2, description='')
+            for n in range(50)
+        ])
+        cls.group = list(Room.objects.filter(number__startswith='G').order_by('number'))
+        RatePlan.objects.create(name='Выходные', start_date=date(2030, 1, 1), end_date=date(2030, 12, 31), weekdays=0b0110000, percent=20)
+
+    def assertConsistent(self):
+        self.assertEqual(availability.verify(), [])
+        self.assertEqual(rollups.verify(), [])
+        self.assertEqual(
+            RoomNight.objects.count(),
+            sum((booking.check_out_date - booking.check_in_date).days for booking in Booking.objects.all()),
+        )
+
+    def test_fifty_rooms_cost_a_fixed_number_of_queries(self):
+        # One room already has a July row in the occupancy index: its mask is OR-ed, the others are inserted
+        self.book(self.group[0], date(2030, 7, 20), date(2030, 7, 22))
+        # rate plans, taken nights, savepoint, bookings, 2 batches of nights, occupancy read/update/insert,
+        # 2 rollup upserts, release
+        with self.assertNumQueries(12):
+            result = group_bookings.reserve_group(self.user, self.group, date(2030, 7, 1), date(2030, 7, 8), guests=2)
+        self.assertEqual(len(result.bookings), 50)
+        self.assertEqual(result.unavailable, [])
+        for booking in result.bookings:
+            self.assertEqual(booking.total_price, rates.quote(booking.room, date(2030, 7, 1), date(2030, 7, 8)).total)
+        self.assertEqual(result.total, sum(booking.total_price for booking in Booking.objects.filter(check_in_date=date(2030, 7, 1))))
+        self.assertConsistent()
+        self.assertEqual(set(availability.occupied_room_ids(date(2030, 7, 21), date(2030, 7, 22))), {self.group[0].pk})
+        self.assertEqual(set(availability.occupied_room_ids(date(2030, 7, 7), date(2030, 7, 8))), {room.pk for room in self.group})
+        # The search cache forgets the rooms it listed as free
+        self.assertFalse(self.client.get(reverse('room_list'), {'check_in': '2030-07-02', 'check_out': '2030-07-03', 'room_type': 'suite'}).context['rooms'])
+
+    def test_all_or_nothing_books_nothing_when_a_room_is_taken(self):
+        self.book(self.group[3], date(2030, 7, 5), date(2030, 7, 6))
+        with self.assertRaises(group_bookings.GroupUnavailable) as raised:
+            group_bookings.reserve_group(self.user, self.group[:10], date(2030, 7, 1), date(2030, 7, 8))
+        self.assertEqual(raised.exception.rooms, [self.group[3]])
+        self.assertEqual(Booking.objects.count(), 1)
+        # Rooms too small for the guests count as unavailable
+        with self.assertRaises(group_bookings.GroupUnavailable) as raised:
+            group_bookings.reserve_group(self.user, [self.room_a, self.group[5]], date(2030, 8, 1), date(2030, 8, 3), guests=2)
+        self.assertEqual(raised.exception.rooms, [self.room_a])
+        self.assertConsistent()
+
+    def test_best_effort_books_the_free_rooms(self):
+        self.book(self.group[3], date(2030, 7, 5), date(2030, 7, 6))
+        result = group_bookings.reserve_group(
+            self.user, self.group[:10] + [self.room_a], date(2030, 7, 1), date(2030, 7, 8), guests=2, mode=group_bookings.BEST_EFFORT,
+        )
+        self.assertEqual(len(result.bookings), 9)
+        self.assertEqual(result.unavailable, [self.group[3], self.room_a])
+        self.assertConsistent()
+        result = group_bookings.reserve_group(self.user, [self.group[3]], date(2030, 7, 1), date(2030, 7, 8), mode=group_bookings.BEST_EFFORT)
+        self.assertEqual((result.bookings, result.total), ([], Decimal('0.00')))
+
+    def test_a_lost_race_is_checked_again(self):
+        taken = self.group[2]
+        check = group_bookings.taken_room_ids
+
+        def stale_check(room_ids, check_in, check_out):
+            # Another booking claims a night right after the first check
+            found = check(room_ids, check_in, check_out)
+            if not Booking.objects.filter(room=taken).exists():
+                self.book(taken, date(2030, 7, 3), date(2030, 7, 4))
+            return found
+
+        with mock.patch.object(group_bookings, 'taken_room_ids', stale_check):
+            result = group_bookings.reserve_group(self.user, self.group[:5], date(2030, 7, 1), date(2030, 7, 8), mode=group_bookings.BEST_EFFORT)
+        self.assertEqual(result.unavailable, [taken])
+        self.assertEqual(len(result.bookings), 4)
+        self.assertConsistent()
+
+    def test_form_and_api(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('group_booking'), {
+            'check_in_date': '2030-07-01', 'check_out_date': '2030-07-03', 'rooms': 'G01, G02 G01', 'guests': 2, 'mode': 'all',
+        })
+        self.assertRedirects(response, reverse('profile'))
+        self.assertEqual(Booking.objects.filter(user=self.user).count(), 2)
+        response = self.client.post(reverse('group_booking'), {
+            'check_in_date': '2030-07-02', 'check_out_date': '2030-07-04', 'rooms': 'G02 G03 X9', 'guests': 1, 'mode': 'all',
+        })
+        self.assertIn('X9', str(response.context['form'].errors['rooms']))
+        response = self.client.post(reverse('group_booking'), {
+            'check_in_date': '2030-07-02', 'check_out_date': '2030-07-04', 'rooms': 'G02 G03', 'guests': 1, 'mode': 'all',
+        })
+        self.assertIn('G02', str(response.context['form'].non_field_errors()))
+
+        url = reverse('group_booking_api')
+        body = {'check_in': '2030-07-02', 'check_out': '2030-07-04', 'rooms': [self.group[2].pk, self.group[3].pk]}
+        response = self.client.post(url, json.dumps(body), content_type='application/json')
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()['unavailable'], [self.group[2].pk])
+        response = self.client.post(url, json.dumps({**body, 'mode': 'partial'}), content_type='application/json')
+        self.assertEqual(response.status_code, 201)
+        data = response.json()
+        self.assertEqual([booking['number'] for booking in data['bookings']], ['G03'])
+        self.assertEqual(data['unavailable'], [self.group[2].pk])
+        self.assertEqual(Decimal(data['total']), Booking.objects.get(room=self.group[3]).total_price)
+        self.assertEqual(self.client.post(url, json.dumps({**body, 'rooms': []}), content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post(url, 'nonsense', content_type='application/json').status_code, 400)
+        self.client.logout()
+        self.assertEqual(self.client.post(url, json.dumps(body), content_type='application/json').status_code, 403)
+
+
+class AllocationTests(HotelTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        super().setUpTestData()
+        cls.family = [
+            Room.objects.create(number=f'F{n}', room_type='family', price_per_night=30000, max_guests=2 if n == 3 else 4, description='F')
+            for n in range(4)
+        ]
+
+    def place(self, room, check_in, check_out, auto_assigned=True):
+        return Booking.objects.create(
+            user=self.user, room=room, check_in_date=check_in, check_out_date=check_out, guests=1,
+            total_price=room.price_per_night * (check_out - check_in).days, auto_assigned=auto_assigned,
+        )
+
+    def assertConsistent(self):
+        self.assertEqual(availability.verify(), [])
+        self.assertEqual(rollups.verify(), [])
+        for booking in Booking.objects.all():
+            self.assertEqual(
+                set(RoomNight.objects.filter(booking=booking).values_list('room_id', flat=True)), {booking.room_id}
+            )
+            self.assertEqual(RoomNight.objects.filter(booking=booking).count(), (booking.check_out_date - booking.check_in_date).days)
+
+    def test_best_fit_fills_gaps_and_avoids_orphans(self):
+        f0, f1, f2, f3 = self.family
+        self.place(f0, date(2030, 8, 1), date(2030, 8, 5))
+        self.place(f0, date(2030, 8, 8), date(2030, 8, 12))
+        self.place(f1, date(2030, 8, 1), date(2030, 8, 5))
+        # Exactly fills the three-night hole of F0
+        self.assertEqual(allocation.choose_room('family', date(2030, 8, 5), date(2030, 8, 8)), f0.pk)
+        # Two nights there would strand one night: F1 continues its stay instead
+        self.assertEqual(allocation.choose_room('family', date(2030, 8, 5), date(2030, 8, 7)), f1.pk)
+        self.assertIsNone(allocation.choose_room('family', date(2030, 8, 2), date(2030, 8, 3), guests=5))
+        self.assertNotEqual(allocation.choose_room('family', date(2030, 8, 5), date(2030, 8, 7), guests=3), f3.pk)
+
+        # The in-memory schedule decides the same way
+        schedule = allocation.Schedule([(room.pk, room.max_guests) for room in self.family], date(2030, 7, 1), date(2030, 9, 1))
+        for booking in Booking.objects.all():
+            schedule.add(booking.room_id, booking.check_in_date, booking.check_out_date)
+        for check_in, check_out, guests in [
+            (date(2030, 8, 5), date(2030, 8, 8), 1), (date(2030, 8, 5), date(2030, 8, 7), 1), (date(2030, 8, 12), date(2030, 8, 14), 3),
+            (date(2030, 7, 20), date(2030, 8, 1), 1), (date(2030, 8, 3), date(2030, 8, 4), 2),
+        ]:
+            with self.subTest(check_in=check_in, check_out=check_out):
+                self.assertEqual(
+                    schedule.best_fit(check_in, check_out, guests), allocation.choose_room('family', check_in, check_out, guests),
+                )
+        self.assertEqual(schedule.taken_nights(), 12)
+        self.assertEqual(schedule.orphan_nights(), 0)
+
+    def test_long_stays(self):
+        f0, f1, f2, f3 = self.family
+        # A night three months into the stay: its mask sits far beyond 64 bits of the stay's start
+        self.place(f0, date(2031, 4, 1), date(2031, 4, 14))
+        self.assertNotIn(f0.pk, [pk for pk, _, _ in allocation.candidates('family', date(2031, 1, 1), date(2031, 4, 15))])
+        booking = allocation.reserve_by_type(self.user, 'family', date(2031, 1, 1), date(2031, 4, 15), 1)
+        self.assertEqual(booking.room, f1)
+        with self.assertRaises(ValueError):
+            allocation.choose_room('family', date(2031, 1, 1), date(2032, 1, 3))
+
+    def test_reserve_by_type(self):
+        f0, f1, f2, f3 = self.family
+        self.place(f0, date(2030, 8, 1), date(2030, 8, 5))
+        self.place(f0, date(2030, 8, 8), date(2030, 8, 12))
+        booking = allocation.reserve_by_type(self.user, 'family', date(2030, 8, 5), date(2030, 8, 8), 3)
+        self.assertEqual(booking.room, f0)
+        self.assertTrue(booking.auto_assigned)
+        self.assertEqual(booking.total_price, rates.quote(f0, date(2030, 8, 5), date(2030, 8, 8)).total)
+        # F3 takes only two guests
+        booked = {allocation.reserve_by_type(self.user, 'family', date(2030, 8, 5), date(2030, 8, 8), 3).room for _ in range(2)}
+        self.assertEqual(booked, {f1, f2})
+        with self.assertRaises(reservations.RoomUnavailable):
+            allocation.reserve_by_type(self.user, 'family', date(2030, 8, 6), date(2030, 8, 7), 3)
+        self.assertEqual(allocation.reserve_by_type(self.user, 'family', date(2030, 8, 6), date(2030, 8, 7), 2).room, f3)
+        self.assertConsistent()
+
+    def test_repack_closes_orphan_nights(self):
+        f0, f1, f2, f3 = self.family
+        self.place(f0, date(2030, 9, 1), date(2030, 9, 3), auto_assigned=False)
+        self.place(f1, date(2030, 9, 1), date(2030, 9, 4), auto_assigned=False)
+        # Leaves the night of September 3 in F0 unsellable; in F1 it would follow on
+        stranded = self.place(f0, date(2030, 9, 4), date(2030, 9, 6))
+        plan = allocation.plan_repack('family', today=date(2030, 8, 1))
+        self.assertEqual((plan.stays, plan.orphans_before, plan.orphans_after), (1, 1, 0))
+        self.assertEqual({pk: room_id for pk, (_, room_id) in plan.moves.items()}, {stranded.pk: f1.pk})
+        # savepoint, state check, release nights, move, claim nights, occupancy read/delete/insert, room rollups, release
+        with self.assertNumQueries(10):
+            self.assertEqual(allocation.apply_repack(plan), 1)
+        stranded.refresh_from_db()
+        self.assertEqual(stranded.room, f1)
+        self.assertConsistent()
+        self.assertEqual(set(availability.occupied_room_ids(date(2030, 9, 4), date(2030, 9, 6))), {f1.pk})
+        # Nothing left to improve
+        self.assertEqual(allocation.plan_repack('family', today=date(2030, 8, 1)).moves, {})
+
+    def test_repack_leaves_pinned_stays(self):
+        f0, f1, f2, f3 = self.family
+        self.place(f0, date(2030, 9, 1), date(2030, 9, 3), auto_assigned=False)
+        self.place(f1, date(2030, 9, 1), date(2030, 9, 4), auto_assigned=False)
+        picked = self.place(f0, date(2030, 9, 4), date(2030, 9, 6), auto_assigned=False)
+        self.assertEqual(allocation.plan_repack('family', today=date(2030, 8, 1)).stays, 0)
+        picked.delete()
+        self.place(f0, date(2030, 9, 4), date(2030, 9, 6))
+        # Checked in already
+        self.assertEqual(allocation.plan_repack('family', today=date(2030, 9, 4)).moves, {})
+
+    def test_stale_plan_is_refused(self):
+        f0, f1, f2, f3 = self.family
+        self.place(f0, date(2030, 9, 1), date(2030, 9, 3), auto_assigned=False)
+        self.place(f1, date(2030, 9, 1), date(2030, 9, 4), auto_assigned=False)
+        stranded = self.place(f0, date(2030, 9, 4), date(2030, 9, 6))
+        plan = allocation.plan_repack('family', today=date(2030, 8, 1))
+        stranded.status = 'paid'
+        stranded.save()
+        with self.assertRaises(allocation.CalendarChanged):
+            allocation.apply_repack(plan)
+        self.assertEqual(Booking.objects.get(pk=stranded.pk).room, f0)
+        # repack() plans again on the current calendar
+        self.assertEqual(len(allocation.repack('family', today=date(2030, 8, 1)).moves), 1)
+        self.assertEqual(Booking.objects.get(pk=stranded.pk).room, f1)
+        self.assertConsistent()
+
+    def test_view_and_command(self):
+        f0, f1, f2, f3 = self.family
+        url = reverse('room_type_booking')
+        stay = {'check_in_date': '2030-09-04', 'check_out_date': '2030-09-06', 'room_type': 'family', 'guests': 1}
+        self.assertEqual(self.client.post(url, stay).status_code, 302)
+        self.assertFalse(Booking.objects.exists())
+        self.client.force_login(self.user)
+        self.place(f0, date(2030, 9, 1), date(2030, 9, 3), auto_assigned=False)
+        self.place(f1, date(2030, 9, 1), date(2030, 9, 4), auto_assigned=False)
+        self.place(f2, date(2030, 9, 1), date(2030, 9, 4), auto_assigned=False)
+        self.place(f3, date(2030, 9, 1), date(2030, 9, 4), auto_assigned=False)
+        response = self.client.get(url, {'check_in': '2030-09-04', 'room_type': 'family'})
+        self.assertEqual(response.context['form'].initial['room_type'], 'family')
+        response = self.client.post(url, stay)
+        booking = Booking.objects.get(auto_assigned=True)
+        self.assertRedirects(response, reverse('booking_confirm', kwargs={'pk': booking.pk}))
+        self.assertIn(booking.room, (f1, f2, f3))
+        response = self.client.post(url, {**stay, 'guests': 5})
+        self.assertTrue(response.context['form'].non_field_errors())
+
+        # A stay moved out of the way leaves F0 with a lone night the command closes
+        Booking.objects.filter(pk=booking.pk).update(room=f0)
+        RoomNight.objects.filter(booking=booking).update(room=f0)
+        availability.rebuild()
+        rollups.rebuild()
+        out = StringIO()
+        call_command('repack_rooms', '--room-type', 'family', '--dry-run', stdout=out)
+        self.assertIn('1 -> 0', out.getvalue())
+        self.assertEqual(Booking.objects.get(pk=booking.pk).room, f0)
+        call_command('repack_rooms', stdout=out)
+        self.assertNotEqual(Booking.objects.get(pk=booking.pk).room, f0)
+        self.assertConsistent()
@@ -3,7 +3,9 @@ from .views import (
     HomeView, AboutView, ContactView, 
     CustomRegisterView, CustomLoginView, CustomLogoutView, 
     ProfileView, RoomListView, RoomDetailView,
-    BookingCreateView, BookingConfirmView, PaymentMockView, PaymentSuccessView
+    BookingCreateView, BookingConfirmView, RoomTypeBookingView, GroupBookingView, GroupBookingApiView, PaymentMockView, PaymentStatusView, PaymentSuccessView,
+    RoomAvailabilityApiView, MetricsView,
+    AsyncHomeView, AsyncRoomListView, AsyncRoomDetailView,
 )
 
 urlpatterns = [
@@ -23,10 +25,26 @@ urlpatterns = [
     # Rooms (Placeholder)
     path('rooms/', RoomListView.as_view(), name='room_list'),
     path('rooms/<int:pk>/', RoomDetailView.as_view(), name='room_detail'),
+    path('rooms/availability/', RoomAvailabilityApiView.as_view(), name='room_availability'),
     
     # Booking
     path('rooms/<int:room_id>/book/', BookingCreateView.as_view(), name='booking_create'),
+    path('rooms/book/', RoomTypeBookingView.as_view(), name='room_type_booking'),
+    path('booking/group/', GroupBookingView.as_view(), name='group_booking'),
+    path('booking/group/api/', GroupBookingApiView.as_view(), name='group_booking_api'),
     path('booking/<int:pk>/confirm/', BookingConfirmView.as_view(), name='booking_confirm'),
     path('payment/<int:booking_id>/mock/', PaymentMockView.as_view(), name='payment_mock'),
+    path('payment/<int:booking_id>/status/', PaymentStatusView.as_view(), name='payment_status'),
     path('payment/<int:pk>/success/', PaymentSuccessView.as_view(), name='payment_success'),
+
+    # Monitoring
+    path('metrics/', MetricsView.as_view(), name='metrics'),
+]
+
+# Same routes for ASGI (HotelBookingSystem/asgi_urls.py), with the search pages
+# served by their native async views
+ASYNC_VIEWS = {'home': AsyncHomeView, 'room_list': AsyncRoomListView, 'room_detail': AsyncRoomDetailView}
+async_urlpatterns = [
+    path(str(pattern.pattern), ASYNC_VIEWS[pattern.name].as_view(), name=pattern.name) if pattern.name in ASYNC_VIEWS else pattern
+    for pattern in urlpatterns
 ]
@@ -1,18 +1,30 @@
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect, aget_object_or_404, get_object_or_404
 from django.urls import reverse_lazy, reverse
-from django.views.generic import CreateView, TemplateView
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden, HttpResponseNotModified, JsonResponse
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags
+from django.db.models import Q
+from django.views import View
+from django.views.generic import CreateView, FormView, TemplateView
 from django.contrib.auth.views import LoginView, LogoutView
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
-from django.db.models import Q
+import json
 from datetime import date, timedelta
-import uuid
 
-from .forms import CustomUserCreationForm, BookingForm
-from .models import Booking, Room
+from . import allocation, amenities, availability, fulltext, group_bookings, holds, payment_queue, performance, rates, reservations, search_cache
+from .forms import CustomUserCreationForm, BookingForm, GroupBookingForm, RoomTypeBookingForm
+from .models import Booking, Payment, PaymentJob, Room
+from .pagination import KeysetPaginator
+from .query_budget import query_budget
+from .routers import read_replica
 
 # --- General Views ---
+# @query_budget(n): max SQL queries per request (authenticated), enforced by QueryBudgetTests
 
+@read_replica
+@query_budget(2)
 class HomeView(TemplateView):
     template_name = 'hotel/home.html'
     
@@ -22,14 +34,17 @@ class HomeView(TemplateView):
         context['tomorrow'] = (date.today() + timedelta(days=1)).isoformat()
         return context
 
+@query_budget(2)
 class AboutView(TemplateView):
     template_name = 'hotel/about.html'
 
+@query_budget(2)
 class ContactView(TemplateView):
     template_name = 'hotel/contact.html'
 
 # --- User Authentication Views ---
 
+@query_budget(3)
 class CustomRegisterView(CreateView):
     form_class = CustomUserCreationForm
     success_url = reverse_lazy('login')
@@ -39,12 +54,14 @@ class CustomRegisterView(CreateView):
         messages.success(self.request, 'Регистрация прошла успешно! Теперь вы можете войти.')
         return super().form_valid(form)
 
+@query_budget(9)
 class CustomLoginView(LoginView):
     template_name = 'hotel/login.html'
     
     def form_valid(self, form):
         return super().form_valid(form)
 
+@query_budget(4)
 class CustomLogoutView(LogoutView):
     next_page = reverse_lazy('home')
 
@@ -54,20 +71,39 @@ class CustomLogoutView(LogoutView):
 
 # --- User Profile Views ---
 
+@read_replica
+@query_budget(3)
 class ProfileView(LoginRequiredMixin, TemplateView):
     template_name = 'hotel/profile.html'
 
+    paginate_by = 20
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['bookings'] = Booking.objects.filter(user=self.request.user).order_by('-check_in_date')
+        bookings = Booking.objects.filter(user=self.request.user).select_related('room')
+        page = KeysetPaginator(bookings, ('-check_in_date', '-id'), self.paginate_by).page(self.request.GET.get('cursor'))
+        context['bookings'] = page.object_list
+        context['page'] = page
         return context
 
 # --- Room Views ---
 
+@read_replica
+@query_budget(5)
 class RoomListView(TemplateView):
     template_name = 'hotel/room_list.html'
+    paginate_by = 12
     
     def get_context_data(self, **kwargs):
+        context, rooms, ordering, query = self.search(**kwargs)
+        cursor = self.request.GET.get('cursor')
+        page, facets = search_cache.cached_page(
+            query, lambda: (KeysetPaginator(rooms, ordering, self.paginate_by).page(cursor), amenities.facets(rooms))
+        )
+        return self.results(context, page, facets)
+
+    def search(self, **kwargs):
+        """(context, filtered rooms, ordering, search-cache query) for the GET parameters."""
         context = super().get_context_data(**kwargs)
         
         check_in = self.request.GET.get('check_in')
@@ -76,17 +112,18 @@ class RoomListView(TemplateView):
         max_guests = self.request.GET.get('max_guests')
         
         rooms = Room.objects.all()
+        check_in_date = check_out_date = None
         
         if check_in and check_out:
             try:
                 check_in_date = date.fromisoformat(check_in)
                 check_out_date = date.fromisoformat(check_out)
+                if not 0 < (check_out_date - check_in_date).days <= availability.MAX_STAY_NIGHTS:
+                    raise ValueError('stay out of range')
+                if check_out_date > availability.horizon():
+                    raise ValueError('stay beyond the horizon')
                 
-                booked_rooms_ids = Booking.objects.filter(
-                    Q(status='paid') | Q(status='pending'),
-                    check_in_date__lt=check_out_date,
-                    check_out_date__gt=check_in_date
-                ).values_list('room_id', flat=True).distinct()
+                booked_rooms_ids = availability.occupied_room_ids(check_in_date, check_out_date)
                 
                 rooms = rooms.exclude(id__in=booked_rooms_ids)
                 
@@ -95,6 +132,7 @@ class RoomListView(TemplateView):
                 context['is_filtered'] = True
                 
             except ValueError:
+                check_in_date = check_out_date = None
                 messages.error(self.request, 'Неверный формат даты.')
         
         if room_type and room_type != 'all':
@@ -106,40 +144,97 @@ class RoomListView(TemplateView):
             rooms = rooms.filter(max_guests__gte=int(max_guests))
             context['max_guests'] = max_guests
             context['is_filtered'] = True
+
+        amenity_mask = amenities.selection(self.request.GET.getlist('amenity'))
+        if amenity_mask:
+            rooms = amenities.with_all(rooms, amenity_mask)
+            context['is_filtered'] = True
+
+        # Keyword search over the rooms' FTS index, best matches first
+        keywords = ' '.join(self.request.GET.get('q', '').split())
+        ordering = ('price_per_night', 'id')
+        if keywords:
+            ranked = fulltext.search(rooms, fulltext.ROOMS, keywords)
+            if ranked is not None:
+                rooms, ordering = ranked, ('search_rank', 'id')
+            else:
+                for word in keywords.split():
+                    rooms = rooms.filter(Q(number__icontains=word) | Q(description__icontains=word) | Q(amenities__icontains=word))
+            context['q'] = keywords
+            context['is_filtered'] = True
             
-        context['rooms'] = rooms
+        # Identical searches are served from the search cache until a booking
+        # or room change invalidates the months/room types they cover. The
+        # amenity facets of the result set are cached along with the page.
+        self.amenity_mask = amenity_mask
+        query = search_cache.normalize(
+            check_in_date, check_out_date, room_type, max_guests, self.request.GET.get('cursor'), amenity_mask, keywords
+        )
+        return context, rooms, ordering, query
+
+    def results(self, context, page, facets):
+        selected = set(amenities.selected_bits(self.amenity_mask))
+        context['rooms'] = page.object_list
+        context['page'] = page
+        context['amenity_facets'] = [
+            dict(facet, selected=facet['bit'] in selected) for facet in facets if facet['count'] or facet['bit'] in selected
+        ]
         context['room_types'] = Room.ROOM_TYPES
         context['today'] = date.today().isoformat()
         context['tomorrow'] = (date.today() + timedelta(days=1)).isoformat()
         
         return context
 
+@read_replica
+@query_budget(4)
 class RoomDetailView(TemplateView):
     template_name = 'hotel/room_detail.html'
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        room = get_object_or_404(Room, pk=self.kwargs['pk'])
-        context['room'] = room
-        
         today = date.today()
         seven_days_later = today + timedelta(days=7)
         
-        is_available = not Booking.objects.filter(
-            Q(status='paid') | Q(status='pending'),
-            room=room,
-            check_in_date__lt=seven_days_later,
-            check_out_date__gt=today
-        ).exists()
+        # AsyncRoomDetailView passes room and is_available in, loaded with the async ORM
+        if 'room' not in context:
+            context['room'] = room = get_object_or_404(Room, pk=self.kwargs['pk'])
+            context['is_available'] = availability.is_room_free(room.pk, today, seven_days_later)
         
-        context['is_available'] = is_available
         context['default_check_in'] = today.isoformat()
         context['default_check_out'] = seven_days_later.isoformat()
         
         return context
 
+# Native async variants of the search pages, routed only under ASGI
+# (HotelBookingSystem/asgi_urls.py). WSGI keeps the sync views above: there an
+# async view would pay for an async_to_sync event loop hop on every request.
+
+class AsyncHomeView(HomeView):
+    async def get(self, request, *args, **kwargs):
+        return self.render_to_response(self.get_context_data(**kwargs))
+
+class AsyncRoomListView(RoomListView):
+    async def get(self, request, *args, **kwargs):
+        context, rooms, ordering, query = self.search(**kwargs)
+        cursor = request.GET.get('cursor')
+
+        async def compute():
+            page = await KeysetPaginator(rooms, ordering, self.paginate_by).apage(cursor)
+            return page, await amenities.afacets(rooms)
+
+        page, facets = await search_cache.acached_page(query, compute)
+        return self.render_to_response(self.results(context, page, facets))
+
+class AsyncRoomDetailView(RoomDetailView):
+    async def get(self, request, *args, **kwargs):
+        room = await aget_object_or_404(Room, pk=kwargs['pk'])
+        today = date.today()
+        is_available = await availability.ais_room_free(room.pk, today, today + timedelta(days=7))
+        return self.render_to_response(self.get_context_data(room=room, is_available=is_available, **kwargs))
+
 # --- Booking Views ---
 
+@query_budget(17)
 class BookingCreateView(LoginRequiredMixin, CreateView):
     model = Booking
     form_class = BookingForm
@@ -162,39 +257,103 @@ class BookingCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         room = get_object_or_404(Room, pk=self.kwargs['room_id'])
-        check_in = form.cleaned_data['check_in_date']
-        check_out = form.cleaned_data['check_out_date']
-
-        # Final availability check before saving
-        conflicting_bookings = Booking.objects.filter(
-            room=room,
-            status__in=['pending', 'paid'],
-            check_in_date__lt=check_out,
-            check_out_date__gt=check_in
-        ).exists()
-
-        if conflicting_bookings:
+
+        # The reservation engine claims every night atomically, so two concurrent
+        # requests for the same dates cannot both succeed.
+        try:
+            self.object = reservations.reserve(
+                room,
+                self.request.user,
+                form.cleaned_data['check_in_date'],
+                form.cleaned_data['check_out_date'],
+                form.cleaned_data['guests'],
+            )
+        except reservations.RoomUnavailable:
             messages.error(self.request, 'К сожалению, этот номер уже забронирован на выбранные даты.')
             return self.form_invalid(form)
 
-        form.instance.user = self.request.user
-        form.instance.room = room
-        
-        # Calculate total price
-        duration = (check_out - check_in).days
-        form.instance.total_price = room.price_per_night * duration
-        
         messages.success(self.request, 'Бронирование создано. Пожалуйста, подтвердите детали и перейдите к оплате.')
+        return redirect(self.get_success_url())
+
+@query_budget(18)
+class RoomTypeBookingView(LoginRequiredMixin, FormView):
+    """Booking by room type: the hotel picks the room that leaves the fewest gaps (hotel/allocation.py)."""
+    form_class = RoomTypeBookingForm
+    template_name = 'hotel/room_type_booking.html'
+
+    def get_initial(self):
+        initial = super().get_initial()
+        for field, parameter in (('check_in_date', 'check_in'), ('check_out_date', 'check_out'), ('room_type', 'room_type')):
+            if self.request.GET.get(parameter):
+                initial[field] = self.request.GET[parameter]
+        return initial
+
+    def form_valid(self, form):
+        try:
+            booking = allocation.reserve_by_type(
+                self.request.user,
+                form.cleaned_data['room_type'],
+                form.cleaned_data['check_in_date'],
+                form.cleaned_data['check_out_date'],
+                form.cleaned_data['guests'],
+            )
+        except reservations.RoomUnavailable:
+            form.add_error(None, 'Свободных номеров этого типа на выбранные даты нет.')
+            return self.form_invalid(form)
+
+        messages.success(
+            self.request,
+            f'Бронирование создано, ваш номер — {booking.room.number}. До заезда отель может заменить его на такой же номер.',
+        )
+        return redirect('booking_confirm', pk=booking.pk)
+
+@query_budget(16)
+class GroupBookingView(LoginRequiredMixin, FormView):
+    """Many rooms for the same dates in one request (hotel/group_bookings.py)."""
+    form_class = GroupBookingForm
+    template_name = 'hotel/group_booking.html'
+    success_url = reverse_lazy('profile')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['max_rooms'] = group_bookings.MAX_ROOMS
+        return context
+
+    def form_valid(self, form):
+        try:
+            result = group_bookings.reserve_group(
+                self.request.user,
+                form.cleaned_data['rooms'],
+                form.cleaned_data['check_in_date'],
+                form.cleaned_data['check_out_date'],
+                form.cleaned_data['guests'],
+                form.cleaned_data['mode'],
+            )
+        except group_bookings.GroupUnavailable as exc:
+            numbers = ', '.join(room.number for room in exc.rooms)
+            form.add_error(None, f'Заняты или не вмещают гостей: {numbers}. Ничего не забронировано.')
+            return self.form_invalid(form)
+
+        if result.unavailable:
+            numbers = ', '.join(room.number for room in result.unavailable)
+            messages.warning(self.request, f'Не удалось забронировать: {numbers}.')
+        if not result.bookings:
+            return self.form_invalid(form)
+        messages.success(
+            self.request,
+            f'Забронировано номеров: {len(result.bookings)} на сумму {result.total} KZT. Оплатите каждое бронирование в личном кабинете.',
+        )
         return super().form_valid(form)
 
+@query_budget(9)
 class PaymentMockView(LoginRequiredMixin, TemplateView):
     template_name = 'hotel/payment_mock.html'
 
     def post(self, request, *args, **kwargs):
-        booking = get_object_or_404(Booking, pk=self.kwargs['booking_id'], user=request.user)
+        booking = get_object_or_404(Booking.objects.select_related('room'), pk=self.kwargs['booking_id'], user=request.user)
         payment_method = request.POST.get('payment_method')
 
-        if not payment_method:
+        if payment_method not in dict(Payment.PAYMENT_METHODS):
             messages.error(request, 'Не выбран способ оплаты.')
             return redirect('booking_confirm', pk=booking.pk)
 
@@ -202,47 +361,270 @@ class PaymentMockView(LoginRequiredMixin, TemplateView):
             messages.info(request, 'Бронирование уже оплачено.')
             return redirect('profile')
 
-        # --- Payment Simulation Logic ---
-        
-        # 1. Create a unique transaction ID (mock)
-        transaction_id = f"MOCK-{payment_method.upper()}-{uuid.uuid4().hex[:10]}"
-
-        # 2. Create Payment object
-        payment = Payment.objects.create(
-            booking=booking,
-            amount=booking.total_price,
-            transaction_id=transaction_id,
-            payment_method=payment_method,
-            status='completed' # Simulate successful payment
-        )
+        if booking.status == 'cancelled':
+            messages.error(request, 'Бронирование отменено и не может быть оплачено.')
+            return redirect('profile')
 
-        # 3. Update Booking status
-        booking.status = 'paid'
-        booking.save()
+        if booking.status == 'expired':
+            messages.error(request, 'Время удержания брони истекло. Пожалуйста, забронируйте номер заново.')
+            return redirect('room_detail', pk=booking.room_id)
 
-        messages.success(request, f'Оплата через {payment.get_payment_method_display()} прошла успешно! Бронирование подтверждено.')
-        return redirect('payment_success', pk=payment.pk)
+        # The provider is called by `manage.py payment_worker`; the request only queues
+        # the job, and a repeated submit finds the same job instead of paying twice
+        job, created = payment_queue.enqueue(booking, payment_method)
+        if not created:
+            messages.info(request, 'Оплата этого бронирования уже обрабатывается.')
+        return redirect('payment_status', booking_id=booking.pk)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['booking'] = get_object_or_404(Booking, pk=self.kwargs['booking_id'], user=self.request.user)
+        context['booking'] = get_object_or_404(Booking.objects.select_related('room'), pk=self.kwargs['booking_id'], user=self.request.user)
         return context
 
+@query_budget(3)
 class PaymentSuccessView(LoginRequiredMixin, TemplateView):
     template_name = 'hotel/payment_success.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        payment = get_object_or_404(Payment, pk=self.kwargs['pk'], booking__user=self.request.user)
+        payment = get_object_or_404(Payment.objects.select_related('booking'), pk=self.kwargs['pk'], booking__user=self.request.user)
         context['payment'] = payment
         context['booking'] = payment.booking
         return context
 
+@query_budget(4)
+class PaymentStatusView(LoginRequiredMixin, TemplateView):
+    """Progress of a queued payment.
+
+    The page polls itself with ?format=json, which answers
+    {"status": "queued|processing|succeeded|failed|none", "error": ..., "redirect": url or null}.
+    A finished payment redirects straight to the success page.
+    """
+    template_name = 'hotel/payment_status.html'
+
+    def get(self, request, *args, **kwargs):
+        job = (
+            PaymentJob.objects.filter(booking__pk=self.kwargs['booking_id'], booking__user=request.user)
+            .select_related('booking__room').order_by('-pk').first()
+        )
+        if job is None:
+            get_object_or_404(Booking, pk=self.kwargs['booking_id'], user=request.user)
+        success_url = reverse('payment_success', kwargs={'pk': job.payment_id}) if job and job.payment_id else None
+
+        if request.GET.get('format') == 'json':
+            response = JsonResponse({
+                'status': job.status if job else 'none',
+                'error': job.error if job else '',
+                'redirect': success_url,
+            })
+            patch_cache_control(response, no_cache=True)
+            return response
+        if success_url and job.status == 'succeeded':
+            return redirect(success_url)
+        return self.render_to_response(self.get_context_data(job=job, booking=job.booking if job else None))
+
+@read_replica
+@query_budget(3)
 class BookingConfirmView(LoginRequiredMixin, TemplateView):
     template_name = 'hotel/booking_confirm.html'
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        booking = get_object_or_404(Booking, pk=self.kwargs['pk'], user=self.request.user)
+        booking = get_object_or_404(Booking.objects.select_related('room'), pk=self.kwargs['pk'], user=self.request.user)
         context['booking'] = booking
+        context['hold_expires_at'] = holds.expires_at(booking)
         return context
+
+# --- API Views ---
+
+@read_replica
+@query_budget(4)
+class RoomAvailabilityApiView(View):
+    """Read-only JSON availability for many rooms and date ranges in one request.
+
+    GET parameters (at least one of `range` / `month`):
+        range=YYYY-MM-DD/YYYY-MM-DD   check-in/check-out, repeatable
+        month=YYYY-MM                 occupancy calendar of every room for that month
+        room_type=double              only rooms of this type
+        rooms=1,2,3                   only these room ids
+        rates=1                       with `month`: nightly rates of every room (hotel/rates.py)
+
+    Response (compact; "calendar" masks use bit N for the night of day N+1,
+    rooms missing from "occupied" are free all month):
+        {"rooms": [[id, number, type], ...],
+         "ranges": [{"check_in": ..., "check_out": ..., "free": [id, ...]}, ...],
+         "calendar": {"month": "YYYY-MM", "days": 31, "occupied": {"id": mask},
+                      "rates": {"id": ["18000.00", ...]}}}
+
+    Whatever is asked, the answer costs two SQL queries (rooms + occupancy
+    index), three with rates. The ETag is derived from the search cache
+    versions, so a revalidation with If-None-Match is answered without
+    touching the database.
+    """
+    max_ranges = 100
+    max_nights = availability.MAX_STAY_NIGHTS
+
+    def parse(self, request):
+        ranges = []
+        for value in request.GET.getlist('range'):
+            check_in, _, check_out = value.partition('/')
+            check_in, check_out = date.fromisoformat(check_in), date.fromisoformat(check_out)
+            if not 0 < (check_out - check_in).days <= self.max_nights:
+                raise ValueError(f'Неверный диапазон дат: {value}')
+            ranges.append((check_in, check_out))
+        if len(ranges) > self.max_ranges:
+            raise ValueError(f'Слишком много диапазонов (максимум {self.max_ranges}).')
+
+        month = request.GET.get('month')
+        if month:
+            month = date.fromisoformat(f'{month}-01')
+        if not ranges and not month:
+            raise ValueError('Укажите параметр range или month.')
+        limit = availability.horizon()
+        if any(check_out > limit for _, check_out in ranges) or (month and month > limit):
+            raise ValueError(f'Даты позже {limit.isoformat()} не поддерживаются.')
+
+        room_type = request.GET.get('room_type') or None
+        if room_type == 'all':
+            room_type = None
+        room_ids = request.GET.get('rooms')
+        room_ids = tuple(sorted({int(pk) for pk in room_ids.split(',')})) if room_ids else None
+        with_rates = bool(month) and request.GET.get('rates') == '1'
+        return tuple(sorted(set(ranges))), month, room_type, room_ids, with_rates
+
+    def get(self, request, *args, **kwargs):
+        try:
+            ranges, month, room_type, room_ids, with_rates = self.parse(request)
+        except ValueError as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+
+        periods = list(ranges) + ([(month, availability.next_month(month))] if month else [])
+        span_start = min(check_in for check_in, _ in periods)
+        span_end = max(check_out for _, check_out in periods)
+        params = ('availability-api', ranges, month, room_type, room_ids, with_rates)
+        key = search_cache.versioned_key(params, span_start, span_end, room_type)
+        etag = f'"{key.rsplit(":", 1)[-1]}"'
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = HttpResponseNotModified()
+        else:
+            payload = search_cache.cached_page(params, lambda: self.build(ranges, month, room_type, room_ids, with_rates), key=key)
+            response = JsonResponse(payload, json_dumps_params={'separators': (',', ':'), 'ensure_ascii': False})
+        response['ETag'] = etag
+        patch_cache_control(response, no_cache=True)
+        return response
+
+    def build(self, ranges, month, room_type, room_ids, with_rates=False):
+        rooms = Room.objects.order_by('id')
+        if room_type:
+            rooms = rooms.filter(room_type=room_type)
+        if room_ids:
+            rooms = rooms.filter(pk__in=room_ids)
+        room_rows = list(rooms.values_list('id', 'number', 'room_type', 'price_per_night'))
+
+        months = {month} if month else set()
+        for check_in, check_out in ranges:
+            months.update(availability.stay_masks(check_in, check_out))
+        masks = availability.load_masks(months, rooms=rooms.values('id'))
+
+        payload = {'rooms': [[pk, number, kind] for pk, number, kind, _ in room_rows]}
+        if ranges:
+            payload['ranges'] = [
+                {
+                    'check_in': check_in.isoformat(),
+                    'check_out': check_out.isoformat(),
+                    'free': [pk for pk, *_ in room_rows if availability.is_free_in(masks, pk, check_in, check_out)],
+                }
+                for check_in, check_out in ranges
+            ]
+        if month:
+            occupied = {}
+            for pk, *_ in room_rows:
+                if masks.get((pk, month)):
+                    occupied[str(pk)] = masks[(pk, month)]
+            payload['calendar'] = {
+                'month': f'{month:%Y-%m}',
+                'days': (availability.next_month(month) - month).days,
+                'occupied': occupied,
+            }
+            if with_rates:
+                calendar = rates.RateCalendar(
+                    [(pk, kind, price) for pk, _, kind, price in room_rows], month, availability.next_month(month),
+                )
+                payload['calendar']['rates'] = {str(pk): row for pk, row in calendar.grid().items()}
+        return payload
+
+@query_budget(14)
+class GroupBookingApiView(LoginRequiredMixin, View):
+    """Books many rooms for the same stay in one request (hotel/group_bookings.py).
+
+    POST JSON body:
+        {"check_in": "YYYY-MM-DD", "check_out": "YYYY-MM-DD", "rooms": [id, ...],
+         "guests": 1, "mode": "all" | "partial"}
+
+    201: {"bookings": [{"id", "room", "number", "total_price"}, ...],
+          "unavailable": [room id, ...], "total": "..."}
+    409: {"error": ..., "unavailable": [room id, ...]}, nothing booked ("all" mode)
+    400 on invalid input, 403 for anonymous users.
+    """
+    raise_exception = True
+
+    def parse(self, request):
+        data = json.loads(request.body)
+        check_in, check_out = date.fromisoformat(data['check_in']), date.fromisoformat(data['check_out'])
+        if not 0 < (check_out - check_in).days <= availability.MAX_STAY_NIGHTS:
+            raise ValueError(f'Проживание должно длиться от 1 до {availability.MAX_STAY_NIGHTS} ночей.')
+        if check_out > availability.horizon():
+            raise ValueError(f'Даты позже {availability.horizon().isoformat()} не поддерживаются.')
+        room_ids = {int(pk) for pk in data['rooms']}
+        if not 0 < len(room_ids) <= group_bookings.MAX_ROOMS:
+            raise ValueError(f'Укажите от 1 до {group_bookings.MAX_ROOMS} номеров.')
+        rooms = list(Room.objects.filter(pk__in=room_ids))
+        if len(rooms) != len(room_ids):
+            raise ValueError(f'Нет номеров: {sorted(room_ids - {room.pk for room in rooms})}')
+        guests = int(data.get('guests', 1))
+        if guests < 1:
+            raise ValueError('Число гостей должно быть положительным.')
+        mode = data.get('mode', group_bookings.ALL_OR_NOTHING)
+        if mode not in group_bookings.MODES:
+            raise ValueError(f'Неизвестный режим: {mode}')
+        return rooms, check_in, check_out, guests, mode
+
+    def post(self, request, *args, **kwargs):
+        try:
+            rooms, check_in, check_out, guests, mode = self.parse(request)
+            if check_in < date.today():
+                raise ValueError('Дата заезда не может быть в прошлом.')
+            result = group_bookings.reserve_group(request.user, rooms, check_in, check_out, guests, mode)
+        except group_bookings.GroupUnavailable as exc:
+            return JsonResponse(
+                {'error': 'Часть номеров занята, ничего не забронировано.', 'unavailable': [room.pk for room in exc.rooms]},
+                status=409,
+            )
+        except (ValueError, TypeError, KeyError) as exc:
+            return JsonResponse({'error': str(exc)}, status=400)
+        return JsonResponse({
+            'bookings': [
+                {'id': booking.pk, 'room': booking.room_id, 'number': booking.room.number, 'total_price': booking.total_price}
+                for booking in result.bookings
+            ],
+            'unavailable': [room.pk for room in result.unavailable],
+            'total': result.total,
+        }, status=201)
+
+# --- Monitoring ---
+
+@query_budget(2)
+class MetricsView(View):
+    """Request timings collected by PerformanceMiddleware (hotel/performance.py).
+
+    Prometheus text format by default; ?format=log returns the rolling log of
+    the latest requests. Open to staff users and to INTERNAL_IPS.
+    """
+
+    def get(self, request, *args, **kwargs):
+        if request.META.get('REMOTE_ADDR') not in settings.INTERNAL_IPS and not request.user.is_staff:
+            return HttpResponseForbidden()
+        if request.GET.get('format') == 'log':
+            return HttpResponse('\n'.join(performance.registry.log()) + '\n', content_type='text/plain; charset=utf-8')
+        return HttpResponse(performance.registry.prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')